@@ -1,41 +1,129 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import hmac
 import json
+import logging
 import os
+import queue
 import sys
+import threading
 import time
 from pathlib import Path
-from typing import Any, Dict
+from datetime import date
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures import wait as wait_futures
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, Header, HTTPException, Path as PathParam, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
 
 REPO_ROOT = Path(__file__).resolve().parents[2]
 MODEL_DIR = REPO_ROOT / "model"
 if str(MODEL_DIR) not in sys.path:
     sys.path.insert(0, str(MODEL_DIR))
 
-from model.knowledge_system.run_forecast import run_forecast  # noqa: E402
+from model.knowledge_system.run_forecast import (  # noqa: E402
+    forecast_batch_from_artifacts,
+    run_forecast,
+)
+# Imported through MODEL_DIR (like run_forecast's own imports) so the backend
+# and the pipeline stages share one metrics registry.
+from knowledge_system import metrics  # noqa: E402
+from knowledge_system.shared_store import get_shared_store  # noqa: E402
+from knowledge_system.inference_pool import pool_from_env  # noqa: E402
+from knowledge_system.helpers import TARGET_UNITS, apply_feature_engineering  # noqa: E402
+from knowledge_system.predict_extreme import (  # noqa: E402
+    SEVERITY_RANKS,
+    current_rules,
+    integrate_events_into_forecast,
+    knowledge_system_for,
+    refresh_events,
+)
+from knowledge_system.spatial import blend_forecasts, idw_weights, station_index  # noqa: E402
+from knowledge_system.catalog import ARTIFACTS_DIR, CityCatalog, resident_artifacts  # noqa: E402
+from knowledge_system.grid import build_grid, grid_version, layer_array, render_tile  # noqa: E402
+from knowledge_system.watcher import ArtifactWatcher, input_version  # noqa: E402
+from knowledge_system.streaming import read_partial  # noqa: E402
+from knowledge_system.archive import archive_forecast, forecast_archive  # noqa: E402
+from knowledge_system.verification import load_state, report  # noqa: E402
+from knowledge_system import history as history_store  # noqa: E402
+from knowledge_system import drift  # noqa: E402
+from knowledge_system.alerts import alert_dispatcher, publish_alerts  # noqa: E402
+
+logger = logging.getLogger(__name__)
 
-ARTIFACTS_DIR = MODEL_DIR / "knowledge_system" / "artifacts"
-ARTIFACTS = {
-    "casablanca": ARTIFACTS_DIR / "casablanca",
-    "benimellal": ARTIFACTS_DIR / "benimellal",
-    "sale": ARTIFACTS_DIR / "sale",
-}
+# every artifact folder with a model is a city (see knowledge_system.catalog)
+CATALOG = CityCatalog(ARTIFACTS_DIR)
 
-CACHE_TTL_SECONDS = int(os.getenv("FORECAST_CACHE_TTL", "60"))
+RECOMPUTE_WORKERS = int(os.getenv("FORECAST_RECOMPUTE_WORKERS", "2"))
 STREAM_INTERVAL_DEFAULT = float(os.getenv("STREAM_INTERVAL_SEC", "5"))
+INFERENCE_TIMEOUT_SECONDS = float(os.getenv("INFERENCE_TIMEOUT_SEC", "30"))
+BATCH_MAX_ITEMS = int(os.getenv("FORECAST_BATCH_MAX_ITEMS", "10000"))
+BATCH_FORWARD_CHUNK = int(os.getenv("FORECAST_BATCH_FORWARD_CHUNK", "256"))
+LOCATION_MAX_DISTANCE_KM = float(os.getenv("FORECAST_MAX_DISTANCE_KM", "150"))
+LOCATION_MAX_STATIONS = int(os.getenv("FORECAST_MAX_STATIONS", "8"))
+GRID_VERSIONS_KEPT = int(os.getenv("GRID_VERSIONS_KEPT", "3"))
+HISTORY_MAX_BUCKETS = int(os.getenv("HISTORY_MAX_BUCKETS", "3660"))
+ALERT_ADMIN_TOKEN = os.getenv("ALERT_ADMIN_TOKEN", "")
+# tiles and arrays are addressed by grid version: their content never changes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
+# city -> {"version", "data"}: valid until the city's input artifacts change
 _cache: Dict[str, Dict[str, Any]] = {}
+_inference_pool = None
+_inference_pool_lock = threading.Lock()
+_inference_pool_checked = False
+_grids: "OrderedDict[str, Any]" = OrderedDict()
+_grid_lock = threading.Lock()
+# stations whose forecast the grid asked for in the background
+_grid_pending: set = set()
+_grid_pending_lock = threading.Lock()
+
+CACHE_REQUESTS = metrics.counter(
+    "forecast_cache_requests_total",
+    "Forecast cache lookups by result",
+    labelnames=("result",),
+)
+SSE_CONNECTIONS = metrics.gauge(
+    "sse_active_connections",
+    "Open /realtime streams",
+    labelnames=("city",),
+)
+REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    labelnames=("method", "route", "status"),
+)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    WATCHER.start()
+    # fold the rows appended while the server was down into the drift states
+    for city_name in CATALOG.servable():
+        _recompute_executor.submit(_update_drift, city_name)
+    dispatcher = alert_dispatcher()
+    delivery = asyncio.create_task(dispatcher.run()) if dispatcher is not None else None
+    yield
+    if delivery is not None:
+        delivery.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await delivery
+    WATCHER.stop()
+
 
 app = FastAPI(
     title="Weather Forecast & Extreme Event API",
     description="LSTM-based weather forecasting with rule-based extreme event detection",
     version="1.1.0",
+    lifespan=lifespan,
 )
 
 cors_origins_env = os.getenv("CORS_ORIGINS", "http://localhost:3000")
@@ -50,6 +138,24 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def record_request_latency(request, call_next):
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - t0,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status,
+        )
+
+
 class ForecastRequest(BaseModel):
     city_name: str
 
@@ -60,17 +166,40 @@ class ForecastResponse(BaseModel):
     events: Any
 
 
+class BatchForecastItem(BaseModel):
+    city_name: str
+    as_of_date: Optional[date] = Field(
+        None, description="Forecast as if this were the latest observed day (default: latest row)"
+    )
+
+
+class BatchForecastRequest(BaseModel):
+    items: List[BatchForecastItem] = Field(..., min_length=1, max_length=BATCH_MAX_ITEMS)
+
+
+class IngestNotification(BaseModel):
+    cities: Optional[List[str]] = Field(None, description="Cities whose files were updated (default: all)")
+
+
+class AlertSubscriptionRequest(BaseModel):
+    url: str = Field(..., pattern=r"^https?://", description="Webhook receiving POSTed alert batches")
+    cities: Optional[List[str]] = Field(None, description="Cities to alert on (default: all)")
+    categories: Optional[List[str]] = Field(None, description="Event categories to alert on (default: all)")
+    min_severity: str = Field("HIGH", description="Lowest severity to alert on: " + ", ".join(SEVERITY_RANKS))
+
+
 def _normalize_city(city_name: str) -> str:
     return city_name.strip().lower()
 
 
 def _get_artifact_path(city_name: str) -> Path:
-    if city_name not in ARTIFACTS:
+    city = CATALOG.get(city_name)
+    if city is None or not city.has_model:
         raise HTTPException(
             status_code=400,
-            detail=f"Unknown city '{city_name}'. Available: {list(ARTIFACTS.keys())}",
+            detail=f"Unknown city '{city_name}'. GET /cities lists the available cities.",
         )
-    artifact_path = ARTIFACTS[city_name]
+    artifact_path = city.path
     if not artifact_path.exists():
         raise HTTPException(
             status_code=404,
@@ -79,26 +208,247 @@ def _get_artifact_path(city_name: str) -> Path:
     return artifact_path
 
 
+def _get_inference_pool():
+    # Created on first use so importing the app never spawns processes;
+    # None when INFERENCE_WORKERS is unset/0 (in-process inference).
+    global _inference_pool, _inference_pool_checked
+    if not _inference_pool_checked:
+        with _inference_pool_lock:
+            if not _inference_pool_checked:
+                _inference_pool = pool_from_env()
+                _inference_pool_checked = True
+    return _inference_pool
+
+
+def _compute_forecast(city_name: str, artifact_path: Path) -> Dict[str, Any]:
+    pool = _get_inference_pool()
+    if pool is not None:
+        try:
+            future = pool.submit(artifact_path)
+        except queue.Full:
+            raise HTTPException(status_code=503, detail="Inference queue is full, retry shortly")
+        try:
+            return future.result(timeout=INFERENCE_TIMEOUT_SECONDS)
+        except FutureTimeout:
+            # the batch still runs, its result is dropped (inference_abandoned_total)
+            future.cancel()
+            raise HTTPException(
+                status_code=504,
+                detail=f"Forecast for {city_name} took longer than {INFERENCE_TIMEOUT_SECONDS:g}s",
+            )
+
+    with metrics.profile_if_slow(f"run_forecast:{city_name}"):
+        return run_forecast(str(artifact_path))
+
+
+def _compute_versioned(city_name: str, artifact_path: Path, version: Optional[str]) -> Dict[str, Any]:
+    data = _compute_forecast(city_name, artifact_path)
+    data = {**data, "metadata": {**data["metadata"], "input_version": version}}
+    # every distinct forecast goes to the archive, for verification
+    archive_forecast(city_name, data)
+    return data
+
+
+def _get_shared_forecast(city_name: str, artifact_path: Path, version: Optional[str]) -> Dict[str, Any]:
+    # Multi-worker mode: the snapshot in the shared store is the cache, so a
+    # forecast computed by any worker is served by all of them.
+    store = get_shared_store()
+
+    def is_fresh(snapshot: Dict[str, Any]) -> bool:
+        return snapshot["data"]["metadata"].get("input_version") == version
+
+    snapshot = store.read_snapshot(city_name)
+    if snapshot is not None and is_fresh(snapshot):
+        CACHE_REQUESTS.inc(result="hit")
+        data = refresh_events(snapshot["data"], artifact_path)
+        if data is not snapshot["data"]:
+            # rule catalog changed: share the re-evaluated events, keep the forecast's age
+            store.write_snapshot(city_name, data, ts=snapshot["ts"])
+        return data
+
+    snapshot, computed = store.refresh_snapshot(
+        city_name,
+        lambda: _compute_versioned(city_name, artifact_path, version),
+        is_fresh,
+    )
+    CACHE_REQUESTS.inc(result="miss" if computed else "hit")
+    return refresh_events(snapshot["data"], artifact_path)
+
+
 def _get_forecast(city_name: str) -> Dict[str, Any]:
-    now = time.time()
+    data = _current_forecast(city_name)
+    # a no-op unless the events differ from the ones last published for the city
+    publish_alerts(city_name, data)
+    return data
+
+
+def _cached_forecast(city_name: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    (data, fresh) of the forecast already computed for a city, without ever
+    running the model: data is None when there is none, fresh is False when
+    it was computed from older inputs.
+    """
+    artifact_path = _get_artifact_path(city_name)
+    version = input_version(artifact_path)
+    store = get_shared_store()
+    if store is not None:
+        snapshot = store.read_snapshot(city_name)
+        if snapshot is None:
+            return None, False
+        data = refresh_events(snapshot["data"], artifact_path)
+    else:
+        cached = _cache.get(city_name)
+        if not cached:
+            return None, False
+        data = cached["data"] = refresh_events(cached["data"], artifact_path)
+    return data, data["metadata"].get("input_version") == version
+
+
+def _current_forecast(city_name: str) -> Dict[str, Any]:
+    artifact_path = _get_artifact_path(city_name)
+    # a forecast is only a function of its inputs: cache it until they change
+    version = input_version(artifact_path)
+    if get_shared_store() is not None:
+        return _get_shared_forecast(city_name, artifact_path, version)
+
     cached = _cache.get(city_name)
-    if cached and now - cached["ts"] < CACHE_TTL_SECONDS:
+    if cached and cached["version"] == version:
+        CACHE_REQUESTS.inc(result="hit")
+        # a rule catalog reload only re-runs the event layer, not the model
+        cached["data"] = refresh_events(cached["data"], artifact_path)
         return cached["data"]
 
-    artifact_path = _get_artifact_path(city_name)
-    data = run_forecast(str(artifact_path))
-    _cache[city_name] = {"ts": now, "data": data}
+    CACHE_REQUESTS.inc(result="miss")
+    data = _compute_versioned(city_name, artifact_path, version)
+    _cache[city_name] = {"version": version, "data": data}
     return data
 
 
+_recompute_executor = ThreadPoolExecutor(max_workers=RECOMPUTE_WORKERS, thread_name_prefix="forecast-recompute")
+
+
+def _recompute_city(city_name: str) -> None:
+    try:
+        _get_forecast(city_name)
+    except Exception:
+        logger.exception("Recomputing the forecast of %s failed", city_name)
+
+
+def _warm_for_grid(city_name: str) -> None:
+    # no publish_alerts: a map read is not a forecast being served
+    try:
+        _current_forecast(city_name)
+    except Exception:
+        logger.exception("Computing the forecast of %s for the grid failed", city_name)
+    finally:
+        with _grid_pending_lock:
+            _grid_pending.discard(city_name)
+
+
+def _update_drift(city_name: str) -> None:
+    city = CATALOG.get(city_name)
+    if city is None or not city.has_model:
+        return
+    try:
+        drift.update_city(city_name, city.path)
+    except Exception:
+        logger.exception("Updating the input drift state of %s failed", city_name)
+
+
+def _on_inputs_changed(cities: List[str]) -> None:
+    # Recompute the cities that were being served as soon as their data lands;
+    # the others are computed on their first request. In shared mode the
+    # snapshot lock makes one worker compute while the others reuse it.
+    store = get_shared_store()
+    for city_name in cities:
+        _recompute_executor.submit(_update_drift, city_name)
+        served = city_name in _cache if store is None else store.read_snapshot(city_name) is not None
+        if served:
+            _recompute_executor.submit(_recompute_city, city_name)
+
+
+WATCHER = ArtifactWatcher(CATALOG, on_change=_on_inputs_changed)
+
+
 @app.get("/health")
 def health() -> Dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint() -> PlainTextResponse:
+    return PlainTextResponse(metrics.render_prometheus(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+
+@app.post("/ingest/notify")
+def ingest_notify(req: IngestNotification) -> Dict[str, Any]:
+    # called by the ingestion job after it rewrote weather.csv files
+    cities = None if req.cities is None else [_normalize_city(c) for c in req.cities]
+    return {"changed": WATCHER.check(cities, source="notify")}
+
+
+def _alert_subscriptions():
+    dispatcher = alert_dispatcher()
+    if dispatcher is None:
+        raise HTTPException(status_code=404, detail="Alerts are disabled (ALERT_DIR is empty).")
+    return dispatcher.subscriptions
+
+
+def _require_alert_admin(authorization: Optional[str] = Header(None)) -> None:
+    # a subscription makes the server POST to a URL of the caller's choosing
+    if not ALERT_ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=403,
+            detail="Subscription management is disabled (ALERT_ADMIN_TOKEN is not set).",
+        )
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), ALERT_ADMIN_TOKEN.encode()):
+        raise HTTPException(
+            status_code=401,
+            detail="A valid 'Authorization: Bearer <ALERT_ADMIN_TOKEN>' header is required.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+@app.post("/alerts/subscriptions", status_code=201, dependencies=[Depends(_require_alert_admin)])
+def add_alert_subscription(req: AlertSubscriptionRequest) -> Dict[str, Any]:
+    if req.min_severity not in SEVERITY_RANKS:
+        raise HTTPException(status_code=422, detail=f"min_severity must be one of {list(SEVERITY_RANKS)}.")
+    try:
+        return _alert_subscriptions().add(req.url, req.cities, req.categories, req.min_severity)
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+
+
+@app.get("/alerts/subscriptions", dependencies=[Depends(_require_alert_admin)])
+def list_alert_subscriptions() -> Dict[str, Any]:
+    return {"subscriptions": _alert_subscriptions().all()}
+
+
+@app.delete("/alerts/subscriptions/{subscription_id}", status_code=204, dependencies=[Depends(_require_alert_admin)])
+def remove_alert_subscription(subscription_id: str) -> Response:
+    if not _alert_subscriptions().remove(subscription_id):
+        raise HTTPException(status_code=404, detail=f"No subscription {subscription_id!r}.")
+    return Response(status_code=204)
+
+
 @app.get("/cities")
-def cities() -> Dict[str, list[str]]:
-    return {"cities": sorted(ARTIFACTS.keys())}
+def cities() -> Dict[str, Any]:
+    # catalog only: listing never loads a model
+    servable = CATALOG.servable()
+    resident = resident_artifacts()
+    return {
+        "cities": sorted(servable),
+        "stations": [
+            {
+                "name": city.name,
+                "latitude": city.latitude,
+                "longitude": city.longitude,
+                "resident": resident.is_resident(city.path),
+            }
+            for city in servable.values()
+        ],
+    }
 
 
 @app.post("/forecast", response_model=ForecastResponse)
@@ -108,6 +458,385 @@ def forecast(req: ForecastRequest) -> ForecastResponse:
     return ForecastResponse(**data)
 
 
+@app.get("/nowcast")
+def nowcast(city_name: str = Query(..., description="City name")) -> Dict[str, Any]:
+    # running aggregates of the current day, kept by the stream consumer
+    city = _normalize_city(city_name)
+    partial = read_partial(_get_artifact_path(city))
+    if partial is None:
+        raise HTTPException(status_code=404, detail=f"No intraday observations for '{city}' (stream consumer not running).")
+    return partial
+
+
+@app.get("/verification")
+def verification(city_name: str = Query(..., description="City name")) -> Dict[str, Any]:
+    # scores accumulated by the nightly verification job
+    city = _normalize_city(city_name)
+    _get_artifact_path(city)
+    archive = forecast_archive()
+    state = load_state(archive, city) if archive is not None else None
+    if state is None or state["verified_through"] is None:
+        raise HTTPException(status_code=404, detail=f"No verified forecasts for '{city}' yet.")
+    return report(city, state)
+
+
+@app.get("/drift")
+def input_drift(city_name: str = Query(..., description="City name")) -> Dict[str, Any]:
+    # running statistics of the appended rows vs the training scaler (also on /metrics)
+    city = _normalize_city(city_name)
+    data = drift.report(city, _get_artifact_path(city))
+    if data is None:
+        raise HTTPException(status_code=404, detail=f"No drift statistics for '{city}' yet.")
+    return data
+
+
+@app.get("/history")
+def history(
+    city_name: str = Query(..., description="City name"),
+    start: Optional[date] = Query(None, alias="from", description="First day (default: first observed day)"),
+    end: Optional[date] = Query(None, alias="to", description="Last day, inclusive (default: last observed day)"),
+    resolution: str = Query("month", pattern="^(day|week|month|year)$", description="day | week | month | year"),
+    if_none_match: Optional[str] = Header(None),
+) -> Response:
+    city = _normalize_city(city_name)
+    pyramid = history_store.history_for(_get_artifact_path(city))
+    if pyramid is None:
+        raise HTTPException(status_code=404, detail=f"No observation history for '{city}'.")
+    lo = history_store.day_number(start) if start else pyramid.first_day
+    hi = history_store.day_number(end) if end else pyramid.last_day
+    if hi < lo:
+        raise HTTPException(status_code=422, detail="'to' is before 'from'.")
+
+    # the version of the data is part of the tag: an appended day changes it
+    etag = history_store.query_etag(pyramid.version, city, lo, hi, resolution)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+
+    lo, hi = max(lo, pyramid.first_day), min(hi, pyramid.last_day)
+    if resolution == "day":
+        n_buckets = hi - lo + 1
+    else:
+        n_buckets = int(history_store.block_key(hi, resolution) - history_store.block_key(lo, resolution)) + 1
+    if n_buckets > HISTORY_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"{n_buckets} {resolution} buckets requested, at most {HISTORY_MAX_BUCKETS}: use a coarser resolution.",
+        )
+    starts, ends, aggregates = pyramid.buckets(lo, hi, resolution)
+    body = {
+        "city": city,
+        "resolution": resolution,
+        "from": history_store.day_string(lo) if len(starts) else None,
+        "to": history_store.day_string(hi) if len(starts) else None,
+        "units": {target: TARGET_UNITS.get(target) for target in history_store.TARGETS},
+        "buckets": [
+            {
+                "start": history_store.day_string(starts[i]),
+                "end": history_store.day_string(ends[i]),
+                **history_store.to_json(aggregates, i),
+            }
+            for i in range(len(starts))
+        ],
+        "summary": history_store.to_json(pyramid.summarize(lo, hi)) if len(starts) else None,
+    }
+    return Response(content=json.dumps(body), media_type="application/json", headers=headers)
+
+
+@app.get("/forecast", response_model=ForecastResponse)
+def forecast_by_location(
+    lat: float = Query(..., ge=-90, le=90, description="Latitude (degrees)"),
+    lon: float = Query(..., ge=-180, le=180, description="Longitude (degrees)"),
+    k: int = Query(
+        1,
+        ge=1,
+        le=LOCATION_MAX_STATIONS,
+        description="1: nearest station's forecast; >1: inverse-distance blend of the k nearest",
+    ),
+    max_distance_km: float = Query(
+        LOCATION_MAX_DISTANCE_KM, gt=0, description="Ignore stations farther than this"
+    ),
+) -> ForecastResponse:
+    with metrics.stage_timer("station_lookup"):
+        neighbours = [
+            (city, distance)
+            for city, distance in station_index(CATALOG).query(lat, lon, k)
+            if distance <= max_distance_km
+        ]
+    if not neighbours:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No station with a model within {max_distance_km:g} km of ({lat}, {lon}).",
+        )
+
+    weights = idw_weights([distance for _, distance in neighbours]).tolist()
+    stations = [
+        {"name": city.name, "distance_km": round(distance, 3), "weight": round(weight, 4)}
+        for (city, distance), weight in zip(neighbours, weights)
+    ]
+    location = {"lat": lat, "lon": lon, "stations": stations}
+    # the same-point rule gives all the weight to one station: serve it as is
+    used = [(city, weight) for (city, _), weight in zip(neighbours, weights) if weight > 0]
+
+    if len(used) == 1:
+        data = _get_forecast(used[0][0].name)
+        return ForecastResponse(**{**data, "metadata": {**data["metadata"], "location": location}})
+
+    results = [_get_forecast(city.name) for city, _ in used]
+    with metrics.stage_timer("blend_forecasts"):
+        forecast = blend_forecasts([r["forecast"] for r in results], [w for _, w in used])
+    # events of the blend, with the nearest station's threshold profile
+    rules = current_rules()
+    events = integrate_events_into_forecast(forecast, knowledge_system_for(used[0][0].path, rules=rules))
+    metadata = {
+        **results[0]["metadata"],
+        "generated_at": min(r["metadata"]["generated_at"] for r in results),
+        "rules_version": rules.version,
+        "location": location,
+    }
+    return ForecastResponse(metadata=metadata, forecast=forecast, events=events)
+
+
+def _current_grid():
+    """
+    (grid, pending station names) from the forecasts already computed. The
+    missing or outdated ones are computed in the background: the grid never
+    runs a model in the request, and its version changes once they land.
+    """
+    stations = station_index(CATALOG).cities
+    if not stations:
+        raise HTTPException(status_code=404, detail="No station with a model has coordinates in locations.json.")
+    located, results, pending = [], [], []
+    for city in stations:
+        data, fresh = _cached_forecast(city.name)
+        if not fresh:
+            pending.append(city.name)
+            with _grid_pending_lock:
+                queued = city.name in _grid_pending
+                _grid_pending.add(city.name)
+            if not queued:
+                _recompute_executor.submit(_warm_for_grid, city.name)
+        if data is not None:
+            located.append(city)
+            results.append(data)
+    if not results:
+        raise HTTPException(
+            status_code=503,
+            detail="No station forecast is computed yet, retry shortly.",
+            headers={"Retry-After": "5"},
+        )
+
+    version = grid_version(
+        (city.name, r["metadata"]["generated_at"], r["metadata"].get("rules_version"))
+        for city, r in zip(located, results)
+    )
+    grid = _grids.get(version)
+    if grid is not None:
+        return grid, pending
+    with _grid_lock:
+        grid = _grids.get(version)
+        if grid is None:
+            with metrics.stage_timer("grid_build"):
+                grid = build_grid(version, [(c.latitude, c.longitude) for c in located], results)
+            _grids[version] = grid
+            while len(_grids) > GRID_VERSIONS_KEPT:
+                _grids.popitem(last=False)
+    return grid, pending
+
+
+def _grid_layer(version: str, layer: str, day: int):
+    grid = _grids.get(version)
+    if grid is None:
+        # built by another worker, or expired: only the current version can be served
+        grid, _ = _current_grid()
+        if grid.version != version:
+            raise HTTPException(status_code=404, detail=f"Grid {version} is not available, GET /grid for the current one.")
+    if layer not in grid.layers:
+        raise HTTPException(status_code=404, detail=f"Unknown layer {layer!r}, one of {list(grid.layers)}.")
+    if day >= len(grid.dates):
+        raise HTTPException(status_code=404, detail=f"Day {day} is past the {len(grid.dates)}-day horizon.")
+    return grid
+
+
+def _immutable(content: bytes, media_type: str, etag: str, if_none_match: Optional[str], **headers) -> Response:
+    headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL, "ETag": etag, **headers}
+    if if_none_match == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+@app.get("/grid")
+def grid_metadata() -> Dict[str, Any]:
+    grid, pending = _current_grid()
+    return {
+        **grid.describe(),
+        "pending_stations": pending,
+        "tiles": f"/tiles/{grid.version}/{{layer}}/{{day}}/{{z}}/{{x}}/{{y}}.png",
+        "arrays": f"/grid/{grid.version}/{{layer}}/{{day}}",
+    }
+
+
+@app.get("/grid/{version}/{layer}/{day}")
+def grid_array(
+    version: str,
+    layer: str,
+    day: int = PathParam(..., ge=0),
+    if_none_match: Optional[str] = Header(None),
+) -> Response:
+    grid = _grid_layer(version, layer, day)
+    return _immutable(
+        layer_array(grid, layer, day),
+        "application/octet-stream",
+        f'"{version}-{layer}-{day}"',
+        if_none_match,
+        **{"X-Grid-Shape": f"{len(grid.lats)},{len(grid.lons)}", "X-Grid-Dtype": "float16-le"},
+    )
+
+
+@app.get("/tiles/{version}/{layer}/{day}/{z}/{x}/{y}.png")
+def grid_tile(
+    version: str,
+    layer: str,
+    day: int = PathParam(..., ge=0),
+    z: int = PathParam(..., ge=0, le=12),
+    x: int = PathParam(..., ge=0),
+    y: int = PathParam(..., ge=0),
+    if_none_match: Optional[str] = Header(None),
+) -> Response:
+    if x >= 2 ** z or y >= 2 ** z:
+        raise HTTPException(status_code=404, detail=f"No tile {z}/{x}/{y}.")
+    grid = _grid_layer(version, layer, day)
+    png = render_tile(grid, layer, day, z, x, y)
+    return _immutable(png, "image/png", f'"{version}-{layer}-{day}-{z}-{x}-{y}"', if_none_match)
+
+
+def _load_city_artifacts(artifact_path: Path) -> Dict[str, Any]:
+    return resident_artifacts().get(artifact_path)
+
+
+def _forecast_chunk(artifacts: Dict[str, Any], df_fe, chunk: List[Optional[date]]) -> List[Any]:
+    try:
+        return forecast_batch_from_artifacts(artifacts, chunk, df_fe=df_fe)
+    except ValueError:
+        # one bad window (e.g. not enough history) must not sink the rest
+        results: List[Any] = []
+        for as_of in chunk:
+            try:
+                results.append(forecast_batch_from_artifacts(artifacts, [as_of], df_fe=df_fe)[0])
+            except ValueError as e:
+                results.append(e)
+        return results
+
+
+def _pooled_results(pool, windows: Iterator[Tuple[str, Path, Optional[date]]]) -> Iterator[Tuple[str, Optional[date], Any]]:
+    # One request per window, every city at once: the dispatcher groups them
+    # back into batched forwards per city, spread over the worker processes.
+    # Results come back as they complete, with at most BATCH_FORWARD_CHUNK in
+    # flight so a large batch neither floods the queue nor buffers lines.
+    inflight: Dict[Any, Tuple[str, Optional[date], float]] = {}
+    exhausted = False
+    while True:
+        while not exhausted and len(inflight) < BATCH_FORWARD_CHUNK:
+            window = next(windows, None)
+            if window is None:
+                exhausted = True
+                break
+            city, artifact_path, as_of = window
+            try:
+                future = pool.submit(artifact_path, as_of, timeout=INFERENCE_TIMEOUT_SECONDS)
+            except queue.Full:
+                yield city, as_of, HTTPException(status_code=503, detail="Inference queue is full, retry shortly")
+                continue
+            inflight[future] = (city, as_of, time.monotonic() + INFERENCE_TIMEOUT_SECONDS)
+        if not inflight:
+            return
+
+        first_deadline = min(deadline for _, _, deadline in inflight.values())
+        done, _ = wait_futures(
+            inflight, timeout=max(0.0, first_deadline - time.monotonic()), return_when=FIRST_COMPLETED
+        )
+        for future in done:
+            city, as_of, _ = inflight.pop(future)
+            try:
+                yield city, as_of, future.result()
+            except ValueError as e:
+                yield city, as_of, e
+        now = time.monotonic()
+        for future, (city, as_of, deadline) in list(inflight.items()):
+            if deadline <= now:
+                del inflight[future]
+                future.cancel()
+                yield city, as_of, HTTPException(
+                    status_code=504, detail=f"Forecast took longer than {INFERENCE_TIMEOUT_SECONDS:g}s"
+                )
+
+
+def _batch_lines(items: List[BatchForecastItem]) -> Iterator[str]:
+    # Group request positions by city, then by as-of date so duplicate
+    # (city, date) pairs share one window.
+    by_city: Dict[str, Dict[Optional[date], List[int]]] = {}
+    for i, item in enumerate(items):
+        city = _normalize_city(item.city_name)
+        by_city.setdefault(city, {}).setdefault(item.as_of_date, []).append(i)
+
+    def lines(city: str, as_of: Optional[date], result: Any) -> Iterator[str]:
+        for index in by_city[city][as_of]:
+            record = {
+                "index": index,
+                "city_name": city,
+                "as_of_date": as_of.isoformat() if as_of else None,
+            }
+            if isinstance(result, HTTPException):
+                record.update(error=result.detail, status=result.status_code)
+            elif isinstance(result, Exception):
+                record.update(error=str(result), status=422)
+            else:
+                record.update(status=200, **result)
+            yield json.dumps(record) + "\n"
+
+    pool = _get_inference_pool()
+    servable: Dict[str, Path] = {}
+    for city, positions in by_city.items():
+        try:
+            servable[city] = _get_artifact_path(city)
+        except HTTPException as e:
+            for as_of in positions:
+                yield from lines(city, as_of, e)
+
+    if pool is not None:
+        windows = ((city, path, as_of) for city, path in servable.items() for as_of in by_city[city])
+        for city, as_of, result in _pooled_results(pool, windows):
+            yield from lines(city, as_of, result)
+        return
+
+    # in-process: one city after the other, its windows in batched forwards
+    for city, artifact_path in servable.items():
+        try:
+            artifacts = _load_city_artifacts(artifact_path)
+            df_fe = apply_feature_engineering(artifacts["df"])
+        except HTTPException as e:
+            for as_of in by_city[city]:
+                yield from lines(city, as_of, e)
+            continue
+
+        dates = list(by_city[city])
+        # Bounded chunks keep the batched forward and the buffered lines small
+        for start in range(0, len(dates), BATCH_FORWARD_CHUNK):
+            chunk = dates[start:start + BATCH_FORWARD_CHUNK]
+            for as_of, result in zip(chunk, _forecast_chunk(artifacts, df_fe, chunk)):
+                yield from lines(city, as_of, result)
+
+
+@app.post("/forecast/batch")
+def forecast_batch(req: BatchForecastRequest) -> StreamingResponse:
+    """
+    Forecasts for many (city, as_of_date) pairs, streamed back as NDJSON (one
+    line per item, with its request `index`): in completion order with the
+    inference pool, city after city in-process.
+    """
+    return StreamingResponse(_batch_lines(req.items), media_type="application/x-ndjson")
+
+
 @app.get("/realtime")
 async def realtime(
     city_name: str = Query(..., description="City name to stream"),
@@ -122,17 +851,29 @@ async def realtime(
     _get_artifact_path(city)
 
     async def event_stream():
-        while True:
-            data = _get_forecast(city)
-            current = data["forecast"][0] if data.get("forecast") else None
-            payload = {
-                "city": city,
-                "generated_at": data["metadata"]["generated_at"],
-                "current": current,
-                "events_summary": data["events"][0] if data.get("events") else None,
-            }
-            yield f"data: {json.dumps(payload)}\n\n"
-            await asyncio.sleep(interval)
+        SSE_CONNECTIONS.inc(city=city)
+        try:
+            while True:
+                # a cold city runs the model: keep it off the event loop
+                try:
+                    data = await run_in_threadpool(_get_forecast, city)
+                except HTTPException as e:
+                    # busy or slow inference: tell the client, try again next tick
+                    error = {"city": city, "status": e.status_code, "detail": e.detail}
+                    yield f"event: error\ndata: {json.dumps(error)}\n\n"
+                    await asyncio.sleep(interval)
+                    continue
+                current = data["forecast"][0] if data.get("forecast") else None
+                payload = {
+                    "city": city,
+                    "generated_at": data["metadata"]["generated_at"],
+                    "current": current,
+                    "events_summary": data["events"][0] if data.get("events") else None,
+                }
+                yield f"data: {json.dumps(payload)}\n\n"
+                await asyncio.sleep(interval)
+        finally:
+            SSE_CONNECTIONS.dec(city=city)
 
     headers = {
         "Cache-Control": "no-cache",
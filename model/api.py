@@ -1,18 +1,18 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 from typing import Dict, Any, Union
 from pathlib import Path
 from knowledge_system.run_forecast import run_forecast
+from knowledge_system.catalog import CityCatalog
+from knowledge_system import metrics
 
 BASE_DIR = Path(__file__).resolve().parent              # model/
 KNOWLEDGE_DIR = BASE_DIR / "knowledge_system"           # model/knowledge_system
 ARTIFACTS_DIR = KNOWLEDGE_DIR / "artifacts"             # model/knowledge_system/artifacts
 
-ARTIFACTS = {
-    "casablanca": ARTIFACTS_DIR / "casablanca",
-    "benimellal": ARTIFACTS_DIR / "benimellal",
-    "sale": ARTIFACTS_DIR / "sale",
-}
+# every artifact folder with a model is a city
+CATALOG = CityCatalog(ARTIFACTS_DIR)
 
 app = FastAPI(
     title="Weather Forecast & Extreme Event API",
@@ -36,17 +36,23 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(metrics.render_prometheus(), media_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+
 @app.post("/forecast", response_model=ForecastResponse)
 def forecast(req: ForecastRequest):
     city_name = req.city_name.lower()
 
-    if city_name not in ARTIFACTS:
+    city = CATALOG.get(city_name)
+    if city is None or not city.has_model:
         raise HTTPException(
             status_code=400,
-            detail=f"Unknown city '{city_name}'. Available: {list(ARTIFACTS.keys())}"
+            detail=f"Unknown city '{city_name}'. Available: {sorted(CATALOG.servable())}"
         )
 
-    artifact_path = ARTIFACTS[city_name]
+    artifact_path = city.path
 
     if not artifact_path.exists():
         raise HTTPException(
@@ -55,7 +61,8 @@ def forecast(req: ForecastRequest):
         )
 
     try:
-        result = run_forecast(str(artifact_path))
+        with metrics.profile_if_slow(f"run_forecast:{city_name}"):
+            result = run_forecast(str(artifact_path))
         response = ForecastResponse(
             metadata=result["metadata"],
             forecast=result["forecast"],
@@ -0,0 +1,140 @@
+"""
+Feature engineering of many cities: per-city pandas (helpers.apply_feature_engineering)
+vs. one stacked array (knowledge_system.features).
+
+The histories are the artifacts' weather.csv files; beyond their number,
+cities are copies of them shifted by a random offset (values) and a random
+start (up to a year later), so the stacked array has ragged starts like
+real stations. For each city count:
+    pandas          apply_feature_engineering + [feature_cols] to float32, city by city
+    stack           stack_histories: the frames into one (cities, days, 7) array
+    engine          engineer_features on that array, in feature_cols order
+Every city is first checked against the pandas result (same columns, same
+NaN positions, values equal at float32 precision).
+
+Usage (from the repo root):
+    python model/benchmarks/bench_features.py
+    python model/benchmarks/bench_features.py --cities 3 100 1000 --repeat 3
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+MODEL_DIR = BENCH_DIR.parent
+if str(MODEL_DIR) not in sys.path:
+    sys.path.insert(0, str(MODEL_DIR))
+
+import joblib  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from knowledge_system.catalog import ARTIFACTS_DIR  # noqa: E402
+from knowledge_system.features import engineer_features, stack_histories  # noqa: E402
+from knowledge_system.helpers import apply_feature_engineering, load_weather_data  # noqa: E402
+
+
+def load_cities():
+    frames, feature_cols = {}, None
+    for city_dir in sorted(p for p in ARTIFACTS_DIR.iterdir() if (p / "weather.csv").exists()):
+        frames[city_dir.name] = load_weather_data(city_dir / "weather.csv")
+        bundle = city_dir / "feature_scaler_bundle.pkl"
+        if feature_cols is None and bundle.exists():
+            feature_cols = joblib.load(bundle)["feature_cols"]
+    return frames, feature_cols
+
+
+def synthetic_cities(frames, n, seed):
+    rng = np.random.default_rng(seed)
+    names = list(frames)
+    out = {}
+    for i in range(n):
+        name = names[i % len(names)]
+        if i < len(names):
+            out[name] = frames[name]
+            continue
+        df = frames[name].iloc[int(rng.integers(0, 366)):].copy()
+        value_cols = [c for c in df.columns if c != "qc_flags"]
+        df[value_cols] = df[value_cols] + rng.normal(0, 1, len(value_cols))
+        out[f"{name}_{i}"] = df
+    return out
+
+
+def pandas_features(frames, feature_cols):
+    return {
+        name: apply_feature_engineering(df)[feature_cols].to_numpy(dtype=np.float32)
+        for name, df in frames.items()
+    }
+
+
+def check_parity(frames, feature_cols, names, dates, stacked):
+    reference = pandas_features(frames, feature_cols)
+    for c, name in enumerate(names):
+        rows = dates.get_indexer(pd.DatetimeIndex(frames[name].index).normalize())
+        got, expected = stacked[c, rows], reference[name]
+        if not np.array_equal(np.isnan(got), np.isnan(expected)):
+            raise AssertionError(f"{name}: NaN positions differ")
+        if not np.allclose(got, expected, rtol=1e-5, atol=1e-4, equal_nan=True):
+            worst = np.nanargmax(np.abs(got - expected)) % len(feature_cols)
+            raise AssertionError(f"{name}: {feature_cols[worst]} differs")
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times), statistics.median(times)
+
+
+def bench(frames, feature_cols, repeat):
+    names, dates, values = stack_histories(frames)
+    stacked = engineer_features(values, dates, feature_cols)
+    check_parity(frames, feature_cols, names, dates, stacked)
+
+    pandas_s, _ = best_of(lambda: pandas_features(frames, feature_cols), repeat)
+    stack_s, _ = best_of(lambda: stack_histories(frames), repeat)
+    engine_s, _ = best_of(lambda: engineer_features(values, dates, feature_cols), repeat)
+    return {
+        "cities": len(frames),
+        "days": len(dates),
+        "features": len(feature_cols),
+        "pandas_ms": pandas_s * 1000,
+        "stack_ms": stack_s * 1000,
+        "engine_ms": engine_s * 1000,
+        "speedup_engine": pandas_s / engine_s,
+        "speedup_with_stack": pandas_s / (stack_s + engine_s),
+        "output_mb": stacked.nbytes / 2**20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-city vs stacked feature engineering benchmark")
+    parser.add_argument("--cities", type=int, nargs="+", default=[3, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    frames, feature_cols = load_cities()
+    all_results = []
+    for n in args.cities:
+        r = bench(synthetic_cities(frames, n, args.seed), feature_cols, args.repeat)
+        all_results.append(r)
+        print(
+            f"{n:>5} cities x {r['days']} days x {r['features']} features ({r['output_mb']:.0f} MB)"
+            f" | pandas {r['pandas_ms']:8.1f} ms | stack {r['stack_ms']:7.1f} ms + engine {r['engine_ms']:7.1f} ms"
+            f" | speedup {r['speedup_engine']:5.1f}x engine, {r['speedup_with_stack']:5.1f}x with stacking"
+        )
+    print("every city matches apply_feature_engineering")
+
+    if args.output:
+        args.output.write_text(json.dumps(all_results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+"""
+Benchmark suite for the forecast request path.
+
+Times every stage of run_forecast separately (artifact loading, CSV parsing,
+feature engineering, inference, inverse scaling, JSON building, event
+detection) plus the end-to-end /forecast and /realtime handlers of the
+backend, driven in-process (test client for /forecast, a bare ASGI call for
+the first /realtime frame).
+
+Synthetic histories are generated so the suite scales along two axes:
+history length (days) and number of cities. Results are written as JSON and
+can be compared against a stored baseline with a regression threshold.
+
+Usage (from the repo root):
+    python model/benchmarks/bench_forecast.py --output bench.json
+    python model/benchmarks/bench_forecast.py --save-baseline
+    python model/benchmarks/bench_forecast.py --baseline model/benchmarks/baseline.json --threshold 0.25
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import torch
+
+BENCH_DIR = Path(__file__).resolve().parent             # model/benchmarks
+MODEL_DIR = BENCH_DIR.parent                            # model/
+REPO_ROOT = MODEL_DIR.parent
+for p in (str(MODEL_DIR), str(REPO_ROOT)):
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+# The benchmark drives the real backend on synthetic cities: it must never
+# queue alerts for the configured subscribers or archive forecasts that the
+# nightly verification would then score next to the real cities.
+os.environ["ALERT_DIR"] = ""
+os.environ["FORECAST_ARCHIVE_DIR"] = ""
+
+from knowledge_system.helpers import (  # noqa: E402
+    load_model,
+    load_weather_data,
+    apply_feature_engineering,
+    build_last_sequence,
+    inverse_scale_predictions,
+    TARGET_COLS,
+    HORIZON,
+    LOOKBACK,
+    DEVICE,
+)
+from knowledge_system.run_forecast import run_forecast, build_forecast_days  # noqa: E402
+from knowledge_system.catalog import CityCatalog, resident_artifacts  # noqa: E402
+from knowledge_system.predict_extreme import (  # noqa: E402
+    MoroccoWeatherKnowledgeSystem,
+    integrate_events_into_forecast,
+)
+
+TEMPLATE_ARTIFACT = MODEL_DIR / "knowledge_system" / "artifacts" / "casablanca"
+DEFAULT_BASELINE = BENCH_DIR / "baseline.json"
+MODEL_FILES = ["best_lstm_model.pt", "feature_scaler_bundle.pkl", "target_scalers.pkl"]
+
+
+# --------------------
+# SYNTHETIC DATA
+# --------------------
+def make_synthetic_history(n_days, seed=0, end="2025-08-24"):
+    """Seasonal daily history in the weather.csv schema (reproducible per seed)."""
+    rng = np.random.default_rng(seed)
+    idx = pd.date_range(end=end, periods=n_days, freq="D")
+    doy = idx.dayofyear.values
+
+    season = np.sin(2 * np.pi * (doy - 110) / 365.25)
+    t_mean = 18.0 + 7.0 * season + rng.normal(0, 1.5, n_days)
+    rain = np.where(rng.random(n_days) < 0.15, rng.exponential(6.0, n_days), 0.0)
+
+    return pd.DataFrame(
+        {
+            "mean_temperature": t_mean,
+            "max_temperature": t_mean + 5.0 + rng.normal(0, 1.0, n_days),
+            "min_temperature": t_mean - 5.0 + rng.normal(0, 1.0, n_days),
+            "mean_dewPoint": t_mean - 6.0 + rng.normal(0, 2.0, n_days),
+            "total_precipitation": rain,
+            "mean_windSpeed": np.abs(3.0 + rng.normal(0, 1.0, n_days)),
+            "mean_visibility": np.clip(8.0 + rng.normal(0, 1.5, n_days), 0.5, None),
+        },
+        index=idx,
+    )
+
+
+def make_synthetic_artifacts(root, n_cities, n_days):
+    """Create n_cities artifact folders that share the template model files."""
+    artifacts = {}
+    for c in range(n_cities):
+        city = f"bench_city_{c:03d}"
+        city_dir = Path(root) / city
+        city_dir.mkdir(parents=True, exist_ok=True)
+        for name in MODEL_FILES:
+            shutil.copyfile(TEMPLATE_ARTIFACT / name, city_dir / name)
+        make_synthetic_history(n_days, seed=c).to_csv(city_dir / "weather.csv")
+        artifacts[city] = city_dir
+    return artifacts
+
+
+# --------------------
+# TIMING
+# --------------------
+def time_call(fn, repeat, warmup=1):
+    """Run fn warmup + repeat times, return timing stats in milliseconds."""
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+
+    samples.sort()
+    p95_idx = min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))
+    return {
+        "median_ms": statistics.median(samples),
+        "min_ms": samples[0],
+        "p95_ms": samples[p95_idx],
+        "runs": len(samples),
+    }
+
+
+def bench_stages(artifact_path, repeat):
+    """Time each stage of run_forecast in isolation for one artifact folder."""
+    artifact_path = Path(artifact_path)
+    results = {}
+
+    results["load_scalers"] = time_call(
+        lambda: (
+            joblib.load(artifact_path / "feature_scaler_bundle.pkl"),
+            joblib.load(artifact_path / "target_scalers.pkl"),
+        ),
+        repeat,
+    )
+    feature_bundle = joblib.load(artifact_path / "feature_scaler_bundle.pkl")
+    feature_scaler = feature_bundle["scaler"]
+    feature_cols = feature_bundle["feature_cols"]
+    target_scalers = joblib.load(artifact_path / "target_scalers.pkl")
+
+    model_path = artifact_path / "best_lstm_model.pt"
+    results["load_model"] = time_call(
+        lambda: load_model(input_size=len(feature_cols), model_path=model_path),
+        repeat,
+    )
+    model = load_model(input_size=len(feature_cols), model_path=model_path)
+
+    weather_path = artifact_path / "weather.csv"
+    results["load_weather_data"] = time_call(lambda: load_weather_data(weather_path), repeat)
+    df = load_weather_data(weather_path)
+
+    results["apply_feature_engineering"] = time_call(lambda: apply_feature_engineering(df), repeat)
+    results["build_last_sequence"] = time_call(
+        lambda: build_last_sequence(df, feature_cols, feature_scaler, LOOKBACK),
+        repeat,
+    )
+    X_last = build_last_sequence(df, feature_cols, feature_scaler, LOOKBACK).to(DEVICE)
+
+    def forward():
+        with torch.no_grad():
+            return model(X_last).cpu().numpy()
+
+    results["model_forward"] = time_call(forward, repeat)
+    Y_scaled = forward()
+
+    results["inverse_scale_predictions"] = time_call(
+        lambda: inverse_scale_predictions(Y_scaled, target_scalers),
+        repeat,
+    )
+    Y_real = inverse_scale_predictions(Y_scaled, target_scalers).reshape(HORIZON, len(TARGET_COLS))
+
+    last_date = df.index.max()
+    results["build_forecast_json"] = time_call(lambda: build_forecast_days(Y_real, last_date), repeat)
+    forecast = build_forecast_days(Y_real, last_date)
+
+    # integrate_events_into_forecast mutates the days, so feed it fresh copies
+    results["integrate_events_into_forecast"] = time_call(
+        lambda: integrate_events_into_forecast(copy.deepcopy(forecast)),
+        repeat,
+    )
+    system = MoroccoWeatherKnowledgeSystem()
+    events = system.detect_extreme_events(copy.deepcopy(forecast))
+    results["generate_summary"] = time_call(lambda: system.generate_summary(events), repeat)
+
+    results["run_forecast"] = time_call(lambda: run_forecast(str(artifact_path)), repeat)
+
+    def run_forecast_cold():
+        resident_artifacts().clear()
+        return run_forecast(str(artifact_path))
+
+    results["run_forecast_cold"] = time_call(run_forecast_cold, repeat)
+    return results
+
+
+async def asgi_first_sse_event(app, path, query_string):
+    """
+    Drive an SSE endpoint at the ASGI level until its first `data:` frame,
+    then disconnect. The test client buffers whole responses, which never
+    finishes for an endless stream.
+    """
+    first_event = asyncio.Event()
+
+    async def receive():
+        await first_event.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and b"data:" in message.get("body", b""):
+            first_event.set()
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query_string.encode(),
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    task = asyncio.ensure_future(app(scope, receive, send))
+    await first_event.wait()
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+def bench_api(artifacts, repeat):
+    """Time the backend handlers end to end through an in-process client."""
+    from fastapi.testclient import TestClient
+    from backend.app import main as backend_main
+
+    saved_catalog = backend_main.CATALOG
+    # only the synthetic cities (no locations.json next to them)
+    root = Path(next(iter(artifacts.values()))).parent
+    backend_main.CATALOG = CityCatalog(root, locations_path=root / "locations.json")
+    client = TestClient(backend_main.app)
+    cities = list(artifacts)
+
+    def forecast_all(cold):
+        if cold:
+            resident_artifacts().clear()
+        for city in cities:
+            if cold:
+                backend_main._cache.pop(city, None)
+            response = client.post("/forecast", json={"city_name": city})
+            response.raise_for_status()
+
+    loop = asyncio.new_event_loop()
+
+    def realtime_first_event():
+        resident_artifacts().clear()
+        backend_main._cache.pop(cities[0], None)
+        loop.run_until_complete(
+            asgi_first_sse_event(backend_main.app, "/realtime", f"city_name={cities[0]}")
+        )
+
+    results = {}
+    try:
+        results["api_forecast_cold"] = time_call(lambda: forecast_all(cold=True), repeat)
+        results["api_forecast_warm"] = time_call(lambda: forecast_all(cold=False), repeat)
+        results["api_realtime_first_event"] = time_call(realtime_first_event, repeat)
+    finally:
+        loop.close()
+        backend_main._cache.clear()
+        resident_artifacts().clear()
+        backend_main.CATALOG = saved_catalog
+    return results
+
+
+def run_suite(history_days, city_counts, repeat, include_api=True):
+    scenarios = {}
+    with tempfile.TemporaryDirectory(prefix="forecast_bench_") as tmp:
+        for n_days in history_days:
+            for n_cities in city_counts:
+                key = f"days={n_days},cities={n_cities}"
+                root = Path(tmp) / key.replace("=", "_").replace(",", "__")
+                artifacts = make_synthetic_artifacts(root, n_cities, n_days)
+                print(f"[BENCH] {key}", flush=True)
+
+                # Per-stage costs only depend on history length, so they are
+                # measured on one city; the end-to-end path covers all cities.
+                stages = bench_stages(next(iter(artifacts.values())), repeat)
+                if include_api:
+                    stages.update(bench_api(artifacts, repeat))
+                scenarios[key] = stages
+    return scenarios
+
+
+# --------------------
+# BASELINE COMPARISON
+# --------------------
+def compare_to_baseline(current, baseline, threshold):
+    """Return a list of (scenario, stage, baseline_ms, current_ms, ratio) regressions."""
+    regressions = []
+    for scenario, stages in baseline.get("scenarios", {}).items():
+        for stage, stats in stages.items():
+            now = current["scenarios"].get(scenario, {}).get(stage)
+            if now is None:
+                continue
+            base_ms = stats["median_ms"]
+            ratio = now["median_ms"] / base_ms if base_ms > 0 else float("inf")
+            if ratio > 1.0 + threshold:
+                regressions.append((scenario, stage, base_ms, now["median_ms"], ratio))
+    return regressions
+
+
+def environment_info():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "torch": torch.__version__,
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "device": DEVICE,
+    }
+
+
+def print_table(scenarios):
+    for scenario, stages in scenarios.items():
+        print(f"\n{scenario}")
+        for stage, stats in stages.items():
+            print(
+                f"  {stage:<32} median {stats['median_ms']:9.3f} ms"
+                f" | min {stats['min_ms']:9.3f} | p95 {stats['p95_ms']:9.3f}"
+            )
+
+
+def parse_int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the forecast request path")
+    parser.add_argument("--history-days", type=parse_int_list, default=[365, 3310, 10000],
+                        help="Comma-separated synthetic history lengths (days)")
+    parser.add_argument("--cities", type=parse_int_list, default=[1, 3, 10],
+                        help="Comma-separated city counts")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per stage")
+    parser.add_argument("--no-api", action="store_true", help="Skip the end-to-end API handlers")
+    parser.add_argument("--seed", type=int, default=0, help="torch seed for reproducible runs")
+    parser.add_argument("--output", type=Path, help="Write results JSON to this path")
+    parser.add_argument("--baseline", type=Path, help="Compare against this baseline JSON")
+    parser.add_argument("--threshold", type=float, default=0.20,
+                        help="Allowed relative slowdown of the median before failing")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help=f"Store the results as the baseline ({DEFAULT_BASELINE})")
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+
+    results = {
+        "generated_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        "environment": environment_info(),
+        "config": {
+            "history_days": args.history_days,
+            "cities": args.cities,
+            "repeat": args.repeat,
+            "lookback": LOOKBACK,
+            "horizon": HORIZON,
+        },
+        "scenarios": run_suite(args.history_days, args.cities, args.repeat, include_api=not args.no_api),
+    }
+    print_table(results["scenarios"])
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"\n[OK] Results written to {args.output}")
+
+    if args.save_baseline:
+        DEFAULT_BASELINE.write_text(json.dumps(results, indent=2))
+        print(f"[OK] Baseline stored at {DEFAULT_BASELINE}")
+
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get("environment") != results["environment"]:
+            print("[WARN] Baseline was recorded in a different environment; ratios may be noisy")
+
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n[FAIL] {len(regressions)} stage(s) regressed by more than {args.threshold:.0%}:")
+            for scenario, stage, base_ms, now_ms, ratio in regressions:
+                print(f"  {scenario} {stage}: {base_ms:.3f} ms -> {now_ms:.3f} ms (x{ratio:.2f})")
+            sys.exit(1)
+        print(f"\n[OK] No stage regressed by more than {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Gridded forecast layers (knowledge_system.grid): grid build and tile render
+cost with many stations.
+
+Synthetic stations are spread over Morocco with 7-day forecasts and random
+events. For each station count:
+    build_cold   first grid: BallTree + sparse IDW weights + the product
+    build_warm   a snapshot changed: same stations, cached weights
+    tile_cold    rendering z=5..7 tiles over the country (PNG encode included)
+    tile_hit     the same tiles again, from the tile cache
+A sample of cells is checked against a dense IDW computed directly.
+
+Usage (from the repo root):
+    python model/benchmarks/bench_grid.py
+    python model/benchmarks/bench_grid.py --stations 50 500 5000
+"""
+import argparse
+import json
+import math
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+MODEL_DIR = BENCH_DIR.parent
+if str(MODEL_DIR) not in sys.path:
+    sys.path.insert(0, str(MODEL_DIR))
+
+import numpy as np  # noqa: E402
+
+from knowledge_system import grid as grid_module  # noqa: E402
+from knowledge_system.grid import BBOX, build_grid, render_tile  # noqa: E402
+from knowledge_system.spatial import EARTH_RADIUS_KM, SAME_POINT_KM  # noqa: E402
+
+VARIABLES = ("mean_temperature", "max_temperature", "min_temperature", "total_precipitation",
+             "mean_windSpeed", "mean_dewPoint", "mean_visibility")
+SEVERITIES = ("LOW", "MODERATE", "HIGH", "EXTREME")
+
+
+def make_results(n, rng):
+    coords = np.c_[rng.uniform(BBOX[0] + 0.5, BBOX[2] - 0.5, n), rng.uniform(BBOX[1] + 0.5, BBOX[3] - 0.5, n)]
+    results = []
+    for _ in range(n):
+        forecast = []
+        for i in range(7):
+            day = {"date": f"2025-08-{25 + i:02d}"}
+            day.update({v: {"value": round(float(rng.normal(20, 5)), 2), "unit": "x"} for v in VARIABLES})
+            day["events"] = [{"severity": SEVERITIES[rng.integers(4)]}] if rng.random() < 0.2 else []
+            forecast.append(day)
+        results.append({"forecast": forecast})
+    return coords, results
+
+
+def tiles_over_bbox(z):
+    """(x, y) of the Web Mercator tiles covering BBOX at zoom z."""
+    n = 2 ** z
+
+    def tile_x(lon):
+        return int((lon + 180.0) / 360.0 * n)
+
+    def tile_y(lat):
+        return int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+
+    return [(x, y) for x in range(tile_x(BBOX[1]), tile_x(BBOX[3]) + 1)
+            for y in range(tile_y(BBOX[2]), tile_y(BBOX[0]) + 1)]
+
+
+def dense_idw(coords, values, lat, lon):
+    """Direct IDW of the NEIGHBOURS nearest stations within range, or NaN."""
+    p1, l1 = np.radians(lat), np.radians(lon)
+    p2, l2 = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    a = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin((l2 - l1) / 2) ** 2
+    d = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+    order = np.argsort(d)[:grid_module.NEIGHBOURS]
+    order = order[d[order] <= grid_module.MAX_DISTANCE_KM]
+    if not len(order):
+        return np.full(values.shape[1:], np.nan)
+    w = 1.0 / np.maximum(d[order], SAME_POINT_KM) ** grid_module.IDW_POWER
+    return np.tensordot(w / w.sum(), values[order], axes=1)
+
+
+def bench(n_stations, zooms, seed):
+    rng = np.random.default_rng(seed)
+    coords, results = make_results(n_stations, rng)
+    grid_module._weights.clear()
+    grid_module._tiles.clear()
+
+    t0 = time.perf_counter()
+    grid = build_grid(f"cold-{n_stations}", coords, results)
+    build_cold = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    build_grid(f"warm-{n_stations}", coords, results)
+    build_warm = time.perf_counter() - t0
+
+    values, *_ = grid_module.station_values(results)
+    for _ in range(50):
+        iy, ix = rng.integers(len(grid.lats)), rng.integers(len(grid.lons))
+        expected = dense_idw(coords, values, grid.lats[iy], grid.lons[ix])
+        if not np.allclose(grid.values[:, :, iy, ix], expected, atol=1e-3, equal_nan=True):
+            raise AssertionError(f"grid mismatch at cell ({iy}, {ix})")
+
+    tiles = [(z, x, y) for z in zooms for x, y in tiles_over_bbox(z)]
+    cold, hit = [], []
+    for timings in (cold, hit):
+        for z, x, y in tiles:
+            t0 = time.perf_counter()
+            render_tile(grid, "max_temperature", 0, z, x, y)
+            timings.append(time.perf_counter() - t0)
+
+    return {
+        "stations": n_stations,
+        "cells": int(grid.values.shape[2] * grid.values.shape[3]),
+        "build_cold_ms": round(build_cold * 1e3, 1),
+        "build_warm_ms": round(build_warm * 1e3, 1),
+        "tiles": len(tiles),
+        "tile_cold_p50_ms": round(statistics.median(cold) * 1e3, 2),
+        "tile_hit_p50_us": round(statistics.median(hit) * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Forecast grid build and tile render benchmark")
+    parser.add_argument("--stations", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--zooms", type=int, nargs="+", default=[5, 6, 7])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    all_results = []
+    for n in args.stations:
+        r = bench(n, args.zooms, args.seed)
+        all_results.append(r)
+        print(
+            f"{n:>6} stations | {r['cells']} cells x 7 days x 8 layers"
+            f" | build cold {r['build_cold_ms']:7.1f} ms warm {r['build_warm_ms']:6.1f} ms"
+            f" | {r['tiles']} tiles: render p50 {r['tile_cold_p50_ms']:5.2f} ms, cached {r['tile_hit_p50_us']:5.1f} us"
+        )
+    print("sampled cells match a direct IDW")
+
+    if args.output:
+        args.output.write_text(json.dumps(all_results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
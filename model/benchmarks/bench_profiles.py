@@ -0,0 +1,187 @@
+"""
+Event rules: shared thresholds vs per-station profiles with climatology
+percentiles (predict_extreme.py profiles, climatology.py).
+
+Every synthetic city gets its own history (its own climate offset) and a
+set of 7-day forecasts drawn from it with warm/cold anomalies. The same
+forecasts are evaluated twice, the way run_forecast does it
+(knowledge_system_for + integrate_events_into_forecast):
+    shared    the catalog without profiles, one threshold set for everyone
+    profiles  every city mapped to a profile; two of the three profiles use
+              percentile thresholds of the city's own history
+The one-time climatology build (per city, cached until weather.csv changes)
+is reported separately from the per-forecast evaluation cost.
+
+Usage (from the repo root):
+    python model/benchmarks/bench_profiles.py
+    python model/benchmarks/bench_profiles.py --cities 1000 --years 30
+"""
+import argparse
+import copy
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+MODEL_DIR = BENCH_DIR.parent
+if str(MODEL_DIR) not in sys.path:
+    sys.path.insert(0, str(MODEL_DIR))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from knowledge_system import climatology  # noqa: E402
+from knowledge_system.predict_extreme import (  # noqa: E402
+    RULES_PATH,
+    compile_rules,
+    integrate_events_into_forecast,
+    knowledge_system_for,
+)
+
+FORECAST_COLUMNS = (
+    "mean_temperature", "max_temperature", "min_temperature", "total_precipitation",
+    "mean_windSpeed", "mean_dewPoint", "mean_visibility",
+)
+
+
+# --------------------
+# SYNTHETIC DATA
+# --------------------
+def make_city_history(n_years, seed):
+    """Daily weather.csv-like history with a city-specific climate."""
+    rng = np.random.default_rng(seed)
+    idx = pd.date_range(end="2025-08-24", periods=int(n_years * 365.25), freq="D")
+    n = len(idx)
+    season = np.sin(2 * np.pi * (idx.dayofyear.values - 110) / 365.25)
+    t_mean = rng.uniform(12, 24) + rng.uniform(5, 12) * season + rng.normal(0, 2.0, n)
+    spread = rng.uniform(4, 9)
+    return pd.DataFrame(
+        {
+            "mean_temperature": t_mean,
+            "max_temperature": t_mean + spread + rng.normal(0, 1.0, n),
+            "min_temperature": t_mean - spread + rng.normal(0, 1.0, n),
+            "mean_dewPoint": t_mean - 6.0 + rng.normal(0, 2.0, n),
+            "total_precipitation": np.where(rng.random(n) < 0.15, rng.exponential(8.0, n), 0.0),
+            "mean_windSpeed": np.abs(15.0 + rng.normal(0, 8.0, n)),
+            "mean_visibility": np.clip(8.0 + rng.normal(0, 2.5, n), 0.2, None),
+        },
+        index=idx,
+    )
+
+
+def make_forecasts(df, n_forecasts, seed):
+    """7-day windows of the history shifted by a random anomaly, in the API format."""
+    rng = np.random.default_rng(seed)
+    forecasts = []
+    for _ in range(n_forecasts):
+        start = int(rng.integers(0, len(df) - 7))
+        window = df.iloc[start:start + 7]
+        anomaly = rng.normal(0, 6.0)
+        forecast = []
+        for date, row in window.iterrows():
+            day = {"date": date.strftime("%Y-%m-%d")}
+            for column in FORECAST_COLUMNS:
+                value = row[column] + (anomaly if column.endswith("temperature") else 0.0)
+                day[column] = {"value": round(float(value), 2)}
+            forecast.append(day)
+        forecasts.append(forecast)
+    return forecasts
+
+
+def profile_catalog(catalog, cities):
+    """The catalog with its cities spread over three profiles (one left on the defaults)."""
+    catalog = copy.deepcopy(catalog)
+    inland = catalog.get("profiles", {}).get("inland", {}).get("rules", {})
+    catalog["profiles"] = {
+        "inland": {"stations": cities[0::3], "rules": inland},
+        "desert": {
+            "stations": cities[1::3],
+            "rules": {
+                "heat_wave": {"when": {"var": "t_max", ">=": {"percentile": 95}}},
+                "extreme_heat": {"when": {"all": [{"var": "t_max", ">=": 45.0},
+                                                  {"var": "t_max", ">=": {"percentile": 99}}]}},
+                "cold_wave": {"when": {"var": "t_min", "<=": {"percentile": 5}}},
+            },
+        },
+    }
+    return catalog
+
+
+# --------------------
+# BENCHMARK
+# --------------------
+def evaluate(rules, cities, histories, forecasts):
+    """Seconds per forecast of run_forecast's event layer, and the number of events."""
+    n_events = 0
+    t0 = time.perf_counter()
+    for city in cities:
+        city_dir = Path("/nonexistent") / city
+        for forecast in forecasts[city]:
+            system = knowledge_system_for(city_dir, histories[city], rules)
+            summary, _ = integrate_events_into_forecast(forecast, system)
+            n_events += summary["total_events"]
+    return (time.perf_counter() - t0) / sum(len(f) for f in forecasts.values()), n_events
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared thresholds vs per-station profiles")
+    parser.add_argument("--cities", type=int, default=300)
+    parser.add_argument("--years", type=int, default=20, help="History length per city")
+    parser.add_argument("--forecasts", type=int, default=20, help="Forecasts evaluated per city")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", type=Path, default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    catalog = json.loads(Path(RULES_PATH).read_text(encoding="utf-8"))
+    cities = [f"bench_city_{c:04d}" for c in range(args.cities)]
+    histories = {city: make_city_history(args.years, seed=c) for c, city in enumerate(cities)}
+    forecasts = {city: make_forecasts(histories[city], args.forecasts, seed=10_000 + c)
+                 for c, city in enumerate(cities)}
+
+    shared = compile_rules({k: v for k, v in catalog.items() if k != "profiles"}, version="shared")
+    profiles = compile_rules(profile_catalog(catalog, cities), version="profiles")
+
+    # one-time cost: the climatology index and percentile rows of every city
+    t0 = time.perf_counter()
+    for city in cities:
+        rules = profiles.for_station(city)
+        if rules.percentiles:
+            climatology.climatology_for(Path("/nonexistent") / city, histories[city]).rows(rules.percentiles)
+    build_s = time.perf_counter() - t0
+    n_indexed = sum(1 for city in cities if profiles.for_station(city).percentiles)
+
+    timings = {"shared": [], "profiles": []}
+    events = {}
+    for _ in range(args.repeat):
+        for name, rules in (("shared", shared), ("profiles", profiles)):
+            seconds, events[name] = evaluate(rules, cities, histories, forecasts)
+            timings[name].append(seconds)
+
+    best = {name: min(values) for name, values in timings.items()}
+    results = {
+        "cities": args.cities,
+        "years": args.years,
+        "forecasts": args.cities * args.forecasts,
+        "climatology_build_s": round(build_s, 3),
+        "climatology_build_ms_per_city": round(build_s / max(n_indexed, 1) * 1e3, 2),
+        "us_per_forecast": {name: round(value * 1e6, 1) for name, value in best.items()},
+        "us_per_forecast_median": {name: round(statistics.median(v) * 1e6, 1) for name, v in timings.items()},
+        "events": events,
+        "profiles_vs_shared": round(best["profiles"] / best["shared"], 3),
+    }
+
+    print(f"{args.cities} cities x {args.forecasts} forecasts, {args.years}y histories")
+    print(f"  climatology build : {build_s:.2f}s once ({results['climatology_build_ms_per_city']} ms/city, "
+          f"{n_indexed} cities with percentile rules)")
+    for name in ("shared", "profiles"):
+        print(f"  {name:<9} : {results['us_per_forecast'][name]:7.1f} us/forecast, {events[name]} events")
+    print(f"  profiles / shared : {results['profiles_vs_shared']:.3f}")
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Forecast by coordinates (knowledge_system.spatial): station lookup latency
+and blending cost with thousands of stations.
+
+Synthetic stations are spread over Morocco's bounding box. For each station
+count the BallTree is built once (reported separately), then random points
+are queried for the nearest and the k nearest stations; every answer is
+checked against a brute-force haversine scan. The IDW blend of k synthetic
+7-day forecasts is timed too.
+
+Usage (from the repo root):
+    python model/benchmarks/bench_spatial.py
+    python model/benchmarks/bench_spatial.py --stations 100 1000 10000 --k 4
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+MODEL_DIR = BENCH_DIR.parent
+if str(MODEL_DIR) not in sys.path:
+    sys.path.insert(0, str(MODEL_DIR))
+
+import numpy as np  # noqa: E402
+
+from knowledge_system.catalog import City  # noqa: E402
+from knowledge_system.spatial import EARTH_RADIUS_KM, StationIndex, blend_forecasts, idw_weights  # noqa: E402
+
+LAT_RANGE = (21.0, 36.0)
+LON_RANGE = (-17.0, -1.0)
+VARIABLES = ("mean_temperature", "max_temperature", "min_temperature", "total_precipitation",
+             "mean_windSpeed", "mean_dewPoint", "mean_visibility")
+
+
+def make_stations(n, seed=0):
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(*LAT_RANGE, n)
+    lons = rng.uniform(*LON_RANGE, n)
+    return {
+        f"station_{i:05d}": City(f"station_{i:05d}", Path("/nonexistent"), float(lat), float(lon), True)
+        for i, (lat, lon) in enumerate(zip(lats, lons))
+    }
+
+
+def brute_force(coords, lat, lon, k):
+    """Indices and distances (km) of the k nearest points by haversine."""
+    p1, l1 = np.radians(lat), np.radians(lon)
+    p2, l2 = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    a = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin((l2 - l1) / 2) ** 2
+    d = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+    order = np.argsort(d)[:k]
+    return order, d[order]
+
+
+def make_forecast(rng):
+    return [
+        {"date": f"2025-08-{25 + i:02d}", **{v: {"value": float(rng.normal(20, 5)), "unit": "x"} for v in VARIABLES}}
+        for i in range(7)
+    ]
+
+
+def percentiles_us(samples):
+    samples = sorted(samples)
+    return {
+        "p50_us": round(statistics.median(samples) * 1e6, 1),
+        "p99_us": round(samples[int(0.99 * (len(samples) - 1))] * 1e6, 1),
+    }
+
+
+def bench(n_stations, n_queries, k, seed):
+    cities = make_stations(n_stations, seed)
+    t0 = time.perf_counter()
+    index = StationIndex(cities)
+    build_s = time.perf_counter() - t0
+
+    coords = np.array([[c.latitude, c.longitude] for c in index.cities])
+    rng = np.random.default_rng(seed + 1)
+    points = np.c_[rng.uniform(*LAT_RANGE, n_queries), rng.uniform(*LON_RANGE, n_queries)].tolist()
+
+    results = {"stations": n_stations, "build_ms": round(build_s * 1e3, 2)}
+    for label, kk in (("nearest", 1), (f"k{k}", k)):
+        timings = []
+        for lat, lon in points:
+            t0 = time.perf_counter()
+            found = index.query(lat, lon, kk)
+            timings.append(time.perf_counter() - t0)
+
+            order, distances = brute_force(coords, lat, lon, kk)
+            if [index.cities[i].name for i in order] != [c.name for c, _ in found] or \
+                    not np.allclose(distances, [d for _, d in found], atol=1e-6):
+                raise AssertionError(f"lookup mismatch at ({lat}, {lon})")
+        results[label] = percentiles_us(timings)
+
+    forecasts = [make_forecast(rng) for _ in range(k)]
+    weights = idw_weights(np.sort(rng.uniform(1, 50, k)))
+    timings = []
+    for _ in range(n_queries):
+        t0 = time.perf_counter()
+        blend_forecasts(forecasts, weights)
+        timings.append(time.perf_counter() - t0)
+    results[f"blend_k{k}"] = percentiles_us(timings)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Station lookup and IDW blending benchmark")
+    parser.add_argument("--stations", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    all_results = []
+    for n in args.stations:
+        r = bench(n, args.queries, args.k, args.seed)
+        all_results.append(r)
+        print(
+            f"{n:>6} stations | build {r['build_ms']:7.2f} ms"
+            f" | nearest p50 {r['nearest']['p50_us']:6.1f} us p99 {r['nearest']['p99_us']:6.1f} us"
+            f" | k={args.k} p50 {r[f'k{args.k}']['p50_us']:6.1f} us"
+            f" | blend p50 {r[f'blend_k{args.k}']['p50_us']:6.1f} us"
+        )
+    print("all lookups match the brute-force haversine scan")
+
+    if args.output:
+        args.output.write_text(json.dumps(all_results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Window building: notebook loop vs. strided views (knowledge_system.windows).
+
+Both builders start from the same feature-engineered GSOD history (the
+training pipeline's load_gsod_history + apply_feature_engineering) and
+produce scaled X (N, lookback, F) / Y (N, horizon * T) training samples.
+Reports build time, tracemalloc peak and the time of one full pass over
+the samples in batches, and checks that both give identical windows.
+
+--tile N repeats the history N times (dates shifted) to see how both
+approaches scale with longer records.
+
+Usage (from the repo root):
+    python model/benchmarks/bench_windows.py
+    python model/benchmarks/bench_windows.py --city casablanca --tile 20
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+MODEL_DIR = BENCH_DIR.parent
+for p in (str(MODEL_DIR), str(MODEL_DIR / "building_model")):
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from sklearn.preprocessing import StandardScaler  # noqa: E402
+
+from knowledge_system.helpers import apply_feature_engineering, TARGET_COLS, LOOKBACK, HORIZON  # noqa: E402
+from knowledge_system.windows import (  # noqa: E402
+    WindowDataset,
+    batch_loader,
+    fit_feature_scaler,
+    fit_target_scalers,
+    target_affine,
+)
+from train_pipeline import CITY_DATASETS, DATASETS_DIR, FEATURE_COLS, BATCH_SIZE, load_gsod_history  # noqa: E402
+
+
+# --------------------
+# Notebook reference (prepare_data.ipynb)
+# --------------------
+def build_sequences_multi_target(df, feature_cols, target_cols, lookback, horizon):
+    X, Y = [], []
+    for i in range(lookback, len(df) - horizon):
+        X.append(df[feature_cols].iloc[i - lookback:i].values)
+        Y.append(df[target_cols].iloc[i:i + horizon].values.flatten())
+    return np.array(X), np.array(Y)
+
+
+def loop_build(df):
+    X, Y = build_sequences_multi_target(df, FEATURE_COLS, TARGET_COLS, LOOKBACK, HORIZON)
+    n, t, f = X.shape
+    feature_scaler = StandardScaler().fit(X.reshape(-1, f))
+    X = feature_scaler.transform(X.reshape(-1, f)).reshape(n, t, f)
+    target_scalers = {}
+    for i, var in enumerate(TARGET_COLS):
+        cols = slice(i * HORIZON, (i + 1) * HORIZON)
+        target_scalers[var] = StandardScaler().fit(Y[:, cols])
+        Y[:, cols] = target_scalers[var].transform(Y[:, cols])
+    return X.astype(np.float32), Y.astype(np.float32)
+
+
+def strided_build(df):
+    features = df[FEATURE_COLS].to_numpy(np.float64)
+    targets = df[TARGET_COLS].to_numpy(np.float64)
+    feature_scaler = fit_feature_scaler(features, LOOKBACK, HORIZON)
+    target_scalers = fit_target_scalers(targets, TARGET_COLS, LOOKBACK, HORIZON)
+    mean, scale = target_affine(target_scalers, TARGET_COLS)
+    return WindowDataset(feature_scaler.transform(features), targets, LOOKBACK, HORIZON, mean, scale)
+
+
+# --------------------
+# Measurement
+# --------------------
+def measure(fn, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def epoch_pass(batches):
+    t0 = time.perf_counter()
+    n = 0
+    for X, _ in batches:
+        n += len(X)
+    return time.perf_counter() - t0, n
+
+
+def tiled_history(df, tile):
+    if tile <= 1:
+        return df
+    span = df.index[-1] - df.index[0] + pd.Timedelta(days=1)
+    parts = []
+    for k in range(tile):
+        part = df.copy()
+        part.index = part.index + k * span
+        parts.append(part)
+    return pd.concat(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark training window builders")
+    parser.add_argument("--city", choices=sorted(CITY_DATASETS), default="casablanca")
+    parser.add_argument("--tile", type=int, default=1, help="repeat the history N times")
+    parser.add_argument("--no-loop", action="store_true", help="skip the (slow) notebook loop")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    df = tiled_history(load_gsod_history(DATASETS_DIR / CITY_DATASETS[args.city]), args.tile)
+    df_fe = apply_feature_engineering(df).dropna()
+    print(f"{args.city}: {len(df_fe)} rows x {len(FEATURE_COLS)} features (tile {args.tile})")
+
+    results = {"rows": len(df_fe), "tile": args.tile, "city": args.city}
+
+    dataset, elapsed, peak = measure(strided_build, df_fe)
+    pass_s, n = epoch_pass(batch_loader(dataset, BATCH_SIZE, shuffle=True))
+    results["strided"] = {"build_s": elapsed, "peak_mb": peak / 2**20, "epoch_pass_s": pass_s, "windows": n}
+
+    if not args.no_loop:
+        (X, Y), elapsed, peak = measure(loop_build, df_fe)
+        order = np.random.permutation(len(X))
+        pass_s, _ = epoch_pass(
+            (X[order[i:i + BATCH_SIZE]], Y[order[i:i + BATCH_SIZE]]) for i in range(0, len(X), BATCH_SIZE)
+        )
+        results["loop"] = {"build_s": elapsed, "peak_mb": peak / 2**20, "epoch_pass_s": pass_s, "windows": len(X)}
+
+        Xs, Ys = dataset.materialize()
+        results["max_abs_diff"] = {
+            "X": float(np.abs(Xs.numpy() - X).max()),
+            "Y": float(np.abs(Ys.numpy() - Y).max()),
+        }
+
+    for mode in ("loop", "strided"):
+        if mode in results:
+            r = results[mode]
+            print(
+                f"{mode:<8} build {r['build_s'] * 1000:9.1f} ms | peak {r['peak_mb']:8.1f} MiB"
+                f" | epoch pass {r['epoch_pass_s'] * 1000:8.1f} ms | windows {r['windows']}"
+            )
+    if "max_abs_diff" in results:
+        print(f"max |diff|: X {results['max_abs_diff']['X']:.2e} | Y {results['max_abs_diff']['Y']:.2e}")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Load test: in-process run_forecast vs. the out-of-process InferencePool.
+
+Client threads (standing in for web-worker request threads) issue forecast
+requests for a set of cities as fast as they can. Each request spreads its
+as-of date over the last days of history so requests for the same city are
+not trivially identical. Reports throughput and latency percentiles per mode.
+
+Usage (from the repo root):
+    python model/benchmarks/load_test_inference.py --clients 16 --requests 400 --workers 2
+"""
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+MODEL_DIR = BENCH_DIR.parent
+for p in (str(MODEL_DIR), str(BENCH_DIR)):
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+import pandas as pd  # noqa: E402
+
+from bench_forecast import make_synthetic_artifacts  # noqa: E402
+from knowledge_system.inference_pool import InferencePool  # noqa: E402
+from knowledge_system.run_forecast import forecast_batch_from_artifacts  # noqa: E402
+from knowledge_system.catalog import resident_artifacts  # noqa: E402
+
+
+def percentile(sorted_values, q):
+    idx = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def run_load(call, jobs, clients):
+    """Run jobs [(artifact_path, as_of)] across `clients` threads."""
+    latencies = []
+    lock = threading.Lock()
+    cursor = iter(range(len(jobs)))
+    errors = []
+
+    def client():
+        while True:
+            with lock:
+                i = next(cursor, None)
+            if i is None:
+                return
+            t0 = time.perf_counter()
+            try:
+                call(*jobs[i])
+            except Exception as e:  # keep going, report at the end
+                errors.append(repr(e))
+                continue
+            elapsed = time.perf_counter() - t0
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+
+    latencies.sort()
+    ms = [v * 1000.0 for v in latencies]
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "wall_s": wall,
+        "throughput_rps": len(latencies) / wall if wall > 0 else 0.0,
+        "p50_ms": percentile(ms, 0.50) if ms else None,
+        "p95_ms": percentile(ms, 0.95) if ms else None,
+        "p99_ms": percentile(ms, 0.99) if ms else None,
+        "mean_ms": statistics.fmean(ms) if ms else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare in-process and pooled inference under load")
+    parser.add_argument("--cities", type=int, default=3)
+    parser.add_argument("--history-days", type=int, default=3310)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--batch-window-ms", type=float, default=5.0)
+    parser.add_argument("--queue-size", type=int, default=1024)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="inference_load_") as tmp:
+        artifacts = make_synthetic_artifacts(tmp, args.cities, args.history_days)
+        paths = [str(p) for p in artifacts.values()]
+        last_day = pd.Timestamp("2025-08-24")
+        jobs = [
+            (paths[i % len(paths)], (last_day - pd.Timedelta(days=i % 30)).strftime("%Y-%m-%d"))
+            for i in range(args.requests)
+        ]
+
+        # In-process: what the web worker does without a pool (resident
+        # artifacts, one forward per request under the worker's GIL)
+        def in_process(path, as_of):
+            return forecast_batch_from_artifacts(resident_artifacts().get(path), [as_of])[0]
+
+        results = {"in_process": run_load(in_process, jobs, args.clients)}
+
+        pool = InferencePool(
+            max_workers=args.workers,
+            queue_size=args.queue_size,
+            batch_window_ms=args.batch_window_ms,
+        )
+        try:
+            # warm the workers so process start-up is not counted
+            for path in paths:
+                pool.submit(path).result()
+
+            def pooled(path, as_of):
+                return pool.submit(path, as_of).result(timeout=60)
+
+            results["pool"] = run_load(pooled, jobs, args.clients)
+        finally:
+            pool.shutdown()
+
+    results["config"] = vars(args) | {"output": str(args.output) if args.output else None}
+    for mode in ("in_process", "pool"):
+        r = results[mode]
+        print(
+            f"{mode:<11} {r['throughput_rps']:8.1f} req/s | p50 {r['p50_ms']:8.2f} ms"
+            f" | p95 {r['p95_ms']:8.2f} ms | p99 {r['p99_ms']:8.2f} ms | errors {r['errors']}"
+        )
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
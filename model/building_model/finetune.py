@@ -0,0 +1,294 @@
+"""
+Warm-start fine-tuning of a city's live WeatherLSTM on its latest weather.csv.
+
+Instead of retraining from scratch (train_pipeline.py), this job:
+    1. loads the live weights, feature scaler bundle and target scalers
+       (scalers are kept as they are, so inputs/outputs stay comparable),
+    2. builds windows from artifacts/<city>/weather.csv, which the daily
+       ingestion keeps appending to,
+    3. holds out the most recent HOLDOUT_DAYS windows,
+    4. trains for a bounded number of steps on the RECENT_DAYS windows before
+       the holdout, mixed with a replay sample of older windows so the model
+       does not forget the rest of the climatology,
+    5. promotes the new weights only if the holdout MAE (scaled units,
+       averaged over all targets and lead days) does not get worse.
+
+Each promotion becomes a new version under versions/<version>/ with
+kind "finetune" and its parent version, and is recorded in manifest.json
+(see knowledge_system.manifest). A run costs a few seconds of CPU per city.
+
+Usage (from the repo root):
+    python model/building_model/finetune.py                       # all cities
+    python model/building_model/finetune.py --cities casablanca --steps 300
+    python model/building_model/finetune.py --dry-run
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import torch
+import torch.nn as nn
+
+from train_pipeline import (
+    ARTIFACTS_DIR,
+    BATCH_SIZE,
+    MODEL_DIR,
+    real_scale_mae,
+)
+from knowledge_system.helpers import (
+    apply_feature_engineering,
+    load_model,
+    load_weather_data,
+    read_model_config,
+    DEVICE,
+    TARGET_COLS,
+    HORIZON,
+)
+from knowledge_system.windows import WindowDataset, complete_windows, n_windows, target_affine
+from knowledge_system.manifest import (
+    MODEL_FILES,
+    new_version,
+    promote_version,
+    read_manifest,
+    sha256_file,
+    utc_now,
+    version_dir,
+    write_json_atomic,
+)
+
+STEPS = 200
+LEARNING_RATE = 1e-4
+RECENT_DAYS = 120
+REPLAY_WINDOWS = 2048
+HOLDOUT_DAYS = 60
+TOLERANCE = 0.0     # allowed relative holdout MAE increase
+
+
+# --------------------
+# HELPERS
+# --------------------
+def live_cities(artifacts_dir):
+    return sorted(
+        p.name for p in Path(artifacts_dir).iterdir()
+        if p.is_dir() and (p / "best_lstm_model.pt").exists()
+    )
+
+
+def holdout_mae(model, dataset, indices, device):
+    """Mean absolute error in scaled units over all targets and lead days."""
+    model.eval()
+    errors = []
+    with torch.no_grad():
+        for start in range(0, len(indices), 1024):
+            X, Y = dataset[indices[start:start + 1024]]
+            errors.append((model(X.to(device)).cpu() - Y).abs().mean(dim=1))
+    return float(torch.cat(errors).mean())
+
+
+def finetune_steps(model, dataset, recent_idx, replay_idx, steps, lr, generator, device):
+    """Bounded-step Adam fine-tuning; each batch mixes recent and replay windows."""
+    criterion = nn.MSELoss()
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+    n_replay = BATCH_SIZE // 2 if len(replay_idx) else 0
+    n_recent = BATCH_SIZE - n_replay
+
+    model.train()
+    total = 0.0
+    for _ in range(steps):
+        pick = torch.randint(len(recent_idx), (n_recent,), generator=generator).numpy()
+        batch = recent_idx[pick]
+        if n_replay:
+            pick = torch.randint(len(replay_idx), (n_replay,), generator=generator).numpy()
+            batch = np.concatenate([batch, replay_idx[pick]])
+
+        X, Y = dataset[batch]
+        X, Y = X.to(device), Y.to(device)
+        optimizer.zero_grad()
+        loss = criterion(model(X), Y)
+        loss.backward()
+        torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
+        optimizer.step()
+        total += loss.item()
+
+    return total / max(steps, 1)
+
+
+# --------------------
+# ONE CITY
+# --------------------
+def finetune_city(city, options):
+    t0 = time.time()
+    seed = options["seed"]
+    torch.manual_seed(seed)
+    generator = torch.Generator().manual_seed(seed)
+    device = DEVICE
+
+    def log(msg):
+        print(f"[{city}] {msg}", flush=True)
+
+    city_dir = Path(options["artifacts_dir"]) / city
+    parent = read_manifest(city_dir)
+    feature_bundle = joblib.load(city_dir / "feature_scaler_bundle.pkl")
+    target_scalers = joblib.load(city_dir / "target_scalers.pkl")
+    feature_scaler, feature_cols = feature_bundle["scaler"], feature_bundle["feature_cols"]
+
+    model_config = read_model_config(city_dir)
+    model = load_model(len(feature_cols), city_dir / "best_lstm_model.pt", config=model_config)
+
+    # ---- Windows over the live history (complete days only: none spans a gap)
+    df = load_weather_data(city_dir / "weather.csv")
+    columns = list(dict.fromkeys(feature_cols + TARGET_COLS))
+    df_fe = apply_feature_engineering(df)[columns]
+    lookback = model_config["lookback"]
+    starts = complete_windows(df_fe.notna().all(axis=1), lookback, HORIZON)
+    target_mean, target_scale = target_affine(target_scalers, TARGET_COLS)
+    dataset = WindowDataset(
+        feature_scaler.transform(df_fe[feature_cols].to_numpy(np.float64)),
+        df_fe[TARGET_COLS].to_numpy(np.float64),
+        lookback, HORIZON, target_mean, target_scale, starts,
+    )
+
+    # the splits are in days (window starts), whatever the gaps drop
+    n = n_windows(len(df_fe), lookback, HORIZON)
+    holdout_start = n - options["holdout_days"]
+    # training targets must end before the first holdout target
+    train_end = holdout_start - HORIZON
+    recent_start = max(0, train_end - options["recent_days"])
+
+    holdout_idx = np.flatnonzero(starts >= holdout_start)
+    recent_idx = np.flatnonzero((starts >= recent_start) & (starts < train_end))
+    older = np.flatnonzero(starts < recent_start)
+    if not len(recent_idx) or not len(holdout_idx) or holdout_start <= 0:
+        raise ValueError(
+            f"Not enough history in {city_dir / 'weather.csv'} to fine-tune "
+            f"({len(starts)} complete windows, {len(recent_idx)} recent, {len(holdout_idx)} holdout)."
+        )
+    replay_idx = older[torch.randperm(len(older), generator=generator)[:options["replay"]].numpy()]
+
+    before = holdout_mae(model, dataset, holdout_idx, device)
+
+    train_loss = finetune_steps(
+        model, dataset, recent_idx, replay_idx,
+        options["steps"], options["lr"], generator, device,
+    )
+    after = holdout_mae(model, dataset, holdout_idx, device)
+    accepted = after <= before * (1.0 + options["tolerance"])
+    log(
+        f"holdout MAE {before:.4f} -> {after:.4f} "
+        f"({'accepted' if accepted else 'rejected'}) in {time.time() - t0:.1f}s"
+    )
+
+    result = {"city": city, "before": before, "after": after, "accepted": accepted, "version": None}
+    if not accepted or options["dry_run"]:
+        return result
+
+    # ---- Write and promote the new version
+    version = new_version()
+    out_dir = version_dir(city_dir, version)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    torch.save({k: v.detach().cpu() for k, v in model.state_dict().items()}, out_dir / "best_lstm_model.pt")
+    joblib.dump(feature_bundle, out_dir / "feature_scaler_bundle.pkl")
+    joblib.dump(target_scalers, out_dir / "target_scalers.pkl")
+
+    holdout = torch.utils.data.Subset(dataset, holdout_idx.tolist())
+    manifest = {
+        "city": city,
+        "version": version,
+        "kind": "finetune",
+        "parent_version": (parent or {}).get("version"),
+        "created_at": utc_now(),
+        "model": {
+            "class": "WeatherLSTM",
+            "input_size": len(feature_cols),
+            "horizon": HORIZON,
+            "num_targets": len(TARGET_COLS),
+            **model_config,
+        },
+        "data": {
+            "source": str((city_dir / "weather.csv").relative_to(MODEL_DIR))
+            if city_dir.is_relative_to(MODEL_DIR) else str(city_dir / "weather.csv"),
+            "start": df_fe.index.min().strftime("%Y-%m-%d"),
+            "end": df_fe.index.max().strftime("%Y-%m-%d"),
+            "recent_windows": len(recent_idx),
+            "replay_windows": len(replay_idx),
+            "holdout_windows": len(holdout_idx),
+            "weather_sha256": sha256_file(city_dir / "weather.csv"),
+        },
+        "training": {
+            "seed": seed,
+            "steps": options["steps"],
+            "learning_rate": options["lr"],
+            "batch_size": BATCH_SIZE,
+            "train_mse_scaled": train_loss,
+            "duration_s": round(time.time() - t0, 2),
+        },
+        "metrics": {
+            "holdout_mae_scaled_before": before,
+            "holdout_mae_scaled": after,
+            **real_scale_mae(model, holdout, target_scalers, device),
+        },
+        "files": {name: sha256_file(out_dir / name) for name in MODEL_FILES},
+    }
+    write_json_atomic(out_dir / "manifest.json", manifest)
+    promote_version(city_dir, version, manifest)
+    log(f"promoted version {version}")
+
+    result["version"] = version
+    return result
+
+
+# --------------------
+# MAIN (CLI)
+# --------------------
+def main():
+    parser = argparse.ArgumentParser(description="Warm-start fine-tune the live WeatherLSTM of each city")
+    parser.add_argument("--cities", nargs="+", default=None,
+                        help="Cities to fine-tune (default: every artifact folder with a model)")
+    parser.add_argument("--artifacts-dir", type=Path, default=ARTIFACTS_DIR)
+    parser.add_argument("--steps", type=int, default=STEPS)
+    parser.add_argument("--lr", type=float, default=LEARNING_RATE)
+    parser.add_argument("--recent-days", type=int, default=RECENT_DAYS)
+    parser.add_argument("--replay", type=int, default=REPLAY_WINDOWS,
+                        help="Older windows sampled for replay")
+    parser.add_argument("--holdout-days", type=int, default=HOLDOUT_DAYS)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="Allowed relative holdout MAE increase (0 = must not regress)")
+    parser.add_argument("--threads", type=int, default=1, help="torch intra-op threads")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--dry-run", action="store_true", help="Evaluate only, never promote")
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    cities = args.cities or live_cities(args.artifacts_dir)
+    options = {
+        "artifacts_dir": str(args.artifacts_dir),
+        "steps": args.steps,
+        "lr": args.lr,
+        "recent_days": args.recent_days,
+        "replay": args.replay,
+        "holdout_days": args.holdout_days,
+        "tolerance": args.tolerance,
+        "seed": args.seed,
+        "dry_run": args.dry_run,
+    }
+
+    failures = 0
+    for city in cities:
+        try:
+            result = finetune_city(city, options)
+        except Exception as e:
+            failures += 1
+            print(f"[ERROR] {city}: {e!r}")
+            continue
+        status = result["version"] or ("kept live model" if not result["accepted"] else "dry run")
+        print(f"[OK] {city} -> {status}")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+NOAA GSOD yearly files -> clean daily frames in the weather.csv schema.
+
+Each datasets/<station>/*_YY.csv has 28 quoted, whitespace-padded columns.
+Only the 9 columns below are read, with explicit dtypes: the C parser
+strips the padding itself, so no per-cell Python converters are needed and
+the attribute/flag columns are never materialized. Files are parsed in
+parallel across a process pool (one task per file), so adding stations or
+years scales with the number of cores, not with a Python loop.
+
+Cleaning reproduces prepare_data.ipynb step by step, including its order:
+missing days are interpolated BEFORE the sentinel codes (9999.9 / 999.9 /
+99.99) are turned into NaN, then GUST is dropped, PRCP NaN -> 0 and units
+are converted (F -> C, inches -> mm, knots -> m/s, miles -> km). Output is
+identical to the notebook's.
+
+With qc=True (--qc) the units are converted first and the frame goes through
+knowledge_system.qc instead: sentinels/range/consistency checks BEFORE
+bounded gap filling, and a qc_flags column.
+
+Usage (from the repo root):
+    python model/building_model/gsod_ingest.py model/building_model/datasets/casa --output /tmp/casa.csv
+    python model/building_model/gsod_ingest.py model/building_model/datasets/* --workers 4
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+MODEL_DIR = Path(__file__).resolve().parent.parent
+if str(MODEL_DIR) not in sys.path:
+    sys.path.insert(0, str(MODEL_DIR))
+
+from knowledge_system.qc import run_qc  # noqa: E402
+
+GSOD_COLUMNS = ["DATE", "TEMP", "MAX", "MIN", "DEWP", "PRCP", "WDSP", "GUST", "VISIB"]
+
+GSOD_DTYPES = {"DATE": str} | {col: np.float64 for col in GSOD_COLUMNS[1:]}
+
+MISSING_CODES = {
+    "TEMP": 9999.9,
+    "MAX": 9999.9,
+    "MIN": 9999.9,
+    "DEWP": 9999.9,
+    "VISIB": 999.9,
+    "WDSP": 999.9,
+    "GUST": 999.9,
+    "PRCP": 99.99,
+}
+
+RENAME = {
+    "TEMP": "mean_temperature",
+    "DEWP": "mean_dewPoint",
+    "VISIB": "mean_visibility",
+    "WDSP": "mean_windSpeed",
+    "MAX": "max_temperature",
+    "MIN": "min_temperature",
+    "PRCP": "total_precipitation",
+}
+
+WEATHER_COLUMNS = [
+    "mean_temperature",
+    "max_temperature",
+    "min_temperature",
+    "mean_dewPoint",
+    "total_precipitation",
+    "mean_windSpeed",
+    "mean_visibility",
+]
+
+# below this many files the pool start-up costs more than it saves
+PARALLEL_MIN_FILES = 16
+
+
+def dataset_files(dataset_dir):
+    return sorted(p for p in Path(dataset_dir).iterdir() if p.suffix.lower() == ".csv")
+
+
+# --------------------
+# Parsing
+# --------------------
+def read_gsod_file(path):
+    """The GSOD_COLUMNS of one yearly file, typed (DATE as datetime64)."""
+    df = pd.read_csv(path, usecols=GSOD_COLUMNS, dtype=GSOD_DTYPES, engine="c")
+    df["DATE"] = pd.to_datetime(df["DATE"], format="%Y-%m-%d")
+    return df[GSOD_COLUMNS]
+
+
+def read_gsod_files(paths, workers=None):
+    """Parse many files, in a process pool when there are enough of them."""
+    paths = [Path(p) for p in paths]
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(paths) < PARALLEL_MIN_FILES:
+        return [read_gsod_file(p) for p in paths]
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as ex:
+        return list(ex.map(read_gsod_file, paths, chunksize=chunksize))
+
+
+# --------------------
+# Cleaning
+# --------------------
+def convert_units(df):
+    """GSOD columns (F, inches, knots, miles) -> WEATHER_COLUMNS (C, mm, m/s, km)."""
+    df = df.drop(columns=["GUST"]).rename(columns=RENAME)
+
+    temps = ["mean_temperature", "max_temperature", "min_temperature", "mean_dewPoint"]
+    df[temps] = (df[temps] - 32) * 5 / 9
+    df["total_precipitation"] = df["total_precipitation"] * 25.4
+    df["mean_windSpeed"] = df["mean_windSpeed"] * 0.514444
+    df["mean_visibility"] = df["mean_visibility"] * 1.60934
+
+    return df[WEATHER_COLUMNS]
+
+
+def clean_gsod(raw):
+    """
+    Concatenated raw GSOD rows of one station -> daily frame in WEATHER_COLUMNS,
+    exactly as prepare_data.ipynb does it (interpolation before sentinel masking).
+    """
+    df = raw.sort_values("DATE", kind="stable").set_index("DATE")
+
+    full_idx = pd.date_range(start=df.index.min(), end=df.index.max(), freq="D")
+    df = df.reindex(full_idx)
+
+    num_cols = GSOD_COLUMNS[1:]
+    df[num_cols] = df[num_cols].interpolate(method="time").ffill().bfill()
+
+    values = df[num_cols].to_numpy()
+    codes = np.array([MISSING_CODES[c] for c in num_cols])
+    values[values == codes] = np.nan
+    df = pd.DataFrame(values, index=df.index, columns=num_cols)
+
+    df["PRCP"] = df["PRCP"].fillna(0.0)
+    return convert_units(df)
+
+
+def qc_gsod(raw):
+    """
+    Raw GSOD rows -> daily frame through knowledge_system.qc (sentinels, range
+    and consistency checks first, then bounded gap filling, plus qc_flags).
+    """
+    df = raw.sort_values("DATE", kind="stable").set_index("DATE")
+    return run_qc(convert_units(df))
+
+
+def load_gsod_history(dataset_dir, workers=1, qc=False):
+    """Daily frame in the weather.csv schema from a station's GSOD files."""
+    frames = read_gsod_files(dataset_files(dataset_dir), workers=workers)
+    raw = pd.concat(frames, ignore_index=True)
+    return qc_gsod(raw) if qc else clean_gsod(raw)
+
+
+def load_stations(dataset_dirs, workers=None, qc=False):
+    """
+    {station folder name: clean frame} for many stations. Files of all
+    stations go through one pool, so the parse is spread over every core
+    even when each station only has a few yearly files.
+    """
+    dataset_dirs = [Path(d) for d in dataset_dirs]
+    files = [(d.name, p) for d in dataset_dirs for p in dataset_files(d)]
+    frames = read_gsod_files([p for _, p in files], workers=workers)
+
+    per_station = {}
+    for (name, _), frame in zip(files, frames):
+        per_station.setdefault(name, []).append(frame)
+    clean = qc_gsod if qc else clean_gsod
+    return {name: clean(pd.concat(parts, ignore_index=True)) for name, parts in per_station.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse and clean GSOD station folders")
+    parser.add_argument("dataset_dirs", nargs="+", type=Path)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--qc", action="store_true", help="clean with knowledge_system.qc instead of the notebook steps")
+    parser.add_argument("--output", type=Path,
+                        help="weather.csv to write (single station) or folder (<station>.csv each)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    stations = load_stations(args.dataset_dirs, workers=args.workers, qc=args.qc)
+    elapsed = time.perf_counter() - t0
+
+    rows = sum(len(df) for df in stations.values())
+    print(f"{len(stations)} station(s), {rows} days in {elapsed * 1000:.1f} ms")
+
+    if args.output:
+        if len(stations) == 1 and args.output.suffix == ".csv":
+            next(iter(stations.values())).to_csv(args.output)
+        else:
+            args.output.mkdir(parents=True, exist_ok=True)
+            for name, df in stations.items():
+                df.to_csv(args.output / f"{name}.csv")
+
+
+if __name__ == "__main__":
+    main()
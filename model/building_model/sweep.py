@@ -0,0 +1,392 @@
+"""
+Parallel hyperparameter / architecture sweep for WeatherLSTM on CPU.
+
+The training and validation windows of one city are prepared once per
+lookback and written as .npy files; every trial process memory-maps them,
+so all trials share a single physical copy of the data (windows are strided
+views over it, see knowledge_system.windows). Trials run concurrently in a
+process pool with a bounded number of torch threads each.
+
+Validation MSEs are compared across trials (pruning, selection), so every
+lookback is scored on the same target days (those all lookbacks have, i.e.
+the validation windows trimmed to the longest lookback) and in the same
+units: the target scalers are those of the longest lookback. The feature
+scaler is fitted per lookback, on that lookback's training windows.
+
+Pruning: after every epoch a trial reports its best validation MSE so far to
+a board shared by all trials. Past the warm-up epochs, a trial whose value
+is worse than the median of the other trials at the same epoch is stopped
+(median pruning). Early stopping on patience still applies.
+
+For each finished trial the report has the validation MSE (scaled), the
+mean-temperature MAE in °C, the parameter count and the single-request
+inference latency. Latency is measured afterwards in the main process, one
+model at a time, so concurrent training does not distort it.
+
+The selected configuration is the fastest one whose validation MSE is within
+--tolerance of the best. It is exported as best_config.json in the same
+{"model": ..., "training": ...} layout train_pipeline.py --config reads and
+manifest.json["model"] records (which load_model uses).
+
+Usage (from the repo root):
+    python model/building_model/sweep.py --city casablanca --workers 4
+    python model/building_model/sweep.py --hidden-sizes 16 32 64 --num-layers 1 2 --lookbacks 7 14 --max-trials 8
+    python model/building_model/train_pipeline.py --config model/building_model/sweeps/<id>/best_config.json
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import joblib
+import numpy as np
+import torch
+import torch.nn as nn
+
+from train_pipeline import (
+    BATCH_SIZE,
+    BUILD_DIR,
+    CITY_DATASETS,
+    DATASETS_DIR,
+    FEATURE_COLS,
+    LEARNING_RATE,
+    MIN_DELTA,
+    MODEL_CONFIG,
+    SPLIT_DATE,
+    build_model,
+    evaluate,
+    prepare_windows,
+    real_scale_mae,
+    train_one_epoch,
+)
+from gsod_ingest import load_gsod_history
+from knowledge_system.helpers import apply_feature_engineering, HORIZON, TARGET_COLS
+from knowledge_system.manifest import new_version, utc_now, write_json_atomic
+from knowledge_system.windows import WindowDataset, batch_loader, target_affine
+
+SWEEPS_DIR = BUILD_DIR / "sweeps"
+
+EPOCHS = 30
+PATIENCE = 4
+WARMUP_EPOCHS = 3
+MIN_PEERS = 3           # other trials needed at an epoch before pruning kicks in
+LATENCY_RUNS = 200
+TOLERANCE = 0.02        # relative validation MSE slack when picking the fastest config
+
+
+# --------------------
+# SHARED DATA (written once, memory-mapped by every trial)
+# --------------------
+def write_shared_data(data_dir, city, split_date, lookbacks):
+    df = load_gsod_history(DATASETS_DIR / CITY_DATASETS[city], qc=True)
+    df_fe = apply_feature_engineering(df)
+    prepared = {lookback: prepare_windows(df_fe, split_date, lookback) for lookback in lookbacks}
+
+    target_scalers = prepared[max(lookbacks)][3]
+    target_mean, target_scale = target_affine(target_scalers, TARGET_COLS)
+    # first target day of every validation window, in rows of the test split
+    target_days = set.intersection(*(set(test_set.starts + lb) for lb, (_, test_set, _, _) in prepared.items()))
+    target_days = np.array(sorted(target_days), dtype=np.int64)
+
+    data_dir.mkdir(parents=True, exist_ok=True)
+    np.save(data_dir / "target_mean.npy", target_mean)
+    np.save(data_dir / "target_scale.npy", target_scale)
+    joblib.dump(target_scalers, data_dir / "target_scalers.pkl")
+    for lookback, (train_set, test_set, _, _) in prepared.items():
+        lookback_dir = data_dir / f"lookback_{lookback}"
+        lookback_dir.mkdir(exist_ok=True)
+        np.save(lookback_dir / "train_features.npy", train_set.features)
+        np.save(lookback_dir / "train_targets.npy", train_set.targets)
+        np.save(lookback_dir / "train_starts.npy", train_set.starts)
+        np.save(lookback_dir / "test_features.npy", test_set.features)
+        np.save(lookback_dir / "test_targets.npy", test_set.targets)
+        np.save(lookback_dir / "test_starts.npy", target_days - lookback)
+
+    train_set, test_set = prepared[max(lookbacks)][:2]
+    return {
+        "train_rows": len(train_set.features),
+        "test_rows": len(test_set.features),
+        "validation_windows": len(target_days),
+    }
+
+
+_shared = {}
+
+
+def _init_worker(data_dir, torch_threads, board, board_lock):
+    torch.set_num_threads(torch_threads)
+    data_dir = Path(data_dir)
+    _shared["data_dir"] = data_dir
+    _shared["target_mean"] = np.load(data_dir / "target_mean.npy")
+    _shared["target_scale"] = np.load(data_dir / "target_scale.npy")
+    _shared["target_scalers"] = joblib.load(data_dir / "target_scalers.pkl")
+    _shared["board"] = board
+    _shared["board_lock"] = board_lock
+
+
+def _datasets(lookback):
+    lookback_dir = _shared["data_dir"] / f"lookback_{lookback}"
+
+    def load(name):
+        return np.load(lookback_dir / f"{name}.npy", mmap_mode="r")
+
+    mean, scale = _shared["target_mean"], _shared["target_scale"]
+    train = WindowDataset(
+        load("train_features"), load("train_targets"), lookback, HORIZON, mean, scale, np.array(load("train_starts"))
+    )
+    test = WindowDataset(
+        load("test_features"), load("test_targets"), lookback, HORIZON, mean, scale, np.array(load("test_starts"))
+    )
+    return train, test
+
+
+# --------------------
+# PRUNING
+# --------------------
+def should_prune(trial_id, epoch, value, warmup_epochs):
+    """Report value at epoch; True if it is worse than the median of the other trials."""
+    with _shared["board_lock"]:
+        _shared["board"].append((trial_id, epoch, value))
+        peers = [v for t, e, v in _shared["board"] if e == epoch and t != trial_id]
+    if epoch <= warmup_epochs or len(peers) < MIN_PEERS:
+        return False
+    return value > statistics.median(peers)
+
+
+# --------------------
+# ONE TRIAL (runs in a worker process)
+# --------------------
+def run_trial(trial, options):
+    t0 = time.time()
+    torch.manual_seed(options["seed"])
+    train_set, test_set = _datasets(trial["lookback"])
+    generator = torch.Generator().manual_seed(options["seed"])
+    train_loader = batch_loader(train_set, BATCH_SIZE, shuffle=True, generator=generator)
+    test_loader = batch_loader(test_set, BATCH_SIZE, shuffle=False)
+
+    model = build_model(trial)
+    criterion = nn.MSELoss()
+    optimizer = torch.optim.Adam(model.parameters(), lr=trial["learning_rate"])
+
+    best_val, best_state, best_epoch, no_improve = float("inf"), None, 0, 0
+    status, epoch = "completed", 0
+    for epoch in range(1, options["epochs"] + 1):
+        train_one_epoch(model, train_loader, optimizer, criterion, "cpu")
+        val = evaluate(model, test_loader, criterion, "cpu")
+        if val < best_val - MIN_DELTA:
+            best_val, best_epoch, no_improve = val, epoch, 0
+            best_state = {k: v.detach().clone() for k, v in model.state_dict().items()}
+        else:
+            no_improve += 1
+
+        if should_prune(trial["id"], epoch, best_val, options["warmup_epochs"]):
+            status = "pruned"
+            break
+        if no_improve >= options["patience"]:
+            break
+    if best_state is None:
+        # the validation loss never became finite: nothing to keep or compare
+        status = "diverged"
+
+    result = {
+        **trial,
+        "status": status,
+        "epochs_run": epoch,
+        "best_epoch": best_epoch,
+        "val_mse_scaled": float(best_val),
+        "params": sum(p.numel() for p in model.parameters()),
+        "train_s": round(time.time() - t0, 2),
+    }
+    if status == "completed":
+        model.load_state_dict(best_state)
+        mae = real_scale_mae(model, test_set, _shared["target_scalers"], "cpu")
+        result["mean_temperature_mae"] = mae["mae"]["mean_temperature"]
+        result["mae"] = mae["mae"]
+        result["state_dict"] = best_state
+    return result
+
+
+# --------------------
+# LATENCY (main process, one model at a time)
+# --------------------
+def measure_latency(trial, state_dict, runs=LATENCY_RUNS):
+    """Median / p95 ms of one forward pass for a single request (batch 1)."""
+    model = build_model(trial)
+    model.load_state_dict(state_dict)
+    model.eval()
+    x = torch.randn(1, trial["lookback"], len(FEATURE_COLS))
+    timings = []
+    with torch.no_grad():
+        for _ in range(10):
+            model(x)
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            model(x)
+            timings.append((time.perf_counter() - t0) * 1000.0)
+    timings.sort()
+    return statistics.median(timings), timings[int(0.95 * (len(timings) - 1))]
+
+
+# --------------------
+# GRID & SELECTION
+# --------------------
+def build_trials(args):
+    grid = itertools.product(
+        args.hidden_sizes, args.num_layers, args.dropouts, args.lookbacks, args.learning_rates,
+    )
+    trials = [
+        {"hidden_size": h, "num_layers": n, "dropout": d if n > 1 else 0.0, "lookback": lb, "learning_rate": lr}
+        for h, n, d, lb, lr in grid
+    ]
+    # dropout is ignored by a 1-layer LSTM: drop the duplicates it creates
+    unique = list({json.dumps(t, sort_keys=True): t for t in trials}.values())
+    if args.max_trials and len(unique) > args.max_trials:
+        unique = random.Random(args.seed).sample(unique, args.max_trials)
+    for i, trial in enumerate(unique):
+        trial["id"] = i
+    return unique
+
+
+def select_best(results, tolerance):
+    """Fastest completed trial whose validation MSE is within tolerance of the best."""
+    done = [r for r in results if r["status"] == "completed"]
+    if not done:
+        return None
+    best_val = min(r["val_mse_scaled"] for r in done)
+    eligible = [r for r in done if r["val_mse_scaled"] <= best_val * (1.0 + tolerance)]
+    return min(eligible, key=lambda r: (r["latency_ms_p50"], r["val_mse_scaled"]))
+
+
+def export_config(path, best, meta):
+    config = {
+        "model": {k: best[k] for k in MODEL_CONFIG},
+        "training": {"learning_rate": best["learning_rate"]},
+        "metrics": {
+            "val_mse_scaled": best["val_mse_scaled"],
+            "mean_temperature_mae": best["mean_temperature_mae"],
+            "params": best["params"],
+            "latency_ms_p50": best["latency_ms_p50"],
+        },
+        "sweep": meta,
+    }
+    write_json_atomic(path, config)
+    return config
+
+
+# --------------------
+# MAIN (CLI)
+# --------------------
+def main():
+    parser = argparse.ArgumentParser(description="Parallel WeatherLSTM hyperparameter sweep")
+    parser.add_argument("--city", choices=sorted(CITY_DATASETS), default="casablanca")
+    parser.add_argument("--hidden-sizes", nargs="+", type=int, default=[16, 32, 64])
+    parser.add_argument("--num-layers", nargs="+", type=int, default=[1, 2])
+    parser.add_argument("--dropouts", nargs="+", type=float, default=[0.0, 0.2])
+    parser.add_argument("--lookbacks", nargs="+", type=int, default=[7, 14, 21])
+    parser.add_argument("--learning-rates", nargs="+", type=float, default=[LEARNING_RATE])
+    parser.add_argument("--max-trials", type=int, default=None, help="Random subset of the grid")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--patience", type=int, default=PATIENCE)
+    parser.add_argument("--warmup-epochs", type=int, default=WARMUP_EPOCHS)
+    parser.add_argument("--split-date", default=SPLIT_DATE)
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output-dir", type=Path, default=None,
+                        help="Default: building_model/sweeps/<timestamp>/")
+    args = parser.parse_args()
+
+    out_dir = args.output_dir or SWEEPS_DIR / new_version()
+    data_dir = out_dir / "data"
+    data_info = write_shared_data(data_dir, args.city, args.split_date, sorted(set(args.lookbacks)))
+    trials = build_trials(args)
+
+    cpu = os.cpu_count() or 1
+    workers = args.workers or max(1, min(len(trials), cpu // args.threads_per_worker))
+    options = {
+        "epochs": args.epochs,
+        "patience": args.patience,
+        "warmup_epochs": args.warmup_epochs,
+        "seed": args.seed,
+    }
+    print(f"[INFO] {len(trials)} trial(s) on {args.city} with {workers} worker(s) x {args.threads_per_worker} thread(s)")
+
+    t0 = time.time()
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Manager() as manager:
+        board, board_lock = manager.list(), manager.Lock()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+            initargs=(str(data_dir), args.threads_per_worker, board, board_lock),
+        ) as pool:
+            futures = {pool.submit(run_trial, trial, options): trial for trial in trials}
+            for future in as_completed(futures):
+                trial = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"[ERROR] trial {trial['id']}: {e!r}")
+                    results.append({**trial, "status": "failed", "error": repr(e)})
+                    continue
+                results.append(result)
+                print(
+                    f"[{result['status']:>9}] trial {result['id']:3d} | h={result['hidden_size']:<3d}"
+                    f" l={result['num_layers']} d={result['dropout']:.2f} lb={result['lookback']:<2d}"
+                    f" lr={result['learning_rate']:.0e} | val MSE {result['val_mse_scaled']:.4f}"
+                    f" | epochs {result['epochs_run']}"
+                )
+    sweep_s = time.time() - t0
+
+    torch.set_num_threads(1)
+    for r in results:
+        state = r.pop("state_dict", None)
+        if state is not None:
+            r["latency_ms_p50"], r["latency_ms_p95"] = measure_latency(r, state)
+
+    results.sort(key=lambda r: (r["status"] != "completed", r.get("val_mse_scaled", float("inf"))))
+    print(f"\n{'id':>3} {'params':>8} {'val MSE':>8} {'T MAE °C':>9} {'p50 ms':>7}  config")
+    for r in results:
+        if r["status"] != "completed":
+            continue
+        print(
+            f"{r['id']:3d} {r['params']:8d} {r['val_mse_scaled']:8.4f} {r['mean_temperature_mae']:9.3f}"
+            f" {r['latency_ms_p50']:7.3f}  h={r['hidden_size']} l={r['num_layers']}"
+            f" d={r['dropout']} lb={r['lookback']} lr={r['learning_rate']}"
+        )
+
+    meta = {
+        "city": args.city,
+        "created_at": utc_now(),
+        "split_date": args.split_date,
+        "trials": len(trials),
+        "completed": sum(r["status"] == "completed" for r in results),
+        "pruned": sum(r["status"] == "pruned" for r in results),
+        "duration_s": round(sweep_s, 2),
+        "tolerance": args.tolerance,
+        **data_info,
+    }
+    write_json_atomic(out_dir / "results.json", {"sweep": meta, "trials": results})
+
+    best = select_best(results, args.tolerance)
+    if best is None:
+        print("[WARN] no trial completed; nothing exported")
+        return
+    export_config(out_dir / "best_config.json", best, meta)
+    print(
+        f"\n[OK] selected trial {best['id']} ({best['params']} params, {best['latency_ms_p50']:.3f} ms,"
+        f" val MSE {best['val_mse_scaled']:.4f}) -> {out_dir / 'best_config.json'}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+"""
+Command-line training pipeline for every city's WeatherLSTM.
+
+Scripted version of prepare_data.ipynb: for each city it loads the GSOD
+yearly files under datasets/<city>/ (gsod_ingest.py) into the weather.csv schema,
+builds features with the same apply_feature_engineering used at inference,
+fits the feature/target scalers, trains WeatherLSTM with early stopping and
+writes a new artifact version. Cities are trained in parallel, one process
+per city, each with a bounded number of torch threads.
+
+Artifacts are written to knowledge_system/artifacts/<city>/versions/<version>/
+and then promoted atomically into the live folder together with a
+manifest.json (metrics, data range, file and input hashes). The live files
+keep the names helpers.load_model / run_forecast already read.
+
+Usage (from the repo root):
+    python model/building_model/train_pipeline.py                       # all cities
+    python model/building_model/train_pipeline.py --cities casablanca sale --workers 2
+    python model/building_model/train_pipeline.py --no-promote --epochs 5
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import joblib
+import numpy as np
+import torch
+import torch.nn as nn
+
+BUILD_DIR = Path(__file__).resolve().parent              # model/building_model
+MODEL_DIR = BUILD_DIR.parent                             # model/
+for p in (str(MODEL_DIR), str(BUILD_DIR)):
+    if p not in sys.path:
+        sys.path.insert(0, p)
+
+from knowledge_system.helpers import (  # noqa: E402
+    WeatherLSTM,
+    MODEL_DEFAULTS,
+    apply_feature_engineering,
+    inverse_scale_predictions,
+    TARGET_COLS,
+    HORIZON,
+)
+from knowledge_system.windows import (  # noqa: E402
+    WindowDataset,
+    batch_loader,
+    complete_windows,
+    fit_feature_scaler,
+    fit_target_scalers,
+    target_affine,
+)
+from knowledge_system.manifest import (  # noqa: E402
+    MODEL_FILES,
+    new_version,
+    promote_version,
+    sha256_file,
+    utc_now,
+    version_dir,
+    write_json_atomic,
+)
+from gsod_ingest import dataset_files, load_gsod_history  # noqa: E402
+
+DATASETS_DIR = BUILD_DIR / "datasets"
+ARTIFACTS_DIR = MODEL_DIR / "knowledge_system" / "artifacts"
+
+# artifact folder name -> raw dataset folder name
+CITY_DATASETS = {
+    "casablanca": "casa",
+    "benimellal": "benimellal",
+    "sale": "sale",
+}
+
+FEATURE_COLS = [
+    # --- core current values
+    "mean_temperature",
+    "max_temperature",
+    "min_temperature",
+    "mean_dewPoint",
+    "total_precipitation",
+    "mean_windSpeed",
+    "mean_visibility",
+
+    # --- lag features
+    "mean_temperature_lag_1",
+    "mean_temperature_lag_3",
+    "mean_temperature_lag_7",
+
+    # --- rolling statistics
+    "mean_temperature_roll_mean_3",
+    "mean_temperature_roll_mean_7",
+    "total_precipitation_roll_sum_3",
+    "total_precipitation_roll_sum_7",
+
+    # --- change features
+    "delta_temp_1d",
+    "delta_temp_3d",
+    "wind_increase_1d",
+    "precip_increase_1d",
+
+    # --- seasonality
+    "dow_sin",
+    "dow_cos",
+    "doy_sin",
+    "doy_cos",
+]
+
+SPLIT_DATE = "2025-01-01"
+
+# WeatherLSTM architecture + input window length, recorded in manifest.json["model"]
+MODEL_CONFIG = dict(MODEL_DEFAULTS)
+
+BATCH_SIZE = 64
+LEARNING_RATE = 1e-3
+EPOCHS = 50
+PATIENCE = 4
+MIN_DELTA = 1e-4
+
+
+# --------------------
+# WINDOWS & MODEL
+# --------------------
+def prepare_windows(df_fe, split_date, lookback):
+    """
+    Train/test WindowDatasets split at split_date, with the scalers fitted on
+    the training windows only. Returns (train_set, test_set, feature_scaler,
+    target_scalers).
+
+    df_fe is daily: days left NaN (gaps too long for QC to fill) are kept
+    and only the windows made of complete days are used, so no window
+    spans a gap.
+    """
+    train_df = df_fe.loc[df_fe.index < split_date]
+    test_df = df_fe.loc[df_fe.index >= split_date]
+
+    def starts(frame):
+        return complete_windows(frame[FEATURE_COLS + TARGET_COLS].notna().all(axis=1), lookback, HORIZON)
+
+    train_starts, test_starts = starts(train_df), starts(test_df)
+    if not len(train_starts) or not len(test_starts):
+        raise ValueError(
+            f"No complete {lookback + HORIZON}-day window on one side of {split_date} "
+            f"(train {len(train_starts)}, test {len(test_starts)})"
+        )
+    train_features = train_df[FEATURE_COLS].to_numpy(np.float64)
+    train_targets = train_df[TARGET_COLS].to_numpy(np.float64)
+    feature_scaler = fit_feature_scaler(train_features, lookback, HORIZON, train_starts)
+    target_scalers = fit_target_scalers(train_targets, TARGET_COLS, lookback, HORIZON, train_starts)
+    target_mean, target_scale = target_affine(target_scalers, TARGET_COLS)
+
+    def dataset(frame, frame_starts):
+        return WindowDataset(
+            feature_scaler.transform(frame[FEATURE_COLS].to_numpy(np.float64)),
+            frame[TARGET_COLS].to_numpy(np.float64),
+            lookback, HORIZON, target_mean, target_scale, frame_starts,
+        )
+
+    return dataset(train_df, train_starts), dataset(test_df, test_starts), feature_scaler, target_scalers
+
+
+def build_model(model_config):
+    """WeatherLSTM for a MODEL_CONFIG-style dict (lookback is not an nn argument)."""
+    return WeatherLSTM(
+        input_size=len(FEATURE_COLS),
+        hidden_size=model_config["hidden_size"],
+        num_layers=model_config["num_layers"],
+        horizon=HORIZON,
+        num_targets=len(TARGET_COLS),
+        dropout=model_config["dropout"],
+    )
+
+
+def read_config_file(path):
+    """(model_config, training) from a {"model": {...}, "training": {...}} JSON (see sweep.py)."""
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    recorded = config.get("model", {})
+    return {k: recorded[k] for k in MODEL_CONFIG if k in recorded}, config.get("training", {})
+
+
+# --------------------
+# TRAINING
+# --------------------
+def train_one_epoch(model, loader, optimizer, criterion, device):
+    model.train()
+    total_loss = 0.0
+
+    for X_batch, Y_batch in loader:
+        X_batch = X_batch.to(device)
+        Y_batch = Y_batch.to(device)
+
+        optimizer.zero_grad()
+        loss = criterion(model(X_batch), Y_batch)
+        loss.backward()
+
+        # gradient clipping (important for LSTM)
+        torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
+        optimizer.step()
+
+        total_loss += loss.item() * X_batch.size(0)
+
+    return total_loss / len(loader.dataset)
+
+
+def evaluate(model, loader, criterion, device):
+    model.eval()
+    total_loss = 0.0
+
+    with torch.no_grad():
+        for X_batch, Y_batch in loader:
+            X_batch = X_batch.to(device)
+            Y_batch = Y_batch.to(device)
+            total_loss += criterion(model(X_batch), Y_batch).item() * X_batch.size(0)
+
+    return total_loss / len(loader.dataset)
+
+
+def fit_model(model, train_loader, val_loader, device, epochs=EPOCHS, patience=PATIENCE,
+              min_delta=MIN_DELTA, lr=LEARNING_RATE, log=None):
+    """Train with early stopping; returns (best_state_dict, best_val_loss, best_epoch, epochs_run)."""
+    criterion = nn.MSELoss()
+    optimizer = torch.optim.Adam(model.parameters(), lr=lr)
+
+    best_val_loss = float("inf")
+    best_state = None
+    best_epoch = 0
+    epochs_no_improve = 0
+    epoch = 0
+
+    for epoch in range(1, epochs + 1):
+        train_loss = train_one_epoch(model, train_loader, optimizer, criterion, device)
+        val_loss = evaluate(model, val_loader, criterion, device)
+        if log:
+            log(f"Epoch {epoch:02d} | Train MSE: {train_loss:.4f} | Val MSE: {val_loss:.4f}")
+
+        if val_loss < best_val_loss - min_delta:
+            best_val_loss = val_loss
+            best_epoch = epoch
+            epochs_no_improve = 0
+            best_state = {k: v.detach().cpu().clone() for k, v in model.state_dict().items()}
+        else:
+            epochs_no_improve += 1
+
+        if epochs_no_improve >= patience:
+            break
+
+    if best_state is None:
+        # every validation loss was NaN / inf: there is no usable state to keep
+        raise RuntimeError(f"Validation loss never became finite in {epoch} epoch(s), no model to keep")
+    return best_state, best_val_loss, best_epoch, epoch
+
+
+def real_scale_mae(model, dataset, target_scalers, device):
+    """Per-target MAE in physical units, plus per-lead-day MAE of mean temperature."""
+    model.eval()
+    preds, trues = [], []
+    with torch.no_grad():
+        for X_batch, Y_batch in batch_loader(dataset, 1024, shuffle=False):
+            preds.append(model(X_batch.to(device)).cpu().numpy())
+            trues.append(Y_batch.numpy())
+
+    n_targets = len(TARGET_COLS)
+    Y_pred = inverse_scale_predictions(np.concatenate(preds), target_scalers).reshape(-1, HORIZON, n_targets)
+    Y_true = inverse_scale_predictions(np.concatenate(trues), target_scalers).reshape(-1, HORIZON, n_targets)
+    abs_err = np.abs(Y_pred - Y_true)
+
+    v_idx = TARGET_COLS.index("mean_temperature")
+    return {
+        "mae": {var: float(abs_err[:, :, j].mean()) for j, var in enumerate(TARGET_COLS)},
+        "mean_temperature_mae_by_lead_day": [float(abs_err[:, h, v_idx].mean()) for h in range(HORIZON)],
+    }
+
+
+# --------------------
+# ONE CITY (runs in a worker process)
+# --------------------
+def _init_worker(torch_threads):
+    torch.set_num_threads(torch_threads)
+
+
+def train_city(city, options):
+    t0 = time.time()
+    seed = options["seed"]
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    def log(msg):
+        print(f"[{city}] {msg}", flush=True)
+
+    dataset_dir = DATASETS_DIR / CITY_DATASETS[city]
+    df = load_gsod_history(dataset_dir, qc=options["cleaning"] == "qc")
+    df_fe = apply_feature_engineering(df)
+
+    model_config = dict(MODEL_CONFIG, **options.get("model_config", {}))
+    # ---- Windows: strided views, scalers fitted without materializing them
+    train_set, test_set, feature_scaler, target_scalers = prepare_windows(
+        df_fe, options["split_date"], model_config["lookback"]
+    )
+    log(f"windows: train {len(train_set)} | test {len(test_set)}")
+
+    generator = torch.Generator().manual_seed(seed)
+    train_loader = batch_loader(train_set, BATCH_SIZE, shuffle=True, generator=generator)
+    test_loader = batch_loader(test_set, BATCH_SIZE, shuffle=False)
+
+    model = build_model(model_config).to(device)
+    learning_rate = options.get("learning_rate", LEARNING_RATE)
+
+    best_state, best_val_loss, best_epoch, epochs_run = fit_model(
+        model, train_loader, test_loader, device,
+        epochs=options["epochs"], patience=options["patience"], lr=learning_rate,
+        log=log if options["verbose"] else None,
+    )
+    model.load_state_dict(best_state)
+    log(f"best epoch {best_epoch}/{epochs_run} | val MSE {best_val_loss:.4f}")
+
+    # ---- Write the version folder
+    city_dir = Path(options["artifacts_dir"]) / city
+    version = new_version()
+    out_dir = version_dir(city_dir, version)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    torch.save(best_state, out_dir / "best_lstm_model.pt")
+    joblib.dump({"scaler": feature_scaler, "feature_cols": FEATURE_COLS}, out_dir / "feature_scaler_bundle.pkl")
+    joblib.dump(target_scalers, out_dir / "target_scalers.pkl")
+
+    metrics = {
+        "val_mse_scaled": float(best_val_loss),
+        "best_epoch": best_epoch,
+        "epochs_run": epochs_run,
+        **real_scale_mae(model, test_set, target_scalers, device),
+    }
+    manifest = {
+        "city": city,
+        "version": version,
+        "kind": "full_train",
+        "created_at": utc_now(),
+        "model": {
+            "class": "WeatherLSTM",
+            "input_size": len(FEATURE_COLS),
+            "horizon": HORIZON,
+            "num_targets": len(TARGET_COLS),
+            **model_config,
+        },
+        "data": {
+            "source": str(dataset_dir.relative_to(MODEL_DIR)),
+            "start": df.index.min().strftime("%Y-%m-%d"),
+            "end": df.index.max().strftime("%Y-%m-%d"),
+            "rows": int(len(df)),
+            "cleaning": options["cleaning"],
+            "split_date": options["split_date"],
+            "train_windows": len(train_set),
+            "test_windows": len(test_set),
+            "input_hashes": {p.name: sha256_file(p) for p in dataset_files(dataset_dir)},
+        },
+        "training": {
+            "seed": seed,
+            "torch_threads": torch.get_num_threads(),
+            "batch_size": BATCH_SIZE,
+            "learning_rate": learning_rate,
+            "patience": options["patience"],
+            "duration_s": round(time.time() - t0, 2),
+        },
+        "metrics": metrics,
+        "files": {name: sha256_file(out_dir / name) for name in MODEL_FILES},
+    }
+    write_json_atomic(out_dir / "manifest.json", manifest)
+
+    # The cleaned history belongs to this version: the live weather.csv is only
+    # replaced together with the model, so serving never pairs old weights
+    # with new data (and a --no-promote run leaves the live folder untouched).
+    promote_files = list(MODEL_FILES)
+    if options["write_weather"]:
+        df.to_csv(out_dir / "weather.csv")
+        promote_files.append("weather.csv")
+
+    if options["promote"]:
+        promote_version(city_dir, version, manifest, files=promote_files)
+        log(f"promoted version {version}")
+    else:
+        log(f"wrote version {version} (not promoted)")
+
+    return {"city": city, "version": version, "metrics": metrics, "promoted": options["promote"]}
+
+
+# --------------------
+# MAIN (CLI)
+# --------------------
+def main():
+    parser = argparse.ArgumentParser(description="Train WeatherLSTM for every city in parallel")
+    parser.add_argument("--cities", nargs="+", default=sorted(CITY_DATASETS),
+                        help=f"Cities to train (default: all of {sorted(CITY_DATASETS)})")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Parallel city trainings (default: min(#cities, CPU cores / threads))")
+    parser.add_argument("--threads-per-worker", type=int, default=1,
+                        help="torch intra-op threads per training process")
+    parser.add_argument("--artifacts-dir", type=Path, default=ARTIFACTS_DIR)
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--patience", type=int, default=PATIENCE)
+    parser.add_argument("--split-date", default=SPLIT_DATE)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-promote", action="store_true",
+                        help="Only write versions/<version>/, keep the live artifacts untouched")
+    parser.add_argument("--config", type=Path,
+                        help="JSON with the model/training config to train (e.g. exported by sweep.py)")
+    parser.add_argument("--cleaning", choices=["qc", "notebook"], default="qc",
+                        help="knowledge_system.qc (default) or the notebook's exact cleaning steps")
+    parser.add_argument("--write-weather", action="store_true",
+                        help="Also write the cleaned GSOD history as the version's weather.csv "
+                             "(it replaces the live one only when the version is promoted)")
+    parser.add_argument("--verbose", action="store_true", help="Log every epoch")
+    args = parser.parse_args()
+
+    unknown = [c for c in args.cities if c not in CITY_DATASETS]
+    if unknown:
+        raise ValueError(f"Unknown cities {unknown}. Available: {sorted(CITY_DATASETS)}")
+
+    cpu = os.cpu_count() or 1
+    workers = args.workers or max(1, min(len(args.cities), cpu // args.threads_per_worker))
+    options = {
+        "artifacts_dir": str(args.artifacts_dir),
+        "epochs": args.epochs,
+        "patience": args.patience,
+        "split_date": args.split_date,
+        "seed": args.seed,
+        "promote": not args.no_promote,
+        "write_weather": args.write_weather,
+        "cleaning": args.cleaning,
+        "verbose": args.verbose,
+    }
+    if args.config:
+        model_config, training = read_config_file(args.config)
+        options["model_config"] = model_config
+        if "learning_rate" in training:
+            options["learning_rate"] = training["learning_rate"]
+
+    print(f"[INFO] Training {args.cities} with {workers} worker(s) x {args.threads_per_worker} thread(s)")
+    failures = 0
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(args.threads_per_worker,),
+    ) as pool:
+        futures = {pool.submit(train_city, city, options): city for city in args.cities}
+        for future in as_completed(futures):
+            city = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"[ERROR] {city}: {e!r}")
+                continue
+            mae = result["metrics"]["mae"]["mean_temperature"]
+            print(f"[OK] {city} -> {result['version']} (mean_temperature MAE {mae:.2f} °C)")
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
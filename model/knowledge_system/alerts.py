@@ -0,0 +1,609 @@
+"""
+Webhook alerts for the extreme events of the served forecasts.
+
+Every forecast the backend serves goes through AlertDispatcher.publish,
+which diffs its events against the set last published for the city
+(published/<city>.json) and emits only the changes:
+    new         an (event_id, date) that was not published
+    escalated   a published one whose severity went up
+    cleared     a published one that is gone while its date is still in the
+                forecast horizon (days that left the horizon just expire)
+A severity going down updates the published set without an alert. The diff
+runs under an exclusive flock on the city, so with several workers each
+change is emitted once; a process skips it altogether while the event set
+of a city is the one it last saw.
+
+Changes are fanned out to the subscriptions (subscriptions.json) whose
+cities, categories and minimum severity match. The table is indexed by
+(city or "*", category or "*"), each bucket sorted by minimum severity, so
+matching an alert is four bisects plus the matching subscriptions, however
+many subscriptions there are.
+
+Each subscription gets one outbox entry per publish (outbox/*.json, written
+atomically before the published set is updated: a crash resends rather than
+loses). The delivery loop (AlertDispatcher.run, an asyncio task of the
+backend) POSTs the due entries of a subscription together, up to BATCH_MAX
+alerts per request, through one pooled httpx.AsyncClient. A 2xx deletes
+them. Timeouts, connection errors, 408, 429 and 5xx are retried with
+exponential backoff and jitter, up to MAX_ATTEMPTS. Other 4xx, or the last
+attempt, move the entry to dead/. A subscriber gets its alerts in publish
+order: while an entry backs off, the later entries of its subscription wait
+behind it. Only one process delivers at a time (a non-blocking flock on the
+outbox), the others keep writing entries.
+
+Webhook body:
+    {"batch_id": "...", "alerts": [{"alert_id", "change", "city", "date",
+      "event_id", "type", "category", "severity", "previous_severity",
+      "description", "issued_at", "input_version"}, ...]}
+alert_id is stable for a given change of a given forecast, so receivers can
+drop the duplicates of at-least-once delivery.
+
+A local stand-in for a webhook receiver, to try subscriptions and retries:
+    python -m knowledge_system.alerts sink --port 9100 [--fail-first 2]
+(with ALERT_WEBHOOK_ALLOW_HOSTS=127.0.0.1: webhooks on loopback, private or
+link-local addresses are refused otherwise, see check_webhook_url).
+ALERT_DIR="" turns alerts off.
+"""
+import argparse
+import asyncio
+import bisect
+import contextlib
+import fcntl
+import hashlib
+import ipaddress
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import urllib.parse
+import uuid
+from pathlib import Path
+
+from knowledge_system import metrics
+from knowledge_system.catalog import ARTIFACTS_DIR
+from knowledge_system.predict_extreme import SEVERITY_RANKS
+from knowledge_system.shared_store import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+ALERT_DIR = os.getenv("ALERT_DIR", str(ARTIFACTS_DIR / "_alerts"))
+BATCH_MAX = int(os.getenv("ALERT_BATCH_MAX", "100"))
+MAX_ATTEMPTS = int(os.getenv("ALERT_MAX_ATTEMPTS", "8"))
+BACKOFF_BASE_SECONDS = float(os.getenv("ALERT_BACKOFF_SEC", "2"))
+BACKOFF_MAX_SECONDS = float(os.getenv("ALERT_BACKOFF_MAX_SEC", "600"))
+POLL_SECONDS = float(os.getenv("ALERT_POLL_SEC", "1"))
+TIMEOUT_SECONDS = float(os.getenv("ALERT_TIMEOUT_SEC", "10"))
+MAX_CONNECTIONS = int(os.getenv("ALERT_MAX_CONNECTIONS", "20"))
+# host names or networks a webhook may point at although they are not public
+# (an internal receiver, 127.0.0.1 for the local sink): "hooks.internal,10.2.0.0/16"
+WEBHOOK_ALLOW_HOSTS = tuple(
+    h.strip().lower() for h in os.getenv("ALERT_WEBHOOK_ALLOW_HOSTS", "").split(",") if h.strip()
+)
+OUTBOX_SCAN_MAX = 1000          # entries read per delivery pass
+RETRYABLE_STATUS = {408, 429}
+
+ALERTS_EMITTED = metrics.counter(
+    "alerts_emitted_total",
+    "Event changes emitted to the alert subscribers, by change (new, escalated, cleared)",
+    labelnames=("change",),
+)
+DELIVERIES = metrics.counter(
+    "alert_deliveries_total",
+    "Outbox entries by delivery outcome (delivered, retried, dead, dropped)",
+    labelnames=("outcome",),
+)
+DELIVERY_SECONDS = metrics.histogram(
+    "alert_delivery_seconds",
+    "Duration of one webhook POST",
+)
+
+
+@contextlib.contextmanager
+def _flock(path, flags=fcntl.LOCK_EX):
+    with open(path, "a") as f:
+        fcntl.flock(f, flags)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# --------------------
+# Event diff
+# --------------------
+def published_events(result):
+    """{"event_id|date": event} of a forecast result (its detailed events)."""
+    summary = result["events"][0] if result.get("events") else {}
+    return {
+        f"{event['event_id']}|{event['date']}": {
+            "event_id": event["event_id"],
+            "date": event["date"],
+            "type": event["type"],
+            "category": event["category"],
+            "severity": event["severity"],
+            "description": event["description"],
+        }
+        for event in summary.get("detailed_events", ())
+    }
+
+
+def event_changes(previous, current, horizon_start):
+    """[(change, event, previous severity)] between two published event sets."""
+    changes = []
+    for key, event in current.items():
+        before = previous.get(key)
+        if before is None:
+            changes.append(("new", event, None))
+        elif SEVERITY_RANKS[event["severity"]] > SEVERITY_RANKS[before["severity"]]:
+            changes.append(("escalated", event, before["severity"]))
+    for key, event in previous.items():
+        # streak events are dated "first to last": compare their first day
+        if key not in current and event["date"][:10] >= horizon_start:
+            changes.append(("cleared", event, event["severity"]))
+    return changes
+
+
+# --------------------
+# Subscriptions
+# --------------------
+def _allowed_host(host, addresses):
+    networks = []
+    for entry in WEBHOOK_ALLOW_HOSTS:
+        if entry == host:
+            return True
+        with contextlib.suppress(ValueError):
+            networks.append(ipaddress.ip_network(entry, strict=False))
+    return all(any(address in network for network in networks) for address in addresses)
+
+
+def check_webhook_url(url):
+    """
+    Raise ValueError unless url is a valid http(s) URL whose host resolves
+    only to public addresses. The backend POSTs to every subscription, so one
+    must not reach loopback, private or link-local services (SSRF) unless the
+    host or its network is in ALERT_WEBHOOK_ALLOW_HOSTS. Checked when the
+    subscription is added; deliveries do not follow redirects.
+    """
+    import httpx
+
+    try:
+        httpx.URL(url)          # what the delivery will parse
+    except httpx.InvalidURL as exc:
+        raise ValueError(f"Webhook URL {url!r} is invalid: {exc}") from None
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError(f"Webhook URL {url!r} must be http(s)://host/...")
+    host = parts.hostname.lower()
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except ValueError as exc:       # port out of range or not a number
+        raise ValueError(f"Webhook URL {url!r}: {exc}") from None
+    except socket.gaierror as exc:
+        raise ValueError(f"Webhook host {host!r} does not resolve: {exc}") from None
+
+    addresses = set()
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        addresses.add(address)
+    if _allowed_host(host, addresses):
+        return
+    for address in sorted(addresses, key=str):
+        if not address.is_global or address.is_multicast:
+            raise ValueError(
+                f"Webhook host {host!r} resolves to the non-public address {address}; "
+                "list it in ALERT_WEBHOOK_ALLOW_HOSTS to allow it"
+            )
+
+
+class SubscriptionTable:
+    """
+    subscriptions.json, reloaded when another process changed it, with the
+    (city, category) -> subscriptions-by-minimum-severity index.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._mtime = None
+        self._by_id = {}
+        self._index = {}            # (city | "*", category | "*") -> ([min ranks], [subscriptions])
+        self._lock = threading.Lock()
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        subscriptions = json.loads(self.path.read_text(encoding="utf-8")) if mtime else []
+        buckets = {}
+        for sub in subscriptions:
+            for city in sub["cities"] or ("*",):
+                for category in sub["categories"] or ("*",):
+                    buckets.setdefault((city, category), []).append(sub)
+        index = {}
+        for key, subs in buckets.items():
+            subs.sort(key=lambda s: SEVERITY_RANKS[s["min_severity"]])
+            index[key] = ([SEVERITY_RANKS[s["min_severity"]] for s in subs], subs)
+        self._by_id = {sub["id"]: sub for sub in subscriptions}
+        self._index = index
+        self._mtime = mtime
+
+    def all(self):
+        with self._lock:
+            self._reload()
+            return list(self._by_id.values())
+
+    def get(self, subscription_id):
+        with self._lock:
+            self._reload()
+            return self._by_id.get(subscription_id)
+
+    def match(self, city, category, severity):
+        """Subscriptions that want an alert of this city, category and severity."""
+        rank = SEVERITY_RANKS[severity]
+        with self._lock:
+            self._reload()
+            index = self._index
+        matched = []
+        for key in ((city, category), (city, "*"), ("*", category), ("*", "*")):
+            bucket = index.get(key)
+            if bucket is not None:
+                matched.extend(bucket[1][:bisect.bisect_right(bucket[0], rank)])
+        return matched
+
+    def _modify(self, change):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with _flock(self.path.with_name(f".{self.path.name}.lock")):
+            subscriptions = json.loads(self.path.read_text(encoding="utf-8")) if self.path.exists() else []
+            subscriptions, result = change(subscriptions)
+            atomic_write_json(self.path, subscriptions)
+        return result
+
+    def add(self, url, cities=None, categories=None, min_severity="HIGH"):
+        if min_severity not in SEVERITY_RANKS:
+            raise ValueError(f"min_severity {min_severity!r} is not one of {list(SEVERITY_RANKS)}")
+        check_webhook_url(url)
+        sub = {
+            "id": uuid.uuid4().hex[:12],
+            "url": url,
+            "cities": sorted({c.strip().lower() for c in cities}) if cities else None,
+            "categories": sorted(set(categories)) if categories else None,
+            "min_severity": min_severity,
+            "created_at": int(time.time()),
+        }
+        return self._modify(lambda subs: (subs + [sub], sub))
+
+    def remove(self, subscription_id):
+        def change(subs):
+            kept = [s for s in subs if s["id"] != subscription_id]
+            return kept, len(kept) != len(subs)
+        return self._modify(change)
+
+
+# --------------------
+# Outbox
+# --------------------
+def backoff_seconds(attempts):
+    """Delay before retry number `attempts` (1, 2, ...): exponential, capped, half jittered."""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * (0.5 + random.random() / 2)
+
+
+class Outbox:
+    """One JSON file per pending delivery (outbox/), failed ones in dead/."""
+
+    def __init__(self, root):
+        self.dir = Path(root) / "outbox"
+        self.dead_dir = Path(root) / "dead"
+
+    def put(self, subscription_id, alerts):
+        self.dir.mkdir(parents=True, exist_ok=True)
+        entry = {
+            "subscription_id": subscription_id,
+            "alerts": alerts,
+            "attempts": 0,
+            "next_attempt": 0.0,
+            "created_at": time.time(),
+        }
+        atomic_write_json(self.dir / f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.json", entry)
+
+    def pending(self):
+        try:
+            return sum(1 for name in os.listdir(self.dir) if name.endswith(".json") and not name.startswith("."))
+        except FileNotFoundError:
+            return 0
+
+    def due(self, now=None, limit=OUTBOX_SCAN_MAX):
+        """
+        [(path, entry)] of the entries whose next attempt has come, oldest
+        first. An entry still backing off holds back the later entries of its
+        subscription, so a subscriber never gets newer alerts before older ones.
+        """
+        now = time.time() if now is None else now
+        try:
+            names = sorted(n for n in os.listdir(self.dir) if n.endswith(".json") and not n.startswith("."))
+        except FileNotFoundError:
+            return []
+        out, waiting = [], set()
+        for name in names[:limit]:
+            path = self.dir / name
+            try:
+                entry = json.loads(path.read_text(encoding="utf-8"))
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+            if entry["subscription_id"] in waiting:
+                continue
+            if entry["next_attempt"] <= now:
+                out.append((path, entry))
+            else:
+                waiting.add(entry["subscription_id"])
+        return out
+
+    def delivered(self, path):
+        with contextlib.suppress(FileNotFoundError):
+            path.unlink()
+
+    def failed(self, path, entry, error, retryable=True):
+        """Schedule the next attempt of an entry, or move it to dead/. Returns the outcome."""
+        entry = {**entry, "attempts": entry["attempts"] + 1, "last_error": error}
+        if not retryable or entry["attempts"] >= MAX_ATTEMPTS:
+            self.dead_dir.mkdir(parents=True, exist_ok=True)
+            atomic_write_json(self.dead_dir / path.name, entry)
+            self.delivered(path)
+            return "dead"
+        entry["next_attempt"] = time.time() + backoff_seconds(entry["attempts"])
+        atomic_write_json(path, entry)
+        return "retried"
+
+
+# --------------------
+# Dispatcher
+# --------------------
+class AlertDispatcher:
+    """Diff, fan-out and delivery of the alerts (see the module docstring)."""
+
+    def __init__(self, root=ALERT_DIR):
+        self.root = Path(root)
+        self.subscriptions = SubscriptionTable(self.root / "subscriptions.json")
+        self.outbox = Outbox(self.root)
+        self._seen = {}             # city -> event set this process last published or found published
+        self._loop = None
+        self._wake = None
+
+    # ---- publishing
+    def _published_path(self, city):
+        return self.root / "published" / f"{city}.json"
+
+    def publish(self, city, result):
+        """Emit the event changes of a forecast result; returns the changes."""
+        current = published_events(result)
+        if self._seen.get(city) == current:
+            return []
+        path = self._published_path(city)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        metadata = result.get("metadata", {})
+        issued_at = metadata.get("generated_at")
+        version = metadata.get("input_version")
+        per_subscription = {}
+        with _flock(path.with_name(f".{path.name}.lock")):
+            previous = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+            changes = event_changes(previous, current, result["forecast"][0]["date"]) if result.get("forecast") else []
+
+            for change, event, previous_severity in changes:
+                alert = {
+                    "alert_id": hashlib.sha1(
+                        f"{city}|{event['event_id']}|{event['date']}|{change}|{event['severity']}|{version or issued_at}"
+                        .encode()
+                    ).hexdigest()[:16],
+                    "change": change,
+                    "city": city,
+                    **event,
+                    "previous_severity": previous_severity,
+                    "issued_at": issued_at,
+                    "input_version": version,
+                }
+                ALERTS_EMITTED.inc(change=change)
+                # a cleared event keeps its last severity
+                for sub in self.subscriptions.match(city, event["category"], event["severity"]):
+                    per_subscription.setdefault(sub["id"], []).append(alert)
+            for subscription_id, alerts in per_subscription.items():
+                self.outbox.put(subscription_id, alerts)
+            if current != previous:
+                atomic_write_json(path, current)
+        self._seen[city] = current
+        if per_subscription:
+            self.wake()
+        return changes
+
+    # ---- delivery
+    def wake(self):
+        """Start a delivery pass now instead of at the next poll (thread-safe)."""
+        if self._loop is not None and self._wake is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    async def _post(self, client, url, alerts):
+        """(delivered, error, retryable) of one webhook POST."""
+        import httpx
+
+        body = {"batch_id": uuid.uuid4().hex, "alerts": alerts}
+        t0 = time.perf_counter()
+        try:
+            response = await client.post(url, json=body)
+        except (httpx.InvalidURL, httpx.UnsupportedProtocol) as exc:
+            # a malformed URL fails the same way on every attempt
+            return False, f"{type(exc).__name__}: {exc}", False
+        except Exception as exc:        # timeouts, refused connections
+            return False, f"{type(exc).__name__}: {exc}", True
+        finally:
+            DELIVERY_SECONDS.observe(time.perf_counter() - t0)
+        if 200 <= response.status_code < 300:
+            return True, None, False
+        retryable = response.status_code >= 500 or response.status_code in RETRYABLE_STATUS
+        return False, f"HTTP {response.status_code}", retryable
+
+    async def _deliver_subscription(self, client, semaphore, sub, entries):
+        # batches of whole entries, up to BATCH_MAX alerts each
+        batches, batch, size = [], [], 0
+        for path, entry in entries:
+            if batch and size + len(entry["alerts"]) > BATCH_MAX:
+                batches.append(batch)
+                batch, size = [], 0
+            batch.append((path, entry))
+            size += len(entry["alerts"])
+        if batch:
+            batches.append(batch)
+
+        delivered = 0
+        for batch in batches:
+            async with semaphore:
+                ok, error, retryable = await self._post(
+                    client, sub["url"], [alert for _, entry in batch for alert in entry["alerts"]]
+                )
+            for path, entry in batch:
+                if ok:
+                    self.outbox.delivered(path)
+                    DELIVERIES.inc(outcome="delivered")
+                    delivered += 1
+                else:
+                    DELIVERIES.inc(outcome=self.outbox.failed(path, entry, error, retryable))
+            if not ok:
+                logger.warning("Alert delivery to %s failed: %s", sub["url"], error)
+                break           # the rest waits behind the failed batch (see Outbox.due)
+        return delivered
+
+    async def deliver_once(self, client):
+        """One pass over the due outbox entries; returns the entries delivered."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with open(self.root / ".delivery.lock", "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0        # another process is delivering
+            try:
+                by_subscription = {}
+                for path, entry in self.outbox.due():
+                    by_subscription.setdefault(entry["subscription_id"], []).append((path, entry))
+                semaphore = asyncio.Semaphore(MAX_CONNECTIONS)
+                tasks = []
+                for subscription_id, entries in by_subscription.items():
+                    sub = self.subscriptions.get(subscription_id)
+                    if sub is None:
+                        # unsubscribed since: nothing to deliver to
+                        for path, _ in entries:
+                            self.outbox.delivered(path)
+                            DELIVERIES.inc(outcome="dropped")
+                        continue
+                    tasks.append(self._deliver_subscription(client, semaphore, sub, entries))
+                return sum(await asyncio.gather(*tasks))
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @staticmethod
+    def client():
+        import httpx
+
+        return httpx.AsyncClient(
+            timeout=TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS),
+            headers={"User-Agent": "weather-alerts/1.0"},
+        )
+
+    async def run(self, poll_seconds=POLL_SECONDS):
+        """Deliver the outbox until cancelled: every poll_seconds, or right after a publish."""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        async with self.client() as client:
+            while True:
+                try:
+                    await self.deliver_once(client)
+                except Exception:
+                    logger.exception("Alert delivery pass failed")
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wake.wait(), poll_seconds)
+                self._wake.clear()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def alert_dispatcher():
+    """The process-wide AlertDispatcher, or None when alerts are off."""
+    global _dispatcher
+    if not ALERT_DIR:
+        return None
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = AlertDispatcher(ALERT_DIR)
+    return _dispatcher
+
+
+def publish_alerts(city, result):
+    """Emit the event changes of a served forecast; never raises (alerts must not fail a request)."""
+    dispatcher = alert_dispatcher()
+    if dispatcher is None:
+        return []
+    try:
+        return dispatcher.publish(city, result)
+    except Exception:
+        logger.exception("Publishing the alerts of %s failed", city)
+        return []
+
+
+OUTBOX_PENDING = metrics.gauge(
+    "alert_outbox_pending",
+    "Alert deliveries waiting in the outbox",
+    callback=lambda: _dispatcher.outbox.pending() if _dispatcher is not None else 0,
+)
+
+
+# --------------------
+# Local webhook stand-in
+# --------------------
+def run_sink(port, fail_first=0):
+    """Print the batches POSTed to http://127.0.0.1:<port>/; answer 503 to the first `fail_first`."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    state = {"requests": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            state["requests"] += 1
+            status = 503 if state["requests"] <= fail_first else 200
+            self.send_response(status)
+            self.end_headers()
+            alerts = body.get("alerts", [])
+            print(f"[{status}] batch {body.get('batch_id')}: {len(alerts)} alert(s)")
+            for alert in alerts:
+                print(f"    {alert['change']:<9} {alert['city']} {alert['date']} {alert['event_id']} ({alert['severity']})")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"[OK] Webhook stand-in on http://127.0.0.1:{port}/")
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Alert dispatcher tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sink = sub.add_parser("sink", help="Local webhook receiver printing the alerts it gets")
+    sink.add_argument("--port", type=int, default=9100)
+    sink.add_argument("--fail-first", type=int, default=0, help="Answer 503 to the first N requests")
+    args = parser.parse_args()
+    if args.command == "sink":
+        run_sink(args.port, args.fail_first)
+
+
+if __name__ == "__main__":
+    main()
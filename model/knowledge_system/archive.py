@@ -0,0 +1,247 @@
+"""
+Append-only archive of every distinct forecast, for verification
+(knowledge_system/verification.py).
+
+One binary file per city, <FORECAST_ARCHIVE_DIR>/<city>.bin, of fixed-size
+records (RECORD_DTYPE, 336 bytes):
+    issue_day       last observed day the forecast starts from (days since 1970-01-01)
+    archived_at     unix time the record was written
+    input_version   watcher.input_version of the inputs (dedup key)
+    values          (HORIZON, len(VARIABLES)) float32 forecast values
+    events          (HORIZON, EVENT_WORDS) uint64 bitmasks of the fired event_ids
+
+A forecast is archived once per input version: the same model and history
+always give the same forecast, so recomputations (restarts, other workers,
+rule reloads) add nothing. Event ids are mapped to bits by an append-only
+registry (event_ids.json) shared by all cities. Appends take an exclusive
+flock on the city file, so several workers can archive concurrently; each
+process only reads the records appended since its last look to keep its
+dedup set current; a torn record left at the end by an interrupted write is
+truncated by the next append. Records are appended in issue-day order (up to a few days
+of disorder after a history is cut back), so reading the records of recent
+issue days only reads the end of the file.
+
+The archive lives next to the artifacts (artifacts/_archive by default,
+ignored by the catalog), so the nightly ingestion container can verify it.
+FORECAST_ARCHIVE_DIR="" turns archiving off.
+"""
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+
+from knowledge_system.catalog import ARTIFACTS_DIR
+from knowledge_system.qc import VALUE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.getenv("FORECAST_ARCHIVE_DIR", str(ARTIFACTS_DIR / "_archive"))
+HORIZON = 7
+VARIABLES = tuple(VALUE_COLUMNS)
+EVENT_WORDS = 2                 # up to 128 distinct event ids
+EVENT_IDS_FILE = "event_ids.json"
+SCAN_CHUNK_RECORDS = 4096       # records per backward read step of records(since_issue_day=...)
+
+RECORD_DTYPE = np.dtype([
+    ("issue_day", "<i4"),
+    ("archived_at", "<i8"),
+    ("input_version", "S16"),
+    ("values", "<f4", (HORIZON, len(VARIABLES))),
+    ("events", "<u8", (HORIZON, EVENT_WORDS)),
+])
+
+EPOCH = date(1970, 1, 1)
+
+
+def day_number(iso_date):
+    return (date.fromisoformat(iso_date[:10]) - EPOCH).days
+
+
+def day_string(number):
+    return date.fromordinal(EPOCH.toordinal() + int(number)).isoformat()
+
+
+class ForecastArchive:
+    """The archive directory (see the module docstring)."""
+
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = Path(root)
+        self._event_ids = []
+        self._event_ids_mtime = None
+        self._seen = {}             # city -> (bytes read, {input_version})
+        self._lock = threading.Lock()
+
+    def path(self, city):
+        return self.root / f"{city}.bin"
+
+    # --------------------
+    # Event id registry
+    # --------------------
+    def _registry_path(self):
+        return self.root / EVENT_IDS_FILE
+
+    def _reload_event_ids(self):
+        path = self._registry_path()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._event_ids_mtime:
+            self._event_ids = json.loads(path.read_text(encoding="utf-8"))
+            self._event_ids_mtime = mtime
+
+    def event_ids(self):
+        """Registered event ids; the bit of an id is its position."""
+        self._reload_event_ids()
+        return list(self._event_ids)
+
+    def event_bits(self, event_ids):
+        """{event_id: bit}, registering the ids seen for the first time."""
+        self._reload_event_ids()
+        missing = set(event_ids) - set(self._event_ids)
+        if missing:
+            self.root.mkdir(parents=True, exist_ok=True)
+            with open(self.root / f".{EVENT_IDS_FILE}.lock", "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                self._reload_event_ids()
+                new_ids = sorted(set(event_ids) - set(self._event_ids))
+                if new_ids:
+                    if len(self._event_ids) + len(new_ids) > EVENT_WORDS * 64:
+                        raise ValueError(f"more than {EVENT_WORDS * 64} distinct event ids, raise EVENT_WORDS")
+                    registry = self._registry_path()
+                    tmp = registry.with_name(f".{EVENT_IDS_FILE}.tmp")
+                    tmp.write_text(json.dumps(self._event_ids + new_ids), encoding="utf-8")
+                    os.replace(tmp, registry)
+                    self._reload_event_ids()
+        position = {event_id: bit for bit, event_id in enumerate(self._event_ids)}
+        return {event_id: position[event_id] for event_id in event_ids}
+
+    def event_mask(self, event_ids):
+        """(EVENT_WORDS,) uint64 bitmask of a set of event ids."""
+        mask = np.zeros(EVENT_WORDS, dtype=np.uint64)
+        for bit in self.event_bits(event_ids).values():
+            mask[bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+        return mask
+
+    # --------------------
+    # Records
+    # --------------------
+    def to_record(self, result):
+        """One RECORD_DTYPE record of a run_forecast result (with metadata.input_version)."""
+        forecast = result["forecast"][:HORIZON]
+        record = np.zeros((), dtype=RECORD_DTYPE)
+        record["issue_day"] = day_number(forecast[0]["date"]) - 1
+        record["archived_at"] = int(time.time())
+        record["input_version"] = result["metadata"]["input_version"].encode()
+        record["values"][:] = np.nan
+        for lead, day in enumerate(forecast):
+            record["values"][lead] = [day[var]["value"] for var in VARIABLES]
+            fired = {event["event_id"] for event in day.get("events", ())}
+            if fired:
+                record["events"][lead] = self.event_mask(fired)
+        return record
+
+    def _catch_up(self, city, f):
+        """Update the dedup set of a city with the records appended since the last look."""
+        read, versions = self._seen.get(city, (0, set()))
+        size = os.fstat(f.fileno()).st_size
+        torn = size % RECORD_DTYPE.itemsize
+        if torn:
+            # a write cut short (crash, full disk): drop the partial record, under
+            # the caller's flock, so appends go on from a record boundary
+            logger.warning("Dropping a torn %d-byte record at the end of %s", torn, self.path(city))
+            size -= torn
+            f.truncate(size)
+        if size > read:
+            f.seek(read)
+            new = np.frombuffer(f.read(size - read), dtype=RECORD_DTYPE)
+            versions.update(new["input_version"].tolist())
+            read = size
+        self._seen[city] = (read, versions)
+        return versions
+
+    def append(self, city, result):
+        """Archive a forecast result; False when its input version is already archived."""
+        version = result["metadata"].get("input_version")
+        if not version:
+            return False
+        seen = self._seen.get(city)
+        if seen is not None and version.encode() in seen[1]:
+            return False
+
+        record = self.to_record(result)
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.path(city), "a+b") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                versions = self._catch_up(city, f)
+                if version.encode() in versions:
+                    return False
+                f.seek(0, os.SEEK_END)
+                f.write(record.tobytes())
+                f.flush()
+                versions.add(version.encode())
+                self._seen[city] = (self._seen[city][0] + RECORD_DTYPE.itemsize, versions)
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return True
+
+    def records(self, city, since_issue_day=None):
+        """
+        The archived records of a city (issue_day >= since_issue_day), in
+        append order. With since_issue_day the file is read backwards by
+        SCAN_CHUNK_RECORDS, stopping at the first chunk entirely older: the
+        cost follows the records asked for, not the size of the archive.
+        """
+        path = self.path(city)
+        count = path.stat().st_size // RECORD_DTYPE.itemsize if path.exists() else 0
+        if not count:
+            return np.zeros(0, dtype=RECORD_DTYPE)
+        records = np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+        if since_issue_day is None:
+            return np.array(records)
+        start = count
+        while start > 0:
+            low = max(0, start - SCAN_CHUNK_RECORDS)
+            if records["issue_day"][low:start].max() < since_issue_day:
+                break
+            start = low
+        tail = np.array(records[start:])
+        return tail[tail["issue_day"] >= since_issue_day]
+
+    def cities(self):
+        return sorted(p.stem for p in self.root.glob("*.bin"))
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def forecast_archive():
+    """The process-wide ForecastArchive, or None when archiving is off."""
+    global _archive
+    if not ARCHIVE_DIR:
+        return None
+    if _archive is None:
+        with _archive_lock:
+            if _archive is None:
+                _archive = ForecastArchive(ARCHIVE_DIR)
+    return _archive
+
+
+def archive_forecast(city, result):
+    """Archive a served forecast; never raises (archiving must not fail a request)."""
+    archive = forecast_archive()
+    if archive is None:
+        return False
+    try:
+        return archive.append(city, result)
+    except Exception:
+        logger.exception("Archiving the forecast of %s failed", city)
+        return False
@@ -0,0 +1,304 @@
+"""
+City catalog and resident artifact set, for serving every station with a
+trained model without keeping all of them in memory.
+
+Catalog (CityCatalog): one entry per folder of knowledge_system/artifacts/
+and per station of retrieve_data/locations.json. A city is servable when its
+folder holds a model (best_lstm_model.pt); its coordinates come from
+locations.json. The catalog is rescanned when the artifacts directory or
+locations.json changes, or while some folder still waits for its model,
+checked at most every CATALOG_CHECK_SEC seconds. Listing it only stats
+folders, it never loads a model.
+
+Residency (ResidentArtifacts): a city's model, scalers and weather history
+are loaded on first use (run_forecast.load_artifacts, or
+SharedStore.attach_artifacts in shared mode) and kept in an LRU bounded by
+a memory budget (FORECAST_MODEL_MEMORY_MB, counting model tensors and
+DataFrames). Loading past the budget evicts the least recently used cities.
+An entry is reloaded when one of its files changes, like the inference
+workers do; concurrent first requests for a city share one load.
+
+This module only needs the standard library at import time, so the data
+producer can read the catalog without torch.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from types import MappingProxyType
+from typing import NamedTuple, Optional
+
+from knowledge_system import metrics
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = Path(__file__).resolve().parent.parent                 # model/
+ARTIFACTS_DIR = MODEL_DIR / "knowledge_system" / "artifacts"
+LOCATIONS_PATH = Path(os.getenv("WEATHER_LOCATIONS_PATH", MODEL_DIR / "retrieve_data" / "locations.json"))
+MODEL_FILE = "best_lstm_model.pt"
+
+CATALOG_CHECK_INTERVAL_SECONDS = float(os.getenv("CATALOG_CHECK_SEC", "5"))
+MEMORY_BUDGET_BYTES = int(float(os.getenv("FORECAST_MODEL_MEMORY_MB", "512")) * 1024 * 1024)
+
+ARTIFACT_LOAD_SECONDS = metrics.histogram(
+    "artifact_load_seconds",
+    "Time to load a city's model, scalers and history on first use",
+    labelnames=("city",),
+)
+RESIDENT_REQUESTS = metrics.counter(
+    "resident_artifacts_requests_total",
+    "Resident artifact lookups by result (hit, miss, reload, evict)",
+    labelnames=("result",),
+)
+
+
+# --------------------
+# Catalog
+# --------------------
+class City(NamedTuple):
+    name: str
+    path: Path                  # artifacts/<name>
+    latitude: Optional[float]
+    longitude: Optional[float]
+    has_model: bool
+
+
+def load_locations(path=LOCATIONS_PATH):
+    """locations.json as {name: (latitude, longitude)}; {} when missing."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return {
+        name: (float(coords["LATITUDE"]), float(coords["LONGITUDE"]))
+        for name, coords in raw.items()
+    }
+
+
+def discover_cities(artifacts_dir=ARTIFACTS_DIR, locations_path=LOCATIONS_PATH):
+    """{name: City} for every artifact folder and every station of locations.json."""
+    artifacts_dir = Path(artifacts_dir)
+    folders = {}
+    try:
+        with os.scandir(artifacts_dir) as it:
+            for entry in it:
+                if entry.is_dir() and not entry.name.startswith((".", "_")):
+                    folders[entry.name] = os.path.exists(os.path.join(entry.path, MODEL_FILE))
+    except FileNotFoundError:
+        pass
+
+    locations = load_locations(locations_path)
+    cities = {}
+    for name in sorted(set(folders) | set(locations)):
+        latitude, longitude = locations.get(name, (None, None))
+        cities[name] = City(name, artifacts_dir / name, latitude, longitude, folders.get(name, False))
+    return cities
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class CityCatalog:
+    """Self-refreshing view of discover_cities (see the module docstring)."""
+
+    def __init__(self, artifacts_dir=ARTIFACTS_DIR, locations_path=LOCATIONS_PATH,
+                 check_interval=CATALOG_CHECK_INTERVAL_SECONDS):
+        self.artifacts_dir = Path(artifacts_dir)
+        self.locations_path = Path(locations_path)
+        self.check_interval = check_interval
+        self._cities = MappingProxyType({})
+        self._signature = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def _current_signature(self):
+        return _mtime_ns(self.artifacts_dir), _mtime_ns(self.locations_path)
+
+    def cities(self):
+        """Read-only {name: City}, rescanned when needed."""
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_interval:
+            return self._cities
+        with self._lock:
+            if self._checked_at is None or now - self._checked_at >= self.check_interval:
+                signature = self._current_signature()
+                # a folder created before its model file does not change the directory mtime
+                pending = any(city.path.is_dir() and not city.has_model for city in self._cities.values())
+                if signature != self._signature or pending:
+                    self._cities = MappingProxyType(discover_cities(self.artifacts_dir, self.locations_path))
+                    self._signature = signature
+                self._checked_at = now
+        return self._cities
+
+    def get(self, name):
+        return self.cities().get(name)
+
+    def servable(self):
+        """Cities with a trained model, by name."""
+        return {name: city for name, city in self.cities().items() if city.has_model}
+
+
+# --------------------
+# Resident artifacts
+# --------------------
+def artifacts_nbytes(artifacts):
+    """Approximate memory of a loaded artifact dict: model tensors + DataFrames."""
+    import pandas as pd
+
+    total = 0
+    model = artifacts.get("model")
+    if model is not None:
+        for tensor in list(model.parameters()) + list(model.buffers()):
+            total += tensor.numel() * tensor.element_size()
+    for value in artifacts.values():
+        if isinstance(value, pd.DataFrame):
+            total += int(value.memory_usage(index=True).sum())
+    return total
+
+
+def load_city_artifacts(artifact_path):
+    """Load one city the way run_forecast does (shared plane when enabled)."""
+    from knowledge_system.run_forecast import load_artifacts
+    from knowledge_system.shared_store import get_shared_store
+
+    store = get_shared_store()
+    return store.attach_artifacts(artifact_path) if store else load_artifacts(artifact_path)
+
+
+def release_city_caches(artifact_path):
+    """Drop the other per-city caches tied to an evicted city."""
+    from knowledge_system import climatology, history
+    from knowledge_system.shared_store import get_shared_store
+
+    store = get_shared_store()
+    if store is not None:
+        store.detach_artifacts(artifact_path)
+    climatology.forget(artifact_path)
+    history.forget(artifact_path)
+
+
+class ResidentArtifacts:
+    """
+    LRU of loaded artifact dicts keyed by artifact folder, bounded by
+    `budget_bytes` (see the module docstring). The most recently loaded city
+    is always kept, even when it alone exceeds the budget.
+    """
+
+    def __init__(self, loader=load_city_artifacts, budget_bytes=MEMORY_BUDGET_BYTES,
+                 sizeof=artifacts_nbytes, on_evict=release_city_caches):
+        self.loader = loader
+        self.budget_bytes = budget_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.nbytes = 0
+        self._entries = OrderedDict()       # key -> (signature, artifacts, nbytes)
+        self._loading = {}                  # key -> lock held while loading
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def is_resident(self, artifact_path):
+        return str(artifact_path) in self._entries
+
+    def get(self, artifact_path):
+        from knowledge_system.shared_store import artifact_signature
+
+        key = str(artifact_path)
+        signature = artifact_signature(key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                RESIDENT_REQUESTS.inc(result="hit")
+                return entry[1]
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] == signature:
+                    # loaded by a concurrent request while we waited
+                    self._entries.move_to_end(key)
+                    RESIDENT_REQUESTS.inc(result="hit")
+                    return entry[1]
+            RESIDENT_REQUESTS.inc(result="miss" if entry is None else "reload")
+
+            t0 = time.perf_counter()
+            try:
+                artifacts = self.loader(key)
+                ARTIFACT_LOAD_SECONDS.observe(time.perf_counter() - t0, city=Path(key).name)
+                nbytes = self.sizeof(artifacts)
+            except BaseException:
+                with self._lock:
+                    self._loading.pop(key, None)
+                raise
+
+            with self._lock:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self.nbytes -= old[2]
+                self._entries[key] = (signature, artifacts, nbytes)
+                self.nbytes += nbytes
+                # only once the entry is in: a request arriving in between
+                # must find either the entry or this lock, never neither
+                self._loading.pop(key, None)
+                evicted = self._evict_over_budget()
+
+        for evicted_key in evicted:
+            RESIDENT_REQUESTS.inc(result="evict")
+            logger.info("Evicted %s from the resident artifacts", evicted_key)
+            if self.on_evict is not None:
+                self.on_evict(evicted_key)
+        return artifacts
+
+    def _evict_over_budget(self):
+        evicted = []
+        while self.nbytes > self.budget_bytes and len(self._entries) > 1:
+            key, (_, _, nbytes) = self._entries.popitem(last=False)
+            self.nbytes -= nbytes
+            evicted.append(key)
+        return evicted
+
+    def clear(self):
+        with self._lock:
+            keys = list(self._entries)
+            self._entries.clear()
+            self.nbytes = 0
+        if self.on_evict is not None:
+            for key in keys:
+                self.on_evict(key)
+
+
+_resident = None
+_resident_lock = threading.Lock()
+
+
+def resident_artifacts():
+    """The process-wide ResidentArtifacts."""
+    global _resident
+    if _resident is None:
+        with _resident_lock:
+            if _resident is None:
+                _resident = ResidentArtifacts()
+    return _resident
+
+
+RESIDENT_CITIES = metrics.gauge(
+    "resident_artifacts",
+    "Cities whose model, scalers and history are loaded in this process",
+    callback=lambda: len(_resident) if _resident is not None else 0,
+)
+RESIDENT_BYTES = metrics.gauge(
+    "resident_artifacts_bytes",
+    "Approximate memory of the resident artifacts (model tensors + DataFrames)",
+    callback=lambda: _resident.nbytes if _resident is not None else 0,
+)
@@ -0,0 +1,174 @@
+"""
+Day-of-year climatology of a city's weather.csv history, for the
+climatology-relative thresholds of the extreme event rules
+(predict_extreme.py, rules.json `{"percentile": q}`).
+
+The threshold of calendar day d is the q-th percentile of all values within
++/- WINDOW_HALF_DAYS days of d over every year of the history (the usual
+base-period method for percentile indices: 30 years give ~450 samples per
+day instead of 30). Feb 29 has its own slot; dates map to one of 366 slots
+through the leap-year calendar, and the rows handed to the rule engine are
+keyed by "MM-DD", so a lookup is one dict access.
+
+An index is built once per city and weather.csv version and cached in the
+process. Percentiles are only computed for the (variable, q) pairs the rule
+catalog references, on first use, and the per-slot rows handed to the rule
+engine are cached too, so evaluation never touches numpy.
+
+Only numpy/pandas are used.
+"""
+import os
+import threading
+import time
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from knowledge_system.metrics import stage_timer
+
+WINDOW_HALF_DAYS = 7
+MIN_SAMPLES = 30        # fewer values around a calendar day -> no threshold (NaN)
+# weather.csv changes once a day: stat it at most this often per city
+CHECK_INTERVAL_SECONDS = float(os.getenv("CLIMATOLOGY_CHECK_SEC", "2"))
+
+# rule variables (predict_extreme.DAY_VARIABLES) -> weather.csv columns
+VARIABLE_COLUMNS = {
+    "t_mean": "mean_temperature",
+    "t_max": "max_temperature",
+    "t_min": "min_temperature",
+    "rain": "total_precipitation",
+    "wind": "mean_windSpeed",
+    "dew": "mean_dewPoint",
+    "vis": "mean_visibility",
+}
+
+N_SLOTS = 366
+LEAP_MONTH_DAYS = (31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+MONTH_START = np.cumsum((0,) + LEAP_MONTH_DAYS[:-1])
+# "MM-DD" -> slot 0..365 (leap-year calendar)
+CALENDAR_SLOTS = {
+    f"{m:02d}-{d:02d}": int(MONTH_START[m - 1]) + d - 1
+    for m, n_days in enumerate(LEAP_MONTH_DAYS, start=1)
+    for d in range(1, n_days + 1)
+}
+
+
+def calendar_slot(dates):
+    """Slot of each date (DatetimeIndex or array-like of dates)."""
+    dates = pd.DatetimeIndex(dates)
+    return MONTH_START[np.asarray(dates.month) - 1] + np.asarray(dates.day) - 1
+
+
+class ClimatologyIndex:
+    """Per-slot percentiles of one city's history (see the module docstring)."""
+
+    def __init__(self, df, window_half_days=WINDOW_HALF_DAYS, min_samples=MIN_SAMPLES):
+        index = pd.DatetimeIndex(df.index)
+        self.df = df
+        self.window_half_days = window_half_days
+        self.min_samples = min_samples
+        self.years = (int(index.year.min()), int(index.year.max())) if len(index) else None
+        self._year_row = np.asarray(index.year) - (self.years[0] if self.years else 0)
+        self._slot = calendar_slot(index) if len(index) else np.zeros(0, dtype=np.int64)
+        self._percentiles = {}
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def _windowed(self, var):
+        """(2h+1) * years x 366 samples: column s holds every value within h days of slot s."""
+        column = VARIABLE_COLUMNS[var]
+        values = self.df[column].to_numpy(np.float64) if column in self.df.columns else np.full(len(self.df), np.nan)
+        n_years = self.years[1] - self.years[0] + 1
+        matrix = np.full((n_years, N_SLOTS), np.nan)
+        matrix[self._year_row, self._slot] = values
+        h = self.window_half_days
+        return np.concatenate([np.roll(matrix, -k, axis=1) for k in range(-h, h + 1)])
+
+    def percentile(self, var, q):
+        """(366,) array: q-th percentile of `var` around each calendar slot."""
+        key = (var, float(q))
+        cached = self._percentiles.get(key)
+        if cached is not None:
+            return cached
+        if self.years is None:
+            result = np.full(N_SLOTS, np.nan)
+        else:
+            samples = self._windowed(var)
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)   # all-NaN slots
+                result = np.nanpercentile(samples, q, axis=0)
+            result[np.sum(~np.isnan(samples), axis=0) < self.min_samples] = np.nan
+        self._percentiles[key] = result
+        return result
+
+    def rows(self, spec):
+        """
+        spec: tuple of (key, var, q). Returns {"MM-DD": {key: threshold}}
+        (plain floats), the dicts to merge into the day dict of that date.
+        """
+        cached = self._rows.get(spec)
+        if cached is not None:
+            return cached
+        with self._lock:
+            cached = self._rows.get(spec)
+            if cached is None:
+                keys = [key for key, _, _ in spec]
+                columns = [self.percentile(var, q) for _, var, q in spec]
+                table = np.column_stack(columns).tolist() if columns else [[] for _ in range(N_SLOTS)]
+                by_slot = [dict(zip(keys, row)) for row in table]
+                cached = {day: by_slot[slot] for day, slot in CALENDAR_SLOTS.items()}
+                self._rows[spec] = cached
+        return cached
+
+
+# --------------------
+# Per-city cache
+# --------------------
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _weather_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def climatology_for(city_dir, df=None):
+    """
+    Cached ClimatologyIndex of artifacts/<city>/weather.csv, rebuilt when the
+    file changes (checked at most every CHECK_INTERVAL_SECONDS). `df` can be
+    passed to reuse an already loaded history. None when the city has no
+    history.
+    """
+    key = str(city_dir)
+    now = time.monotonic()
+    cached = _indexes.get(key)
+    if cached is not None and now - cached[2] < CHECK_INTERVAL_SECONDS:
+        return cached[1]
+
+    path = Path(city_dir) / "weather.csv"
+    signature = _weather_signature(path)
+    with _indexes_lock:
+        cached = _indexes.get(key)
+        if cached is not None and cached[0] == signature:
+            _indexes[key] = (signature, cached[1], now)
+            return cached[1]
+        if df is None:
+            if signature is None:
+                return None
+            df = pd.read_csv(path, index_col=0, parse_dates=True)
+        with stage_timer("climatology_build"):
+            index = ClimatologyIndex(df)
+        _indexes[key] = (signature, index, now)
+        return index
+
+
+def forget(city_dir):
+    """Drop the cached index of a city (e.g. when its artifacts are evicted)."""
+    with _indexes_lock:
+        _indexes.pop(str(city_dir), None)
@@ -0,0 +1,363 @@
+"""
+Online input-drift and data-quality monitor: do the rows appended to
+weather.csv still look like the data the model was trained on?
+
+The training distribution of every model input is the city's feature
+scaler (feature_scaler_bundle.pkl: StandardScaler mean_ / scale_). For each
+city and feature the monitor keeps, in <city>/drift_state.json:
+    n, mean, M2         running moments (Welford; batches merged with
+                        Chan's formula, so the result is the per-row one)
+    min, max            of the standardized values z = (x - mean_) / scale_
+    sketch              counts of z in SKETCH_EDGES bins (0.25 wide over +/-6,
+                        plus two overflow bins): quantiles (interpolated in
+                        a bin, clamped to min/max) and the outlier share
+and per city the rows seen, the rows with a missing input and the QC flags
+(qc.py) of those rows. Memory does not grow with the number of rows.
+
+update_city only reads the rows appended after the `through` day of the
+state, from the end of weather.csv (plus CONTEXT_DAYS earlier rows for the
+lag / rolling features), so the history is never re-scanned. The first time
+a city is seen (or when its scaler changes: a new model is promoted) the
+state starts from the last SEED_DAYS rows (a year, so the seasons are
+covered). Days QC re-fills before `through` later on are not counted again.
+
+Scores per feature, from the rows since the state started:
+    mean_shift      (mean - mean_) / scale_, in training standard deviations
+    std_ratio       running std / scale_
+    outlier_ratio   share of rows with |z| > OUTLIER_Z
+and an alert when, with at least MIN_ROWS rows, |mean_shift| or std_ratio
+(either way) or outlier_ratio passes its threshold. The mean of a few weeks
+of temperature is seasonal: a state shorter than a year (DRIFT_SEED_DAYS
+lowered, short history) can alert on the season. Calendar features
+(dow/doy sin/cos) are deterministic and skipped.
+
+The backend updates a city whenever the artifact watcher sees its inputs
+change and publishes the scores as input_drift_* gauges on /metrics
+(GET /drift?city_name= has the full report). Several workers can update the
+same city: the state is updated under an exclusive flock and a worker that
+finds it already current only refreshes its gauges.
+"""
+import fcntl
+import io
+import json
+import logging
+import os
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from knowledge_system import metrics
+from knowledge_system.helpers import apply_feature_engineering
+from knowledge_system.qc import QC_COLUMN
+from knowledge_system.shared_store import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = "drift_state.json"
+SEED_DAYS = int(os.getenv("DRIFT_SEED_DAYS", "365"))
+MIN_ROWS = int(os.getenv("DRIFT_MIN_ROWS", "30"))
+MEAN_SHIFT_ALERT = float(os.getenv("DRIFT_MEAN_SHIFT_ALERT", "1.0"))
+STD_RATIO_ALERT = float(os.getenv("DRIFT_STD_RATIO_ALERT", "2.0"))
+OUTLIER_RATIO_ALERT = float(os.getenv("DRIFT_OUTLIER_RATIO_ALERT", "0.05"))
+OUTLIER_Z = 4.0
+CONTEXT_DAYS = 8                # lag_7 / roll_7 / diff_3 of the first new row
+TAIL_CHUNK_BYTES = 16384
+
+SKETCH_EDGES = np.linspace(-6.0, 6.0, 49)
+QUANTILES = (0.05, 0.5, 0.95)
+CALENDAR_FEATURES = {"dow_sin", "dow_cos", "doy_sin", "doy_cos"}
+QC_FLAG_NAMES = {
+    1: "missing_day", 2: "sentinel", 4: "out_of_range", 8: "inconsistent",
+    16: "filled", 32: "carried", 64: "unfilled",
+}
+
+MEAN_SHIFT = metrics.gauge(
+    "input_drift_mean_shift",
+    "Mean of the monitored inputs minus the training mean, in training standard deviations",
+    labelnames=("city", "feature"),
+)
+STD_RATIO = metrics.gauge(
+    "input_drift_std_ratio",
+    "Standard deviation of the monitored inputs over the training one",
+    labelnames=("city", "feature"),
+)
+OUTLIER_RATIO = metrics.gauge(
+    "input_drift_outlier_ratio",
+    f"Share of monitored rows more than {OUTLIER_Z:g} training standard deviations from the training mean",
+    labelnames=("city", "feature"),
+)
+ALERT = metrics.gauge(
+    "input_drift_alert",
+    "1 when a feature of a city drifted past the DRIFT_* thresholds",
+    labelnames=("city", "feature"),
+)
+ROWS = metrics.gauge(
+    "input_rows_monitored",
+    "Rows of weather.csv folded into the drift state",
+    labelnames=("city",),
+)
+QUALITY_ROWS = metrics.gauge(
+    "input_quality_rows",
+    "Monitored rows with a missing input (flag=incomplete) or a QC flag",
+    labelnames=("city", "flag"),
+)
+
+
+# --------------------
+# Reading the new rows
+# --------------------
+def read_rows_since(csv_path, first_day):
+    """Rows of weather.csv dated >= first_day ("YYYY-MM-DD"), reading backwards from the end."""
+    first = first_day.encode()
+    with open(csv_path, "rb") as f:
+        header = f.readline()
+        body_start = f.tell()
+        f.seek(0, os.SEEK_END)
+        position, tail = f.tell(), b""
+        while position > body_start:
+            step = min(TAIL_CHUNK_BYTES, position - body_start)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+            # the first line of the chunk may be cut: look at the next one
+            newline = tail.find(b"\n") if position > body_start else -1
+            if tail[newline + 1:newline + 11] < first:
+                break
+        if position > body_start:
+            tail = tail[tail.find(b"\n") + 1:]
+    df = pd.read_csv(io.BytesIO(header + tail), index_col=0, parse_dates=True)
+    return df.loc[df.index >= pd.Timestamp(first_day)].sort_index()
+
+
+# --------------------
+# State
+# --------------------
+def _scaler(city_dir):
+    bundle = joblib.load(Path(city_dir) / "feature_scaler_bundle.pkl")
+    return bundle["feature_cols"], bundle["scaler"]
+
+
+def _scaler_signature(city_dir):
+    st = os.stat(Path(city_dir) / "feature_scaler_bundle.pkl")
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _empty_state(features, signature, through):
+    k = len(features)
+    return {
+        "scaler_signature": signature,
+        "features": features,
+        "since": None,
+        "through": through,
+        "rows": 0,
+        "incomplete_rows": 0,
+        "qc_flags": {name: 0 for name in QC_FLAG_NAMES.values()},
+        "n": [0] * k,
+        "mean": [0.0] * k,
+        "m2": [0.0] * k,
+        "min": [None] * k,
+        "max": [None] * k,
+        "sketch": [[0] * (len(SKETCH_EDGES) + 1) for _ in range(k)],
+    }
+
+
+def load_state(city_dir):
+    path = Path(city_dir) / STATE_FILE
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _save_state(city_dir, state):
+    path = Path(city_dir) / STATE_FILE
+    atomic_write_json(path, state)
+
+
+def fold_rows(state, rows, z):
+    """Merge a batch of rows (their QC flags and (rows, features) z-scores) into the state."""
+    present = ~np.isnan(z)
+    n_b = present.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_b = np.where(present, z, 0.0).sum(axis=0) / np.maximum(n_b, 1)
+    m2_b = np.where(present, (z - mean_b) ** 2, 0.0).sum(axis=0)
+
+    # Chan et al.: combine (n, mean, M2) of the state and of the batch
+    n_a, mean_a, m2_a = np.array(state["n"]), np.array(state["mean"]), np.array(state["m2"])
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    safe_n = np.maximum(n, 1)
+    state["mean"] = (mean_a + delta * n_b / safe_n).tolist()
+    state["m2"] = (m2_a + m2_b + delta ** 2 * n_a * n_b / safe_n).tolist()
+    state["n"] = n.tolist()
+    for j in np.nonzero(n_b)[0]:
+        low, high = float(np.nanmin(z[:, j])), float(np.nanmax(z[:, j]))
+        state["min"][j] = low if state["min"][j] is None else min(state["min"][j], low)
+        state["max"][j] = high if state["max"][j] is None else max(state["max"][j], high)
+
+    sketch = np.array(state["sketch"])
+    bins = np.searchsorted(SKETCH_EDGES, z, side="right")     # 0 .. len(EDGES)
+    for j in range(z.shape[1]):
+        sketch[j] += np.bincount(bins[present[:, j], j], minlength=sketch.shape[1])
+    state["sketch"] = sketch.tolist()
+
+    state["rows"] += len(z)
+    state["incomplete_rows"] += int((~present).any(axis=1).sum())
+    flags = rows[QC_COLUMN].fillna(0).to_numpy(dtype=np.int64) if QC_COLUMN in rows else np.zeros(len(rows), np.int64)
+    for bit, name in QC_FLAG_NAMES.items():
+        state["qc_flags"][name] += int(((flags & bit) != 0).sum())
+    return state
+
+
+def update_city(city, city_dir):
+    """Fold the rows appended since the last update; returns (state, new rows)."""
+    city_dir = Path(city_dir)
+    csv_path = city_dir / "weather.csv"
+    features, scaler = _scaler(city_dir)
+    signature = _scaler_signature(city_dir)
+    monitored = [f for f in features if f not in CALENDAR_FEATURES]
+    columns = [features.index(f) for f in monitored]
+
+    with open(city_dir / f".{STATE_FILE}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        state = load_state(city_dir)
+        if state is None or state["scaler_signature"] != signature or state["features"] != monitored:
+            last_day = _last_day(csv_path)
+            if last_day is None:
+                return None, 0
+            through = (last_day - pd.Timedelta(days=SEED_DAYS)).strftime("%Y-%m-%d")
+            state = _empty_state(monitored, signature, through)
+
+        through = pd.Timestamp(state["through"])
+        segment = read_rows_since(csv_path, (through - pd.Timedelta(days=CONTEXT_DAYS - 1)).strftime("%Y-%m-%d"))
+        new = segment.index > through
+        if not new.any():
+            set_gauges(city, state, scaler, columns)
+            return state, 0
+
+        df_fe = apply_feature_engineering(segment)[monitored]
+        z = (df_fe.to_numpy(dtype=np.float64)[new] - scaler.mean_[columns]) / scaler.scale_[columns]
+        fold_rows(state, segment.loc[new], z)
+        state["since"] = state["since"] or segment.index[new][0].strftime("%Y-%m-%d")
+        state["through"] = segment.index[-1].strftime("%Y-%m-%d")
+        alerts = set_gauges(city, state, scaler, columns)
+        raised = sorted(set(alerts) - set(state.get("alerts", ())))
+        state["alerts"] = alerts
+        _save_state(city_dir, state)
+
+    if raised:
+        logger.warning("Input drift for %s: %s", city, ", ".join(raised))
+    return state, int(new.sum())
+
+
+def _last_day(csv_path):
+    try:
+        with open(csv_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(f.tell() - 4096, 0))
+            last = f.read().splitlines()[-1].decode()
+        return pd.Timestamp(last.split(",", 1)[0])
+    except (FileNotFoundError, IndexError, ValueError):
+        return None
+
+
+# --------------------
+# Scores
+# --------------------
+def _sketch_quantiles(counts, quantiles, low, high):
+    """Quantiles (z units) of one feature's sketch, linear within a bin, clamped to [low, high]."""
+    total = counts.sum()
+    if not total:
+        return [None] * len(quantiles)
+    edges = np.clip(np.r_[low, SKETCH_EDGES, high], low, high)
+    cumulative = np.cumsum(counts)
+    out = []
+    for q in quantiles:
+        target = q * total
+        b = int(np.searchsorted(cumulative, target))
+        before = cumulative[b - 1] if b else 0
+        fraction = (target - before) / counts[b] if counts[b] else 0.0
+        out.append(float(edges[b] + fraction * (edges[b + 1] - edges[b])))
+    return out
+
+
+def scores(state, scaler, columns):
+    """{feature: scores} of a state, in the units of the feature where it makes sense."""
+    n = np.array(state["n"])
+    mean = np.array(state["mean"])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        std = np.sqrt(np.array(state["m2"]) / np.maximum(n - 1, 1))
+    sketch = np.array(state["sketch"])
+    lo, hi = np.searchsorted(SKETCH_EDGES, [-OUTLIER_Z, OUTLIER_Z])
+    outliers = sketch[:, :lo + 1].sum(axis=1) + sketch[:, hi + 1:].sum(axis=1)
+
+    out = {}
+    for j, feature in enumerate(state["features"]):
+        mu, sigma = scaler.mean_[columns[j]], scaler.scale_[columns[j]]
+        if not n[j]:
+            out[feature] = {"n": 0, "alert": False}
+            continue
+        ratio = float(outliers[j] / n[j])
+        alert = bool(n[j] >= MIN_ROWS and (
+            abs(mean[j]) > MEAN_SHIFT_ALERT
+            or std[j] > STD_RATIO_ALERT or std[j] < 1 / STD_RATIO_ALERT
+            or ratio > OUTLIER_RATIO_ALERT
+        ))
+        out[feature] = {
+            "n": int(n[j]),
+            "mean": round(float(mu + mean[j] * sigma), 3),
+            "training_mean": round(float(mu), 3),
+            "std": round(float(std[j] * sigma), 3),
+            "min": round(float(mu + state["min"][j] * sigma), 3),
+            "max": round(float(mu + state["max"][j] * sigma), 3),
+            "training_std": round(float(sigma), 3),
+            "quantiles": {
+                f"p{int(q * 100):02d}": None if z is None else round(float(mu + z * sigma), 3)
+                for q, z in zip(QUANTILES, _sketch_quantiles(sketch[j], QUANTILES,
+                                                             state["min"][j], state["max"][j]))
+            },
+            "mean_shift": round(float(mean[j]), 3),
+            "std_ratio": round(float(std[j]), 3),
+            "outlier_ratio": round(ratio, 4),
+            "alert": alert,
+        }
+    return out
+
+
+def set_gauges(city, state, scaler, columns):
+    """Publish the scores of a city on /metrics; returns the features in alert."""
+    alerts = []
+    for feature, s in scores(state, scaler, columns).items():
+        if not s["n"]:
+            continue
+        MEAN_SHIFT.set(s["mean_shift"], city=city, feature=feature)
+        STD_RATIO.set(s["std_ratio"], city=city, feature=feature)
+        OUTLIER_RATIO.set(s["outlier_ratio"], city=city, feature=feature)
+        ALERT.set(int(s["alert"]), city=city, feature=feature)
+        if s["alert"]:
+            alerts.append(feature)
+    ROWS.set(state["rows"], city=city)
+    QUALITY_ROWS.set(state["incomplete_rows"], city=city, flag="incomplete")
+    for name, count in state["qc_flags"].items():
+        QUALITY_ROWS.set(count, city=city, flag=name)
+    return alerts
+
+
+def report(city, city_dir):
+    """Drift and data-quality report of a city's current state, or None before its first update."""
+    state = load_state(city_dir)
+    if state is None:
+        return None
+    features, scaler = _scaler(city_dir)
+    columns = [features.index(f) for f in state["features"]]
+    by_feature = scores(state, scaler, columns)
+    return {
+        "city": city,
+        "since": state["since"],
+        "through": state["through"],
+        "rows": state["rows"],
+        "quality": {"incomplete_rows": state["incomplete_rows"], "qc_flags": state["qc_flags"]},
+        "alerts": sorted(f for f, s in by_feature.items() if s["alert"]),
+        "features": by_feature,
+    }
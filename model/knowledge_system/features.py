@@ -0,0 +1,158 @@
+"""
+Feature engineering of many cities at once, on a stacked array.
+
+helpers.apply_feature_engineering works on one city's DataFrame and adds
+its ~20 columns one at a time (a block consolidation and copy each), so a
+multi-city job pays that per city. Here the cities' histories are one
+float32 array (cities, days, BASE_COLUMNS) on a shared daily calendar,
+and every feature is computed for all cities at once with a few whole-array
+operations written straight into a preallocated (cities, days, features)
+output, in the order of the requested feature_cols (a scaler bundle's
+`feature_cols`). Cities go through in chunks of CHUNK_CITIES so the
+output being filled feature by feature stays in cache.
+
+    calendar    dow / doy and their sin / cos: computed once for the
+                calendar and broadcast over the cities
+    lag_k       a shifted copy along the day axis
+    roll_*_w    sums of w shifted slices of the values (NaN -> 0) and of
+                their presence mask: mean = sum / count, sum = sum, NaN
+                where the window has no value (pandas rolling, min_periods=1)
+    delta_*     difference with the value k days before (pandas diff)
+
+The values match apply_feature_engineering on each city's frame (float32
+precision; test_features.py checks it). That needs one row per calendar
+day: the pandas path shifts by row and this one by day, so stack_histories
+rejects a frame with a missing day (QC'd weather.csv files keep long gaps
+as NaN rows, which are fine). Days before a city's first row are NaN, like
+the start of its own frame.
+
+Only numpy/pandas are used.
+"""
+import numpy as np
+import pandas as pd
+
+from knowledge_system.qc import VALUE_COLUMNS
+
+BASE_COLUMNS = tuple(VALUE_COLUMNS)
+CALENDAR_FEATURES = ("dow", "dow_sin", "dow_cos", "doy", "doy_sin", "doy_cos")
+CHUNK_CITIES = 4
+
+# derived feature -> (kind, source column, days), as in apply_feature_engineering
+DERIVED_FEATURES = {
+    **{f"mean_temperature_lag_{lag}": ("lag", "mean_temperature", lag) for lag in (1, 3, 7)},
+    **{f"mean_temperature_roll_mean_{w}": ("roll_mean", "mean_temperature", w) for w in (3, 7)},
+    **{f"total_precipitation_roll_sum_{w}": ("roll_sum", "total_precipitation", w) for w in (3, 7)},
+    "delta_temp_1d": ("diff", "mean_temperature", 1),
+    "delta_temp_3d": ("diff", "mean_temperature", 3),
+    "wind_increase_1d": ("diff", "mean_windSpeed", 1),
+    "precip_increase_1d": ("diff", "total_precipitation", 1),
+}
+
+
+def stack_histories(frames, columns=BASE_COLUMNS):
+    """
+    (names, dates, values) of {name: DataFrame in the weather.csv schema}:
+    values is a (cities, days, columns) float32 array over the union of the
+    frames' days, NaN before a city's first row and after its last.
+    Raises ValueError when a frame skips a calendar day.
+    """
+    names = list(frames)
+    # day numbers straight from datetime64 (normalize / to_datetime cost ~ms per frame)
+    days = [pd.DatetimeIndex(frames[name].index).values.astype("datetime64[D]").astype(np.int64) for name in names]
+    first = min(int(d.min()) for d in days)
+    last = max(int(d.max()) for d in days)
+    dates = pd.date_range(pd.Timestamp(np.datetime64(first, "D")), periods=last - first + 1, freq="D")
+    values = np.full((len(names), len(dates), len(columns)), np.nan, dtype=np.float32)
+    for c, (name, day) in enumerate(zip(names, days)):
+        df = frames[name]
+        if len(np.unique(day)) != len(day):
+            # duplicated days: the last row wins, as in qc
+            keep = len(day) - 1 - np.unique(day[::-1], return_index=True)[1]
+            df, day = df.iloc[keep], day[keep]
+        gaps = np.flatnonzero(np.diff(day) != 1)
+        if len(gaps):
+            after = np.datetime64(int(day[gaps[0]]), "D")
+            raise ValueError(f"{name}: the rows skip or reorder days after {after}, one row per calendar day is needed")
+        values[c, day - first] = df.reindex(columns=list(columns)).to_numpy(dtype=np.float32)
+    return names, dates, values
+
+
+def _calendar(dates):
+    dow = dates.dayofweek.to_numpy(dtype=np.float64)
+    doy = dates.dayofyear.to_numpy(dtype=np.float64)
+    return {
+        "dow": dow,
+        "dow_sin": np.sin(2 * np.pi * dow / 7),
+        "dow_cos": np.cos(2 * np.pi * dow / 7),
+        "doy": doy,
+        "doy_sin": np.sin(2 * np.pi * doy / 365),
+        "doy_cos": np.cos(2 * np.pi * doy / 365),
+    }
+
+
+def _rolling(x, windows):
+    """{w: (sums, counts)} of the trailing windows of x (cities, days), NaN values skipped."""
+    present = ~np.isnan(x)
+    filled = np.where(present, x, 0.0).astype(np.float64)
+    sums, counts = filled.copy(), present.astype(np.int32)
+    out = {}
+    for i in range(1, max(windows)):
+        if i in windows:
+            out[i] = (sums.copy(), counts.copy())
+        sums[:, i:] += filled[:, :-i]
+        counts[:, i:] += present[:, :-i]
+    out[max(windows)] = (sums, counts)
+    return out
+
+
+def _engineer_into(out, values, calendar, feature_cols, base_columns):
+    base = {name: values[:, :, j] for j, name in enumerate(base_columns)}
+
+    # one rolling pass per source column, covering every window asked for
+    windows = {}
+    for name in feature_cols:
+        kind, column, days = DERIVED_FEATURES.get(name, (None, None, None))
+        if kind in ("roll_mean", "roll_sum"):
+            windows.setdefault(column, set()).add(days)
+    rolling = {column: _rolling(base[column], ws) for column, ws in windows.items()}
+
+    for k, name in enumerate(feature_cols):
+        dst = out[:, :, k]
+        if name in base:
+            dst[:] = base[name]
+            continue
+        if name in CALENDAR_FEATURES:
+            dst[:] = calendar[name][None, :]
+            continue
+        kind, column, days = DERIVED_FEATURES[name]
+        x = base[column]
+        if kind == "lag":
+            dst[:, :days] = np.nan
+            dst[:, days:] = x[:, :-days]
+        elif kind == "diff":
+            dst[:, :days] = np.nan
+            np.subtract(x[:, days:], x[:, :-days], out=dst[:, days:])
+        else:
+            sums, counts = rolling[column][days]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                value = sums / counts if kind == "roll_mean" else sums
+            dst[:] = np.where(counts > 0, value, np.nan)
+
+
+def engineer_features(values, dates, feature_cols, base_columns=BASE_COLUMNS, chunk=CHUNK_CITIES):
+    """
+    (cities, days, len(feature_cols)) float32 features of stacked histories
+    `values` (cities, days, base_columns) over consecutive `dates`.
+    """
+    values = np.asarray(values, dtype=np.float32)
+    unknown = [f for f in feature_cols
+               if f not in base_columns and f not in CALENDAR_FEATURES and f not in DERIVED_FEATURES]
+    if unknown:
+        raise KeyError(f"Unknown feature columns {unknown}")
+
+    calendar = _calendar(pd.DatetimeIndex(dates))
+    out = np.empty(values.shape[:2] + (len(feature_cols),), dtype=np.float32)
+    # the output is written feature by feature: a chunk of cities keeps it in cache
+    for start in range(0, len(values), chunk):
+        _engineer_into(out[start:start + chunk], values[start:start + chunk], calendar, feature_cols, base_columns)
+    return out
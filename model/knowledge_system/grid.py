@@ -0,0 +1,302 @@
+"""
+Gridded forecast and event-risk layers for the dashboard map.
+
+The latest forecast of every located station (catalog + locations.json) is
+interpolated onto a regular lat/lon grid over Morocco, for every horizon day
+and every layer: the forecast targets plus "risk", the highest event
+severity rank of the day (0 none .. 4 EXTREME, predict_extreme.SEVERITY_RANKS).
+
+Interpolation is inverse-distance weighting over the NEIGHBOURS nearest
+stations (haversine BallTree), stored as a sparse (cells x stations) weight
+matrix, so a whole grid (all days, all layers) is ONE sparse matrix product
+of the (stations, days * layers) value array. The matrix only depends on the
+station coordinates and is cached. Cells farther than MAX_DISTANCE_KM from
+every station are NaN (no coverage).
+
+A grid is identified by its version, a hash of the (station, generated_at,
+rules_version) of its inputs: it is rebuilt only when one of the city
+snapshots changed, and tiles / arrays are addressed by version so they can
+be cached forever by clients and proxies.
+
+Output:
+    render_tile   256x256 RGBA PNG of one layer and day for a Web Mercator
+                  (z, x, y) tile, LRU-cached by (version, layer, day, z, x, y)
+    layer_array   the raw (ny, nx) float16 array of one layer and day
+PNG encoding only needs zlib, so rendering adds no imaging dependency.
+"""
+import hashlib
+import math
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.neighbors import BallTree
+
+from knowledge_system import metrics
+from knowledge_system.predict_extreme import SEVERITY_RANKS
+from knowledge_system.spatial import EARTH_RADIUS_KM, SAME_POINT_KM
+
+BBOX = (20.5, -17.5, 36.5, -0.5)    # lat_min, lon_min, lat_max, lon_max (incl. southern provinces)
+RESOLUTION_DEG = float(os.getenv("GRID_RESOLUTION_DEG", "0.1"))
+NEIGHBOURS = 8
+IDW_POWER = 2.0
+MAX_DISTANCE_KM = float(os.getenv("GRID_MAX_DISTANCE_KM", "150"))
+RISK_LAYER = "risk"
+
+TILE_SIZE = 256
+TILE_CACHE_SIZE = int(os.getenv("GRID_TILE_CACHE_SIZE", "4096"))
+
+TILE_REQUESTS = metrics.counter(
+    "grid_tile_requests_total",
+    "Map tile lookups by result (hit, miss)",
+    labelnames=("result",),
+)
+
+
+class ForecastGrid(NamedTuple):
+    version: str
+    lats: np.ndarray            # (ny,) cell centres, south to north
+    lons: np.ndarray            # (nx,) cell centres, west to east
+    dates: tuple                # horizon days
+    layers: tuple               # forecast targets + RISK_LAYER
+    units: tuple
+    values: np.ndarray          # float32 (days, layers, ny, nx), NaN without coverage
+    stations: int
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "bbox": {"lat_min": BBOX[0], "lon_min": BBOX[1], "lat_max": BBOX[2], "lon_max": BBOX[3]},
+            "resolution_deg": RESOLUTION_DEG,
+            "shape": [len(self.lats), len(self.lons)],
+            "dates": list(self.dates),
+            "layers": {name: {"unit": unit, "range": list(LAYER_STYLES.get(name, DEFAULT_STYLE)[:2])}
+                       for name, unit in zip(self.layers, self.units)},
+            "stations": self.stations,
+        }
+
+
+def grid_version(entries):
+    """entries: (station, generated_at, rules_version) of every input snapshot."""
+    digest = hashlib.sha1()
+    for entry in sorted(entries):
+        digest.update("|".join(map(str, entry)).encode())
+        digest.update(b"\n")
+    return digest.hexdigest()[:16]
+
+
+# --------------------
+# Interpolation
+# --------------------
+def grid_axes(bbox=BBOX, resolution=RESOLUTION_DEG):
+    lat_min, lon_min, lat_max, lon_max = bbox
+    lats = np.arange(lat_min + resolution / 2, lat_max, resolution)
+    lons = np.arange(lon_min + resolution / 2, lon_max, resolution)
+    return lats, lons
+
+
+_weights = {}               # station coordinates -> (csr weights, covered mask)
+_weights_lock = threading.Lock()
+
+
+def idw_matrix(coords, lats, lons):
+    """
+    Sparse (cells x stations) IDW weights of the NEIGHBOURS nearest stations
+    within MAX_DISTANCE_KM (rows sum to 1), and the mask of covered cells.
+    """
+    key = (tuple(map(tuple, coords)), lats[0], lats[-1], lons[0], lons[-1], len(lats), len(lons))
+    cached = _weights.get(key)
+    if cached is not None:
+        return cached
+
+    lat_grid, lon_grid = np.meshgrid(lats, lons, indexing="ij")
+    cells = np.radians(np.column_stack([lat_grid.ravel(), lon_grid.ravel()]))
+    k = min(NEIGHBOURS, len(coords))
+    distances, indices = BallTree(np.radians(coords), metric="haversine").query(cells, k=k)
+    distances *= EARTH_RADIUS_KM
+
+    weights = 1.0 / np.maximum(distances, SAME_POINT_KM) ** IDW_POWER
+    weights[distances > MAX_DISTANCE_KM] = 0.0
+    totals = weights.sum(axis=1)
+    covered = totals > 0
+    weights[covered] /= totals[covered, None]
+
+    rows = np.repeat(np.arange(len(cells)), k)
+    matrix = sparse.csr_matrix((weights.ravel(), (rows, indices.ravel())), shape=(len(cells), len(coords)))
+    with _weights_lock:
+        if len(_weights) >= 4:
+            _weights.pop(next(iter(_weights)))
+        _weights[key] = (matrix, covered)
+    return matrix, covered
+
+
+def station_values(results):
+    """(stations, days, layers) float32 values, with the dates, layers and units of the first result."""
+    base = results[0]["forecast"]
+    dates = tuple(day["date"] for day in base)
+    variables = [key for key, value in base[0].items() if isinstance(value, dict) and "value" in value]
+    position = {date: i for i, date in enumerate(dates)}
+
+    values = np.full((len(results), len(dates), len(variables) + 1), np.nan, dtype=np.float32)
+    for s, result in enumerate(results):
+        for day in result["forecast"]:
+            i = position.get(day["date"])
+            if i is None:
+                continue
+            risk = max((SEVERITY_RANKS.get(e.get("severity"), 0) for e in day.get("events", ())), default=0)
+            values[s, i] = [day[var]["value"] for var in variables] + [risk]
+    units = tuple(base[0][var].get("unit") for var in variables) + ("severity rank",)
+    return values, dates, tuple(variables) + (RISK_LAYER,), units
+
+
+def build_grid(version, coords, results):
+    """
+    coords: (stations, 2) lat/lon; results: their forecast results
+    (run_forecast format, with events). One sparse product for the whole grid.
+    """
+    lats, lons = grid_axes()
+    values, dates, layers, units = station_values(results)
+    n_stations, n_days, n_layers = values.shape
+
+    matrix, covered = idw_matrix(np.asarray(coords, dtype=np.float64), lats, lons)
+    # a station without some day (older snapshot) must not pull that day towards 0
+    present = ~np.isnan(values)
+    flat = np.where(present, values, 0.0).reshape(n_stations, -1)
+    blended = matrix @ flat
+    weight = matrix @ present.reshape(n_stations, -1).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        blended = blended / weight
+    blended[~covered] = np.nan
+
+    grid = blended.reshape(len(lats), len(lons), n_days, n_layers).transpose(2, 3, 0, 1)
+    return ForecastGrid(
+        version=version,
+        lats=lats,
+        lons=lons,
+        dates=dates,
+        layers=layers,
+        units=units,
+        values=np.ascontiguousarray(grid, dtype=np.float32),
+        stations=n_stations,
+    )
+
+
+def layer_array(grid, layer, day):
+    """(ny, nx) little-endian float16 bytes of one layer and day, rows south to north."""
+    return grid.values[day, grid.layers.index(layer)].astype("<f2").tobytes()
+
+
+# --------------------
+# Tiles
+# --------------------
+# (value, (r, g, b, a)) stops
+TEMPERATURE_RAMP = ((-10, (49, 54, 149, 200)), (0, (69, 117, 180, 200)), (10, (171, 217, 233, 200)),
+                    (20, (255, 255, 191, 200)), (30, (253, 174, 97, 200)), (40, (215, 48, 39, 200)),
+                    (50, (165, 0, 38, 200)))
+PRECIPITATION_RAMP = ((0, (255, 255, 255, 0)), (1, (198, 219, 239, 150)), (10, (66, 146, 198, 200)),
+                      (50, (8, 48, 107, 220)))
+WIND_RAMP = ((0, (255, 255, 255, 0)), (5, (199, 233, 192, 150)), (15, (65, 171, 93, 200)),
+             (30, (0, 68, 27, 220)))
+VISIBILITY_RAMP = ((0, (90, 90, 90, 220)), (2, (150, 150, 150, 170)), (10, (255, 255, 255, 0)))
+RISK_RAMP = ((0, (255, 255, 255, 0)), (1, (255, 237, 160, 150)), (2, (254, 178, 76, 190)),
+             (3, (240, 59, 32, 210)), (4, (128, 0, 38, 230)))
+
+# layer -> (vmin, vmax, ramp)
+LAYER_STYLES = {
+    "mean_temperature": (-10, 50, TEMPERATURE_RAMP),
+    "max_temperature": (-10, 50, TEMPERATURE_RAMP),
+    "min_temperature": (-10, 50, TEMPERATURE_RAMP),
+    "mean_dewPoint": (-10, 50, TEMPERATURE_RAMP),
+    "total_precipitation": (0, 50, PRECIPITATION_RAMP),
+    "mean_windSpeed": (0, 30, WIND_RAMP),
+    "mean_visibility": (0, 10, VISIBILITY_RAMP),
+    RISK_LAYER: (0, 4, RISK_RAMP),
+}
+DEFAULT_STYLE = (0, 1, ((0, (255, 255, 255, 0)), (1, (0, 0, 0, 200))))
+
+
+def _palette(style):
+    """256 x RGBA lookup table over [vmin, vmax]."""
+    vmin, vmax, ramp = style
+    stops = np.array([v for v, _ in ramp], dtype=np.float64)
+    colors = np.array([c for _, c in ramp], dtype=np.float64)
+    levels = np.linspace(vmin, vmax, 256)
+    return np.stack([np.interp(levels, stops, colors[:, c]) for c in range(4)], axis=1).round().astype(np.uint8)
+
+
+PALETTES = {name: _palette(style) for name, style in LAYER_STYLES.items()}
+
+
+def tile_pixel_centres(z, x, y, size=TILE_SIZE):
+    """Latitudes of the pixel rows and longitudes of the pixel columns of a Web Mercator tile."""
+    n = 2 ** z
+    offsets = (np.arange(size) + 0.5) / size
+    lons = (x + offsets) / n * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * (y + offsets) / n))))
+    return lats, lons
+
+
+def encode_png(rgba):
+    """(h, w, 4) uint8 -> PNG bytes (8-bit RGBA, no filtering)."""
+    height, width, _ = rgba.shape
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)     # filter byte 0 per row
+    raw[:, 1:] = rgba.reshape(height, -1)
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)) + chunk(b"IEND", b"")
+
+
+def _render(grid, layer, day, z, x, y):
+    values = grid.values[day, grid.layers.index(layer)]
+    lats, lons = tile_pixel_centres(z, x, y)
+    # the tile is separable: one grid row per pixel row, one grid column per pixel column
+    res = RESOLUTION_DEG
+    rows = np.floor((lats - (grid.lats[0] - res / 2)) / res).astype(np.int64)
+    cols = np.floor((lons - (grid.lons[0] - res / 2)) / res).astype(np.int64)
+    row_ok = (rows >= 0) & (rows < len(grid.lats))
+    col_ok = (cols >= 0) & (cols < len(grid.lons))
+
+    pixels = np.full((TILE_SIZE, TILE_SIZE), np.nan, dtype=np.float32)
+    if row_ok.any() and col_ok.any():
+        pixels[np.ix_(row_ok, col_ok)] = values[np.ix_(rows[row_ok], cols[col_ok])]
+
+    vmin, vmax, _ = LAYER_STYLES.get(layer, DEFAULT_STYLE)
+    palette = PALETTES.get(layer, _palette(DEFAULT_STYLE))
+    missing = np.isnan(pixels)
+    levels = np.clip(np.round((np.nan_to_num(pixels) - vmin) / (vmax - vmin) * 255), 0, 255).astype(np.uint8)
+    rgba = palette[levels]
+    rgba[missing] = 0
+    return encode_png(rgba)
+
+
+_tiles = OrderedDict()
+_tiles_lock = threading.Lock()
+
+
+def render_tile(grid, layer, day, z, x, y):
+    """PNG bytes of one tile, cached by (version, layer, day, z, x, y)."""
+    key = (grid.version, layer, day, z, x, y)
+    with _tiles_lock:
+        png = _tiles.get(key)
+        if png is not None:
+            _tiles.move_to_end(key)
+    if png is not None:
+        TILE_REQUESTS.inc(result="hit")
+        return png
+
+    TILE_REQUESTS.inc(result="miss")
+    with metrics.stage_timer("grid_tile_render"):
+        png = _render(grid, layer, day, z, x, y)
+    with _tiles_lock:
+        _tiles[key] = png
+        while len(_tiles) > TILE_CACHE_SIZE:
+            _tiles.popitem(last=False)
+    return png
@@ -3,9 +3,11 @@ import torch
 import torch
 import torch.nn as nn
 import numpy as np
+import json
 import warnings
 from pathlib import Path
 from sklearn.exceptions import InconsistentVersionWarning
+from knowledge_system.windows import input_windows, target_affine
 warnings.filterwarnings("ignore", category=InconsistentVersionWarning)
 
 LOOKBACK = 14
@@ -33,6 +35,22 @@ TARGET_UNITS = {
     "mean_visibility": "km",
 }
 
+# Physical bounds applied to forecast output, (lower, upper), None = unbounded.
+# Temperatures and dew point can be negative; amounts and speeds cannot.
+TARGET_LIMITS = {
+    "mean_temperature": (None, None),
+    "max_temperature": (None, None),
+    "min_temperature": (None, None),
+    "total_precipitation": (0.0, None),
+    "mean_windSpeed": (0.0, None),
+    "mean_dewPoint": (None, None),
+    "mean_visibility": (0.0, None),
+}
+
+# the same bounds as arrays over the TARGET_COLS axis, for vectorized clipping
+TARGET_LOWER = np.array([-np.inf if TARGET_LIMITS[v][0] is None else TARGET_LIMITS[v][0] for v in TARGET_COLS])
+TARGET_UPPER = np.array([np.inf if TARGET_LIMITS[v][1] is None else TARGET_LIMITS[v][1] for v in TARGET_COLS])
+
 class WeatherLSTM(nn.Module):
     def __init__(
         self,
@@ -66,14 +84,47 @@ class WeatherLSTM(nn.Module):
         return out
 
 
+# MODEL ARCHITECTURE
+# Defaults = the architecture of the notebook-trained artifacts. Artifacts
+# written by train_pipeline / sweep record theirs in manifest.json["model"].
+MODEL_DEFAULTS = {
+    "hidden_size": 64,
+    "num_layers": 2,
+    "dropout": 0.2,
+    "lookback": LOOKBACK,
+}
+
+
+def read_model_config(model_dir):
+    """Architecture of the model in an artifact folder (defaults if unrecorded)."""
+    path = Path(model_dir) / "manifest.json"
+    recorded = {}
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            recorded = json.load(f).get("model", {})
+    return {k: recorded.get(k, v) for k, v in MODEL_DEFAULTS.items()}
+
+
 # LOAD MODEL
-def load_model(input_size: int, model_path):  
+def load_model(input_size: int, model_path, mmap: bool = False, config=None):
+    if config is None:
+        config = read_model_config(Path(model_path).parent)
     model = WeatherLSTM(
         input_size=input_size,
+        hidden_size=config.get("hidden_size", MODEL_DEFAULTS["hidden_size"]),
+        num_layers=config.get("num_layers", MODEL_DEFAULTS["num_layers"]),
         horizon=HORIZON,
         num_targets=len(TARGET_COLS),
+        dropout=config.get("dropout", MODEL_DEFAULTS["dropout"]),
     )
-    model.load_state_dict(torch.load(model_path, map_location=DEVICE))
+    if mmap and DEVICE == "cpu":
+        # Parameters stay backed by the file's page cache, so every process
+        # that maps the same checkpoint shares one physical copy.
+        state = torch.load(model_path, map_location="cpu", mmap=True, weights_only=True)
+        model.load_state_dict(state, assign=True)
+        model.requires_grad_(False)
+    else:
+        model.load_state_dict(torch.load(model_path, map_location=DEVICE))
     model.to(DEVICE)
     model.eval()
     return model
@@ -170,16 +221,73 @@ def build_last_sequence(df, feature_cols, feature_scaler, lookback):
     ).unsqueeze(0)
 
 
-# INVERSE SCALE OUTPUT
-def inverse_scale_predictions(Y_scaled, target_scalers):
-    Y_real = Y_scaled.copy()
-
-    for i, var in enumerate(TARGET_COLS):
-        start = i * HORIZON
-        end   = (i + 1) * HORIZON
+# BUILD SEVERAL INPUT SEQUENCES (BATCHED)
+def build_input_windows(df_fe, feature_cols, feature_scaler, lookback, as_of_dates):
+    """
+    Scaled input windows for several as-of dates from one feature-engineered
+    frame (see apply_feature_engineering), stacked for a single forward pass.
+
+    as_of_dates: iterable of dates or None (None = latest row). Each window
+    ends at the last row on or before its as-of date.
+    Returns (tensor of shape (N, lookback, n_features), list of window end dates).
+    """
+    values = df_fe[feature_cols].to_numpy(dtype=np.float64)
+    index = df_fe.index
+
+    ends = []
+    for as_of in as_of_dates:
+        if as_of is None:
+            end = len(index)
+        else:
+            end = int(index.searchsorted(pd.Timestamp(as_of), side="right"))
+        if end < lookback:
+            raise ValueError(
+                f"Not enough history before {as_of} for a {lookback}-day window."
+            )
+        ends.append(end)
+
+    # gather only the requested windows out of the strided view
+    X = input_windows(values, lookback)[np.asarray(ends) - lookback]
 
-        Y_real[:, start:end] = target_scalers[var].inverse_transform(
-            Y_scaled[:, start:end]
+    # safety check
+    if np.isnan(X).any():
+        raise ValueError(
+            "NaNs detected in inference window. "
+            "Not enough historical data."
         )
 
-    return Y_real
\ No newline at end of file
+    n, t, f = X.shape
+    X_scaled = feature_scaler.transform(X.reshape(-1, f)).reshape(n, t, f)
+
+    return (
+        torch.tensor(X_scaled, dtype=torch.float32),
+        [index[end - 1] for end in ends],
+    )
+
+
+# INVERSE SCALE OUTPUT
+def collapse_target_scalers(target_scalers):
+    """
+    The per-target StandardScalers as (scale, offset) float arrays over the
+    flattened model output (same column layout the scalers were fitted on:
+    scaler TARGET_COLS[i] covers columns i*HORIZON .. (i+1)*HORIZON).
+    """
+    mean, scale = target_affine(target_scalers, TARGET_COLS)
+    return scale.astype(np.float64), mean.astype(np.float64)
+
+
+def inverse_scale_predictions(Y_scaled, target_scalers):
+    """
+    Y_scaled (N, HORIZON * len(TARGET_COLS)) -> physical units, same shape.
+    target_scalers: dict of scalers or an already collapsed (scale, offset).
+    """
+    if isinstance(target_scalers, dict):
+        target_scalers = collapse_target_scalers(target_scalers)
+    scale, offset = target_scalers
+    return Y_scaled * scale + offset
+
+
+def clip_targets(Y_real):
+    """Apply TARGET_LIMITS to an array whose last axis is TARGET_COLS."""
+    # + 0.0 turns the -0.0 produced by clipping/rounding into 0.0
+    return np.clip(Y_real, TARGET_LOWER, TARGET_UPPER) + 0.0
\ No newline at end of file
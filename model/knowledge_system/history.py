@@ -0,0 +1,299 @@
+"""
+Observation history of a city (weather.csv) as a resolution pyramid, for
+GET /history range queries.
+
+Levels: the daily rows, then weekly (ISO, Monday-based), monthly and yearly
+blocks holding, per target, the count, sum, min and max of the days they
+cover (mean = sum / count). Blocks are contiguous numpy arrays per level, so
+a block is found by subtracting the first key, without a search.
+
+A query for buckets of a resolution reads the precomputed blocks of the
+buckets fully inside the range; the (at most two) partial buckets at the
+edges, and the range summary, are combined from the largest aligned blocks
+that fit: full years, then months, then weeks, then at most six days of
+rows at each end. That bounds a range query to a few dozen blocks however
+long the history is.
+
+The pyramid of a city is built on first use and cached per process. When
+weather.csv changes (checked at most every HISTORY_CHECK_SEC seconds), the
+new rows are compared with the cached ones and only the blocks from the
+first changed day on are recomputed: an appended day touches one block per
+level (plus the few days QC may have re-filled before it).
+
+Only numpy/pandas are used.
+"""
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from knowledge_system.metrics import stage_timer
+from knowledge_system.qc import VALUE_COLUMNS
+
+TARGETS = tuple(VALUE_COLUMNS)
+LEVELS = ("week", "month", "year")
+RESOLUTIONS = ("day",) + LEVELS
+CHECK_INTERVAL_SECONDS = float(os.getenv("HISTORY_CHECK_SEC", "2"))
+
+
+# --------------------
+# Calendar keys
+# --------------------
+def block_key(days, level):
+    """Key of the block holding each day (days since 1970-01-01)."""
+    days = np.asarray(days, dtype=np.int64)
+    if level == "week":
+        return (days + 3) // 7          # 1970-01-01 was a Thursday
+    unit = "M" if level == "month" else "Y"
+    return days.astype("datetime64[D]").astype(f"datetime64[{unit}]").astype(np.int64)
+
+
+def block_start(keys, level):
+    """First day of each block key."""
+    keys = np.asarray(keys, dtype=np.int64)
+    if level == "week":
+        return keys * 7 - 3
+    unit = "M" if level == "month" else "Y"
+    return keys.astype(f"datetime64[{unit}]").astype("datetime64[D]").astype(np.int64)
+
+
+def day_number(value):
+    return int((pd.Timestamp(value).normalize() - pd.Timestamp("1970-01-01")).days)
+
+
+def day_string(number):
+    return str(np.datetime64(int(number), "D"))
+
+
+# --------------------
+# Pyramid
+# --------------------
+class Aggregates:
+    """count / sum / min / max per target of a run of blocks ((n, targets) arrays)."""
+
+    __slots__ = ("count", "total", "low", "high")
+
+    def __init__(self, count, total, low, high):
+        self.count, self.total, self.low, self.high = count, total, low, high
+
+    @classmethod
+    def of_rows(cls, values, starts):
+        """Blocks of daily rows (days, targets), each block starting at a row index of `starts`."""
+        present = ~np.isnan(values)
+        return cls(
+            np.add.reduceat(present, starts, axis=0).astype(np.int64),
+            np.add.reduceat(np.where(present, values, 0.0), starts, axis=0),
+            np.minimum.reduceat(np.where(present, values, np.inf), starts, axis=0),
+            np.maximum.reduceat(np.where(present, values, -np.inf), starts, axis=0),
+        )
+
+    def __len__(self):
+        return len(self.count)
+
+    def __getitem__(self, index):
+        return Aggregates(self.count[index], self.total[index], self.low[index], self.high[index])
+
+    def reduce(self):
+        """One (targets,) aggregate of all the rows."""
+        return Aggregates(self.count.sum(axis=0), self.total.sum(axis=0),
+                          self.low.min(axis=0, initial=np.inf), self.high.max(axis=0, initial=-np.inf))
+
+    @staticmethod
+    def concat(parts):
+        return Aggregates(*(np.concatenate([getattr(p, name) for p in parts]) for name in Aggregates.__slots__))
+
+
+class HistoryPyramid:
+    """Daily rows + weekly / monthly / yearly blocks of one city's weather.csv."""
+
+    def __init__(self, df, version=None):
+        self.version = version
+        self.first_day = None
+        self.values = np.zeros((0, len(TARGETS)))
+        self.levels = {}            # level -> (first key, Aggregates)
+        self.update(df, version)
+
+    @staticmethod
+    def _daily(df):
+        df = df.copy()
+        df.index = pd.to_datetime(df.index).normalize()
+        df = df[~df.index.duplicated(keep="last")].sort_index()
+        full = pd.date_range(df.index.min(), df.index.max(), freq="D")
+        values = df.reindex(full).reindex(columns=list(TARGETS)).to_numpy(dtype=np.float64)
+        return day_number(full[0]), values
+
+    @property
+    def last_day(self):
+        return self.first_day + len(self.values) - 1
+
+    def update(self, df, version=None):
+        """Take a new version of the history; recompute the blocks from the first changed day. Returns that day's row index."""
+        first_day, values = self._daily(df)
+        if first_day != self.first_day:
+            changed = 0
+        else:
+            overlap = min(len(values), len(self.values))
+            new, old = values[:overlap], self.values[:overlap]
+            same = (new == old) | (np.isnan(new) & np.isnan(old))
+            differs = np.nonzero(~same.all(axis=1))[0]
+            changed = int(differs[0]) if len(differs) else overlap
+            if len(values) < len(self.values):
+                # rows removed: the block holding the new last day shrank
+                changed = min(changed, len(values) - 1)
+        self.first_day, self.values, self.version = first_day, values, version
+        if changed < len(values) or not self.levels:
+            self._rebuild_from(changed)
+        return changed
+
+    def _rebuild_from(self, row):
+        days = self.first_day + np.arange(len(self.values))
+        for level in LEVELS:
+            keys = block_key(days, level)
+            first_key = int(keys[0])
+            previous = self.levels.get(level)
+            # recompute from the block holding `row`; keep the blocks before it
+            key = int(keys[min(row, len(keys) - 1)])
+            keep = previous[1][:key - first_key] if previous is not None and previous[0] == first_key else None
+            if keep is None:
+                key, keep = first_key, None
+            start_row = max(int(block_start(key, level)) - self.first_day, 0)
+            tail_keys = keys[start_row:]
+            starts = np.r_[0, np.nonzero(np.diff(tail_keys))[0] + 1]
+            with stage_timer("history_pyramid_update"):
+                tail = Aggregates.of_rows(self.values[start_row:], starts)
+            self.levels[level] = (first_key, tail if keep is None or not len(keep) else Aggregates.concat([keep, tail]))
+
+    # --------------------
+    # Queries
+    # --------------------
+    def _block(self, level, key):
+        first_key, blocks = self.levels[level]
+        return blocks[key - first_key:key - first_key + 1]
+
+    def summarize(self, lo, hi):
+        """(targets,) aggregate of the days lo..hi (inclusive), from the largest aligned blocks."""
+        lo, hi = max(lo, self.first_day), min(hi, self.last_day)
+        parts = []
+        cursor = lo
+        while cursor <= hi:
+            for level in ("year", "month", "week"):
+                key = int(block_key(cursor, level))
+                if int(block_start(key, level)) == cursor and int(block_start(key + 1, level)) - 1 <= hi:
+                    parts.append(self._block(level, key))
+                    cursor = int(block_start(key + 1, level))
+                    break
+            else:
+                # rows up to the next week boundary (or the end of the range)
+                end = min(int(block_start(block_key(cursor, "week") + 1, "week")) - 1, hi)
+                parts.append(Aggregates.of_rows(self.values[cursor - self.first_day:end - self.first_day + 1], [0]))
+                cursor = end + 1
+        if not parts:
+            empty = np.zeros(len(TARGETS))
+            return Aggregates(empty.astype(np.int64), empty, empty + np.inf, empty - np.inf)
+        return Aggregates.concat(parts).reduce()
+
+    def buckets(self, lo, hi, resolution):
+        """(bucket starts, bucket ends, Aggregates) of the range lo..hi at a resolution."""
+        lo, hi = max(lo, self.first_day), min(hi, self.last_day)
+        if hi < lo:
+            return np.zeros(0, np.int64), np.zeros(0, np.int64), None
+        if resolution == "day":
+            days = np.arange(lo, hi + 1)
+            return days, days, Aggregates.of_rows(self.values[lo - self.first_day:hi - self.first_day + 1],
+                                                  np.arange(hi - lo + 1))
+
+        first_key, last_key = int(block_key(lo, resolution)), int(block_key(hi, resolution))
+        keys = np.arange(first_key, last_key + 1)
+        starts = np.maximum(block_start(keys, resolution), lo)
+        ends = np.minimum(block_start(keys + 1, resolution) - 1, hi)
+        level_first, blocks = self.levels[resolution]
+        out = blocks[first_key - level_first:last_key - level_first + 1]
+        out = Aggregates(out.count.copy(), out.total.copy(), out.low.copy(), out.high.copy())
+        # partial buckets at the edges (also: the first / last block of the history)
+        for i in {0, len(keys) - 1}:
+            full_start, full_end = block_start(keys[i], resolution), block_start(keys[i] + 1, resolution) - 1
+            if starts[i] != full_start or ends[i] != full_end:
+                part = self.summarize(int(starts[i]), int(ends[i]))
+                out.count[i], out.total[i], out.low[i], out.high[i] = part.count, part.total, part.low, part.high
+        return starts, ends, out
+
+
+def to_json(aggregates, index=None, digits=2):
+    """{target: {"mean", "min", "max", "sum"}} of one bucket (None where nothing was observed)."""
+    a = aggregates if index is None else aggregates[index]
+    out = {"observed_days": int(a.count.max()) if len(a.count) else 0}
+    for j, target in enumerate(TARGETS):
+        n = int(a.count[j])
+        out[target] = None if not n else {
+            "mean": round(float(a.total[j] / n), digits),
+            "min": round(float(a.low[j]), digits),
+            "max": round(float(a.high[j]), digits),
+            "sum": round(float(a.total[j]), digits),
+        }
+    return out
+
+
+def query_etag(version, *params):
+    """ETag of a query on a given history version."""
+    return '"' + hashlib.sha1("|".join(map(str, (version,) + params)).encode()).hexdigest()[:20] + '"'
+
+
+# --------------------
+# Per-city cache
+# --------------------
+_pyramids = {}          # city dir -> (signature, HistoryPyramid, checked_at)
+_pyramids_lock = threading.Lock()
+
+
+def _weather_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def history_for(city_dir):
+    """
+    Cached HistoryPyramid of artifacts/<city>/weather.csv, updated
+    incrementally when the file changes (checked at most every
+    CHECK_INTERVAL_SECONDS). None when the city has no history.
+    """
+    key = str(city_dir)
+    now = time.monotonic()
+    cached = _pyramids.get(key)
+    if cached is not None and now - cached[2] < CHECK_INTERVAL_SECONDS:
+        return cached[1]
+
+    path = Path(city_dir) / "weather.csv"
+    signature = _weather_signature(path)
+    with _pyramids_lock:
+        cached = _pyramids.get(key)
+        if cached is not None and cached[0] == signature:
+            _pyramids[key] = (signature, cached[1], now)
+            return cached[1]
+        if signature is None:
+            return None
+        df = pd.read_csv(path, index_col=0, parse_dates=True)
+        version = "%x-%x" % signature
+        if cached is None:
+            with stage_timer("history_pyramid_build"):
+                pyramid = HistoryPyramid(df, version)
+        else:
+            # a new pyramid object: responses being built from the old one stay consistent
+            pyramid = HistoryPyramid.__new__(HistoryPyramid)
+            old = cached[1]
+            pyramid.first_day, pyramid.values, pyramid.levels = old.first_day, old.values, dict(old.levels)
+            pyramid.update(df, version)
+        _pyramids[key] = (signature, pyramid, now)
+        return pyramid
+
+
+def forget(city_dir):
+    """Drop the cached pyramid of a city (e.g. when its artifacts are evicted)."""
+    with _pyramids_lock:
+        _pyramids.pop(str(city_dir), None)
@@ -0,0 +1,244 @@
+"""
+Out-of-process inference with request micro-batching.
+
+Web workers hand forecast requests to an InferencePool instead of running
+the torch forward and pandas parsing under their own GIL. A dispatcher
+thread drains a bounded request queue, collects everything that arrives
+within a short batch window, groups it by model (artifact folder) and sends
+each group to a process pool as ONE task, which runs one batched
+WeatherLSTM forward for all of that city's windows. Callers get a
+concurrent.futures.Future per request (wrap with asyncio.wrap_future in
+async handlers).
+
+Identical (city, as_of) requests share a window, so concurrent /forecast
+calls for one city (all as_of=None) coalesce into one window; the batched
+forward carries several windows per city for /forecast/batch items, which
+have distinct as_of dates. A request the caller gave up on (Future
+cancelled, e.g. after a timeout) is still computed with its batch, but its
+result is dropped.
+
+Configuration (environment, read by pool_from_env):
+    INFERENCE_WORKERS           process count; 0 keeps inference in-process
+    INFERENCE_QUEUE_SIZE        pending requests before submit() raises queue.Full
+    INFERENCE_BATCH_WINDOW_MS   how long the dispatcher waits to grow a batch
+    INFERENCE_MAX_BATCH         hard cap on requests per batch
+    INFERENCE_TORCH_THREADS     torch intra-op threads per worker process
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from knowledge_system import metrics
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = metrics.histogram(
+    "inference_batch_size",
+    "Requests served by one batched forward",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+QUEUE_WAIT_SECONDS = metrics.histogram(
+    "inference_queue_wait_seconds",
+    "Time a request spent queued before its batch was dispatched",
+)
+QUEUE_REJECTED = metrics.counter(
+    "inference_queue_rejected_total",
+    "Requests rejected because the inference queue was full",
+)
+ABANDONED = metrics.counter(
+    "inference_abandoned_total",
+    "Requests cancelled by their caller before their batch finished",
+)
+
+
+# --------------------
+# Worker process side
+# --------------------
+_worker_artifacts = None
+
+
+def _init_worker(torch_threads):
+    import torch
+    torch.set_num_threads(torch_threads)
+
+
+def _load_with_features(artifact_path):
+    from knowledge_system.catalog import load_city_artifacts
+    from knowledge_system.helpers import apply_feature_engineering
+
+    artifacts = load_city_artifacts(artifact_path)
+    return {**artifacts, "df_fe": apply_feature_engineering(artifacts["df"])}
+
+
+def _worker_load(artifact_path):
+    # Artifacts (plus their feature-engineered history) stay resident in the
+    # worker between batches, within the same memory budget as the web
+    # process; reloaded only when one of the input files changes.
+    global _worker_artifacts
+    from knowledge_system.catalog import ResidentArtifacts
+
+    if _worker_artifacts is None:
+        _worker_artifacts = ResidentArtifacts(loader=_load_with_features)
+    artifacts = _worker_artifacts.get(artifact_path)
+    return artifacts, artifacts["df_fe"]
+
+
+def forecast_batch(artifact_path, as_of_dates):
+    """Run in a worker: one batched forward for all windows of one city."""
+    from knowledge_system.run_forecast import forecast_batch_from_artifacts
+
+    artifacts, df_fe = _worker_load(artifact_path)
+
+    # identical (city, as_of) requests in one batch share a window
+    unique = list(dict.fromkeys(as_of_dates))
+    try:
+        results = forecast_batch_from_artifacts(artifacts, unique, df_fe=df_fe)
+    except ValueError:
+        # one bad window (e.g. not enough history) must not sink the rest:
+        # it comes back as its own request's exception
+        results = []
+        for as_of in unique:
+            try:
+                results.append(forecast_batch_from_artifacts(artifacts, [as_of], df_fe=df_fe)[0])
+            except ValueError as e:
+                results.append(e)
+    by_as_of = dict(zip(unique, results))
+    return [by_as_of[a] for a in as_of_dates]
+
+
+# --------------------
+# Web process side
+# --------------------
+class _Request:
+    __slots__ = ("artifact_path", "as_of", "future", "enqueued_at")
+
+    def __init__(self, artifact_path, as_of):
+        self.artifact_path = artifact_path
+        self.as_of = as_of
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class InferencePool:
+    def __init__(self, max_workers=2, queue_size=256, batch_window_ms=5.0, max_batch=64, torch_threads=1):
+        self.batch_window_s = batch_window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            # spawn: forking a process that already started torch threads can deadlock
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(torch_threads,),
+        )
+        self._closed = False
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="inference-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, artifact_path, as_of=None, timeout=0):
+        """
+        Queue one forecast; returns a Future. Raises queue.Full when the queue
+        is saturated (after waiting up to `timeout` seconds for room).
+        """
+        if self._closed:
+            raise RuntimeError("InferencePool is shut down")
+        request = _Request(str(artifact_path), as_of)
+        try:
+            if timeout > 0:
+                self._queue.put(request, timeout=timeout)
+            else:
+                self._queue.put_nowait(request)
+        except queue.Full:
+            QUEUE_REJECTED.inc()
+            raise
+        return request.future
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.batch_window_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # let the loop see the shutdown marker
+                break
+            batch.append(item)
+        return batch
+
+    def _dispatch_loop(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                return
+
+            now = time.perf_counter()
+            groups = {}
+            for request in batch:
+                QUEUE_WAIT_SECONDS.observe(now - request.enqueued_at)
+                groups.setdefault(request.artifact_path, []).append(request)
+
+            for artifact_path, requests in groups.items():
+                BATCH_SIZE.observe(len(requests))
+                try:
+                    task = self._executor.submit(
+                        forecast_batch, artifact_path, [r.as_of for r in requests]
+                    )
+                except Exception as e:
+                    for r in requests:
+                        self._settle(r, e)
+                    continue
+                task.add_done_callback(lambda t, rs=requests: self._resolve(t, rs))
+
+    @staticmethod
+    def _settle(request, result):
+        if not request.future.set_running_or_notify_cancel():
+            ABANDONED.inc()
+            return
+        if isinstance(result, BaseException):
+            request.future.set_exception(result)
+        else:
+            request.future.set_result(result)
+
+    @classmethod
+    def _resolve(cls, task, requests):
+        exc = task.exception()
+        results = [exc] * len(requests) if exc is not None else task.result()
+        for r, result in zip(requests, results):
+            cls._settle(r, result)
+
+    def shutdown(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._dispatcher.join(timeout=5)
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def pool_from_env():
+    """InferencePool configured from INFERENCE_* variables, or None if disabled."""
+    workers = int(os.getenv("INFERENCE_WORKERS", "0"))
+    if workers <= 0:
+        return None
+    pool = InferencePool(
+        max_workers=workers,
+        queue_size=int(os.getenv("INFERENCE_QUEUE_SIZE", "256")),
+        batch_window_ms=float(os.getenv("INFERENCE_BATCH_WINDOW_MS", "5")),
+        max_batch=int(os.getenv("INFERENCE_MAX_BATCH", "64")),
+        torch_threads=int(os.getenv("INFERENCE_TORCH_THREADS", "1")),
+    )
+    atexit.register(pool.shutdown)
+    return pool
@@ -0,0 +1,88 @@
+"""
+Artifact manifests and atomic promotion of new model versions.
+
+Layout of a city's artifact folder:
+    artifacts/<city>/best_lstm_model.pt          live files read by run_forecast
+    artifacts/<city>/feature_scaler_bundle.pkl
+    artifacts/<city>/target_scalers.pkl
+    artifacts/<city>/weather.csv
+    artifacts/<city>/manifest.json               describes the live version
+    artifacts/<city>/versions/<version>/...      every version ever written
+
+New versions are first written completely under versions/<version>/, then
+promoted by replacing each live file with os.replace (atomic per file) and
+writing manifest.json last. A replaced file keeps the mode of the file it
+replaces, so the promote never narrows who can read the live artifacts.
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+from knowledge_system.shared_store import atomic_copy, atomic_write_json
+
+MANIFEST_NAME = "manifest.json"
+VERSIONS_DIR = "versions"
+MODEL_FILES = ["best_lstm_model.pt", "feature_scaler_bundle.pkl", "target_scalers.pkl"]
+HISTORY_LIMIT = 50
+
+
+def new_version():
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+
+
+def utc_now():
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_json_atomic(path, payload):
+    atomic_write_json(path, payload, indent=2, default=str)
+
+
+def read_manifest(city_dir):
+    """The live manifest of an artifact folder, or None if it has none yet."""
+    path = Path(city_dir) / MANIFEST_NAME
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def version_dir(city_dir, version):
+    return Path(city_dir) / VERSIONS_DIR / version
+
+
+def promote_version(city_dir, version, manifest, files=MODEL_FILES):
+    """
+    Make versions/<version>/ the live version of city_dir: copy each file next
+    to its destination, os.replace it into place, then write manifest.json.
+    """
+    city_dir = Path(city_dir)
+    src = version_dir(city_dir, version)
+
+    for name in files:
+        atomic_copy(src / name, city_dir / name)
+
+    previous = read_manifest(city_dir)
+    history = list(previous.get("history", [])) if previous else []
+    if previous:
+        history.append({
+            "version": previous.get("version"),
+            "promoted_at": previous.get("promoted_at"),
+            "kind": previous.get("kind"),
+            "metrics": previous.get("metrics"),
+        })
+
+    manifest = dict(manifest)
+    manifest["promoted_at"] = utc_now()
+    manifest["history"] = history[-HISTORY_LIMIT:]
+    write_json_atomic(city_dir / MANIFEST_NAME, manifest)
+    return manifest
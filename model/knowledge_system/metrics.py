@@ -0,0 +1,357 @@
+"""
+Lightweight in-process metrics for the forecast service.
+
+Counters, gauges and histograms are kept in a module-level registry and
+rendered in the Prometheus text exposition format by `render_prometheus()`.
+Recording a value is a lock + a few arithmetic ops, so the instrumentation
+stays on permanently.
+
+An optional sampling profiler (`profile_if_slow`) can be enabled with the
+SLOW_REQUEST_PROFILE_MS environment variable: while a profiled block runs, a
+single background thread samples its stack; if the block ends up slower than
+the threshold, the most frequent stacks are logged.
+"""
+import bisect
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter as _StackCounter
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers sub-millisecond rule evaluation up to multi-second cold loads
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + body + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self):
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+            for key, v in items
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        # callback() -> value, evaluated at scrape time (unlabelled gauges only)
+        self._callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self):
+        if self._callback is not None:
+            try:
+                return [f"{self.name} {_format_value(self._callback())}"]
+            except Exception as e:
+                logger.debug("Gauge callback %s failed: %s", self.name, e)
+                return []
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}"
+            for key, v in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., sum, count]
+        self._values = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            if idx < len(self.buckets):
+                state[idx] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def snapshot(self, **labels):
+        """Return (sum, count) for one label set."""
+        state = self._values.get(self._key(labels))
+        if state is None:
+            return 0.0, 0
+        return state[-2], state[-1]
+
+    def render(self):
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, state[:-2]):
+                cumulative += n
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {cumulative}"
+                )
+            lines.append(
+                f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {state[-1]}"
+            )
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+        return lines
+
+
+def _register(metric):
+    with _registry_lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                raise ValueError(f"Metric {metric.name} already registered with a different shape")
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+
+def counter(name, documentation, labelnames=()):
+    return _register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=(), callback=None):
+    return _register(Gauge(name, documentation, labelnames, callback=callback))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, documentation, labelnames, buckets=buckets))
+
+
+def render_prometheus():
+    """Render every registered metric in Prometheus text format (0.0.4)."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        body = metric.render()
+        if body:
+            lines.extend(metric.header())
+            lines.extend(body)
+    return "\n".join(lines) + "\n"
+
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# --------------------
+# Shared service metrics
+# --------------------
+def _process_rss_bytes():
+    import psutil
+    return psutil.Process(os.getpid()).memory_info().rss
+
+
+STAGE_SECONDS = histogram(
+    "forecast_stage_duration_seconds",
+    "Wall time of each forecast pipeline stage",
+    labelnames=("stage",),
+)
+
+PROCESS_RSS = gauge(
+    "process_resident_memory_bytes",
+    "Resident set size of this worker process",
+    callback=_process_rss_bytes,
+)
+
+
+@contextmanager
+def stage_timer(stage):
+    """Record the wall time of the enclosed block under forecast_stage_duration_seconds."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - t0, stage=stage)
+
+
+# --------------------
+# Optional sampling profiler for slow calls
+# --------------------
+SLOW_PROFILE_THRESHOLD_MS = float(os.getenv("SLOW_REQUEST_PROFILE_MS", "0"))
+SLOW_PROFILE_INTERVAL_MS = float(os.getenv("SLOW_REQUEST_PROFILE_INTERVAL_MS", "5"))
+SLOW_PROFILE_TOP_STACKS = 10
+
+
+class _StackSampler:
+    """One daemon thread sampling the stacks of every registered thread."""
+
+    def __init__(self, interval_s):
+        self.interval_s = interval_s
+        self._targets = {}          # thread ident -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="slow-call-sampler", daemon=True)
+            self._thread.start()
+
+    def start(self, ident):
+        with self._lock:
+            self._targets[ident] = _StackCounter()
+            self._ensure_started()
+
+    def stop(self, ident):
+        """The samples taken for a thread since start(), no longer updated."""
+        with self._lock:
+            return _StackCounter(self._targets.pop(ident, ()))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval_s)
+            # counters are only touched under the lock: stop() never sees one mid-update
+            with self._lock:
+                if not self._targets:
+                    continue
+                frames = sys._current_frames()
+                for ident, samples in self._targets.items():
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                        frame = frame.f_back
+                    samples[";".join(reversed(stack))] += 1
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def _get_sampler():
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = _StackSampler(SLOW_PROFILE_INTERVAL_MS / 1000.0)
+    return _sampler
+
+
+@contextmanager
+def profile_if_slow(label, threshold_ms=None):
+    """
+    Sample the current thread while the block runs and log the hottest stacks
+    if it took longer than threshold_ms. No-op when the threshold is 0.
+    """
+    threshold_ms = SLOW_PROFILE_THRESHOLD_MS if threshold_ms is None else threshold_ms
+    if threshold_ms <= 0:
+        yield
+        return
+
+    sampler = _get_sampler()
+    ident = threading.get_ident()
+    sampler.start(ident)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        samples = sampler.stop(ident)
+        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+        if elapsed_ms >= threshold_ms:
+            SLOW_CALLS.inc(label=label)
+            top = samples.most_common(SLOW_PROFILE_TOP_STACKS)
+            logger.warning(
+                "Slow call %s: %.1f ms (%d samples)\n%s",
+                label,
+                elapsed_ms,
+                sum(samples.values()),
+                "\n".join(f"{n:5d} {stack}" for stack, n in top),
+            )
+
+
+SLOW_CALLS = counter(
+    "slow_calls_total",
+    "Calls that exceeded SLOW_REQUEST_PROFILE_MS and were profiled",
+    labelnames=("label",),
+)
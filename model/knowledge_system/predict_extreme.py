@@ -1,218 +1,563 @@
 # Morocco Extreme Weather Event Detection System
 # Knowledge Engineering Implementation for 7-Day Forecasts
+#
+# The rules live in a declarative catalog (rules.json next to this file, or
+# EXTREME_RULES_PATH): thresholds and their combinators, categories,
+# multi-day patterns and the recommendation of each rule. The catalog is
+# validated and compiled into an immutable RuleTable: every rule (daily and
+# multi-day) gets an integer id, its metadata strings are interned, and its
+# category, severity rank, compound flag and recommendations are resolved up
+# front. Detection then only creates small Event records (__slots__) that
+# point at their rule; the JSON dicts of the response are built from them
+# once, when the result is assembled.
+#
+# Running workers pick up catalog edits on their own: current_rules() stats
+# the file at most every EXTREME_RULES_CHECK_SEC seconds and swaps in the
+# new table once it compiled (a broken edit is logged and the previous table
+# kept). Cached forecasts carry metadata.rules_version, and refresh_events()
+# re-runs only the event layer on them when the version changed.
+
+import hashlib
+import json
+import logging
+import math
+import os
+import string
+import sys
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from types import MappingProxyType
+from typing import Callable, NamedTuple, Optional
+
+from knowledge_system import metrics
+from knowledge_system.climatology import climatology_for
+from knowledge_system.metrics import stage_timer
+
+logger = logging.getLogger(__name__)
+
+RULES_PATH = Path(os.getenv("EXTREME_RULES_PATH", Path(__file__).resolve().parent / "rules.json"))
+RULES_CHECK_INTERVAL_SECONDS = float(os.getenv("EXTREME_RULES_CHECK_SEC", "2"))
+
+SEVERITY_RANKS = {"LOW": 1, "MODERATE": 2, "HIGH": 3, "EXTREME": 4}
+CONFIDENCE_LEVELS = ("LOW", "MODERATE", "HIGH")
+
+# variables a condition can test (one forecast day, see detect_extreme_events)
+DAY_VARIABLES = ("t_mean", "t_max", "t_min", "rain", "wind", "dew", "vis")
+COMPARISONS = ("<", "<=", ">", ">=", "==")
+
+# criteria reported for single-day events, in the order of Event.values
+CRITERIA_KEYS = (
+    "t_max",
+    "t_min",
+    "t_mean",
+    "precipitation_mm",
+    "wind_kmh",
+    "dew_point",
+    "visibility_km",
+)
+
+# multi-day pattern kinds -> criteria names their description may use
+PATTERN_KINDS = {
+    "streak": ("duration_days",),
+    "rain_total": ("total_precipitation_mm", "duration_days"),
+    "temperature_drop": ("temperature_drop", "from_temp", "to_temp"),
+}
+
+RULE_CATALOG_RELOADS = metrics.counter(
+    "rule_catalog_reloads_total",
+    "Rule catalog (re)loads by result",
+    labelnames=("result",),
+)
+
+
+# --------------------
+# Compiled rule table
+# --------------------
+class Rule(NamedTuple):
+    id: int
+    event_id: str
+    name: str
+    description: str            # format template for multi-day patterns
+    severity: str
+    severity_rank: int
+    confidence: str
+    source: str
+    category: str
+    compound: bool
+    advice: frozenset
+    condition: Optional[Callable]
+    kind: Optional[str] = None  # multi-day pattern kind, None for daily rules
+    params: MappingProxyType = MappingProxyType({})
+    criteria: tuple = ()        # (name, aggregate, variable, unit) for streaks
+    percentiles: tuple = ()     # (day key, variable, q) climatology thresholds used
+
+
+class RuleTable(NamedTuple):
+    version: str
+    rules: tuple                # Rule by id
+    by_event_id: MappingProxyType
+    daily: tuple                # rules evaluated on every forecast day, in order
+    patterns: tuple             # multi-day rules, in order
+    no_events_advice: str
+    urgent_advice: str
+    profile: Optional[str] = None
+    percentiles: tuple = ()     # climatology thresholds the day dicts need
+    profiles: MappingProxyType = MappingProxyType({})   # name -> RuleTable
+    stations: MappingProxyType = MappingProxyType({})   # station -> profile name
+
+    def for_station(self, station):
+        """The table of the profile `station` belongs to (this one by default)."""
+        profile = self.stations.get(station)
+        return self.profiles[profile] if profile is not None else self
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def _require(spec, key, kind, path):
+    if key not in spec:
+        raise ValueError(f"{path}: missing '{key}'")
+    value = spec[key]
+    if kind is float:
+        ok = isinstance(value, (int, float)) and not isinstance(value, bool)
+    elif kind is int:
+        ok = isinstance(value, int) and not isinstance(value, bool) and value >= 1
+    else:
+        ok = isinstance(value, kind) and (kind is not str or value != "")
+    if not ok:
+        raise ValueError(f"{path}.{key}: expected {'positive int' if kind is int else kind.__name__}, got {value!r}")
+    return value
+
+
+def _percentile_key(var, q):
+    return f"p{q:g}_{var}"
+
+
+def _condition_source(node, path, percentiles):
+    """
+    Validated condition tree -> Python expression over the day dict `d`.
+    Climatology thresholds are read from day keys (_percentile_key) and
+    collected into `percentiles` as (key, variable, q).
+    """
+    if not isinstance(node, dict) or not node:
+        raise ValueError(f"{path}: a condition must be a non-empty object")
+
+    if "all" in node or "any" in node:
+        key = "all" if "all" in node else "any"
+        if len(node) != 1 or not isinstance(node[key], list) or not node[key]:
+            raise ValueError(f"{path}: '{key}' takes a non-empty list and nothing else")
+        parts = [_condition_source(sub, f"{path}.{key}[{i}]", percentiles) for i, sub in enumerate(node[key])]
+        return "(" + (" and " if key == "all" else " or ").join(parts) + ")"
+
+    if "not" in node:
+        if len(node) != 1:
+            raise ValueError(f"{path}: 'not' takes one condition and nothing else")
+        return f"(not {_condition_source(node['not'], f'{path}.not', percentiles)})"
+
+    tests = [(op, node[op]) for op in COMPARISONS if op in node]
+    unknown = set(node) - set(COMPARISONS) - {"var", "diff"}
+    if unknown or not tests or ("var" in node) == ("diff" in node):
+        raise ValueError(
+            f"{path}: a comparison needs exactly one of 'var'/'diff' and at least one of "
+            f"{list(COMPARISONS)} (got keys {sorted(node)})"
+        )
+    if "var" in node:
+        var = node["var"]
+        if var not in DAY_VARIABLES:
+            raise ValueError(f"{path}.var: unknown variable {var!r} (one of {list(DAY_VARIABLES)})")
+        value = f"d[{var!r}]"
+    else:
+        var = None
+        pair = node["diff"]
+        if not (isinstance(pair, list) and len(pair) == 2 and all(v in DAY_VARIABLES for v in pair)):
+            raise ValueError(f"{path}.diff: expected two variables out of {list(DAY_VARIABLES)}, got {pair!r}")
+        value = f"(d[{pair[0]!r}] - d[{pair[1]!r}])"
+
+    terms = []
+    for op, threshold in tests:
+        if isinstance(threshold, dict) and var is not None:
+            q = threshold.get("percentile")
+            if set(threshold) != {"percentile"} or not isinstance(q, (int, float)) or isinstance(q, bool) or not 0 < q < 100:
+                raise ValueError(f"{path}.{op}: expected {{\"percentile\": q}} with 0 < q < 100, got {threshold!r}")
+            key = _percentile_key(var, q)
+            percentiles.add((key, var, float(q)))
+            terms.append(f"{value} {op} d[{key!r}]")
+        elif isinstance(threshold, (int, float)) and not isinstance(threshold, bool) and math.isfinite(threshold):
+            terms.append(f"{value} {op} {threshold!r}")
+        else:
+            raise ValueError(f"{path}.{op}: expected a finite number or (with 'var') a percentile, got {threshold!r}")
+
+    return "(" + " and ".join(terms) + ")"
+
+
+def _compile_condition(node, path):
+    """
+    Condition tree -> predicate on a day dict (see the catalog format in the
+    README). The tree is turned into one Python expression, built only from
+    DAY_VARIABLES, COMPARISONS, numbers and percentile keys, so a rule costs
+    what a hand-written lambda did. Returns (predicate, percentiles used).
+    """
+    percentiles = set()
+    source = _condition_source(node, path, percentiles)
+    predicate = eval(compile(f"lambda d: {source}", f"<{path}>", "eval"), {"__builtins__": {}})
+    return predicate, tuple(sorted(percentiles))
+
+
+def _compile_criteria(specs, path):
+    criteria = []
+    for i, spec in enumerate(specs):
+        where = f"{path}[{i}]"
+        name = _require(spec, "name", str, where)
+        aggregates = [a for a in ("range", "sum") if a in spec]
+        if len(aggregates) != 1:
+            raise ValueError(f"{where}: expected exactly one of 'range'/'sum'")
+        var = spec[aggregates[0]]
+        if var not in DAY_VARIABLES:
+            raise ValueError(f"{where}.{aggregates[0]}: unknown variable {var!r}")
+        criteria.append((_intern(name), aggregates[0], var, _intern(spec.get("unit", ""))))
+    return tuple(criteria)
+
+
+def _check_template(template, names, path):
+    try:
+        fields = {f for _, f, _, _ in string.Formatter().parse(template) if f}
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}")
+    unknown = fields - set(names)
+    if unknown:
+        raise ValueError(f"{path}: unknown placeholder(s) {sorted(unknown)} (available: {list(names)})")
+
+
+def _compile_rule(rule_id, spec, advice_texts, path, pattern):
+    if not isinstance(spec, dict):
+        raise ValueError(f"{path}: expected an object")
+    event_id = _require(spec, "id", str, path)
+    severity = _require(spec, "severity", str, path)
+    if severity not in SEVERITY_RANKS:
+        raise ValueError(f"{path}.severity: {severity!r} is not one of {list(SEVERITY_RANKS)}")
+    confidence = _require(spec, "confidence", str, path)
+    if confidence not in CONFIDENCE_LEVELS:
+        raise ValueError(f"{path}.confidence: {confidence!r} is not one of {list(CONFIDENCE_LEVELS)}")
+    advice_keys = spec.get("advice", [])
+    if not isinstance(advice_keys, list) or any(k not in advice_texts for k in advice_keys):
+        raise ValueError(f"{path}.advice: expected keys of 'recommendations', got {advice_keys!r}")
+    category = _require(spec, "category", str, path)
+    description = _require(spec, "description", str, path)
+
+    kind, params, criteria, condition, percentiles = None, {}, (), None, ()
+    if pattern:
+        kind = _require(spec, "kind", str, path)
+        if kind not in PATTERN_KINDS:
+            raise ValueError(f"{path}.kind: {kind!r} is not one of {list(PATTERN_KINDS)}")
+        names = PATTERN_KINDS[kind]
+        if kind == "streak":
+            condition, percentiles = _compile_condition(spec.get("when"), f"{path}.when")
+            params["min_days"] = _require(spec, "min_days", int, path)
+            criteria = _compile_criteria(spec.get("criteria", []), f"{path}.criteria")
+            names = names + tuple(c[0] for c in criteria)
+        elif kind == "rain_total":
+            params["days"] = _require(spec, "days", int, path)
+            params["min_total"] = float(_require(spec, "min_total", float, path))
+        else:
+            params["min_drop"] = float(_require(spec, "min_drop", float, path))
+        _check_template(description, names, f"{path}.description")
+    else:
+        condition, percentiles = _compile_condition(spec.get("when"), f"{path}.when")
+
+    return Rule(
+        id=rule_id,
+        event_id=_intern(event_id),
+        name=_intern(_require(spec, "name", str, path)),
+        description=_intern(description),
+        severity=_intern(severity),
+        severity_rank=SEVERITY_RANKS[severity],
+        confidence=_intern(confidence),
+        source=_intern(_require(spec, "source", str, path)),
+        category=_intern(category),
+        # compound events: only the most severe one is kept per day
+        compound=not pattern and category == "Compound",
+        advice=frozenset(advice_texts[k] for k in advice_keys),
+        condition=condition,
+        kind=kind,
+        params=MappingProxyType(params),
+        criteria=criteria,
+        percentiles=percentiles,
+    )
+
+
+def _table(rules, version, advice_texts, **extra):
+    return RuleTable(
+        version=version,
+        rules=tuple(rules),
+        by_event_id=MappingProxyType({rule.event_id: rule for rule in rules}),
+        daily=tuple(rule for rule in rules if rule.kind is None),
+        patterns=tuple(rule for rule in rules if rule.kind is not None),
+        no_events_advice=advice_texts["none"],
+        urgent_advice=advice_texts["urgent"],
+        percentiles=tuple(sorted({p for rule in rules for p in rule.percentiles})),
+        **extra,
+    )
+
+
+def _compile_profiles(catalog, rules, specs, advice_texts, errors):
+    """profiles section -> ({name: [Rule by id]}, {station: name})."""
+    profiles, stations = {}, {}
+    section = catalog.get("profiles", {})
+    if not isinstance(section, dict):
+        errors.append("profiles: expected an object")
+        return profiles, stations
+
+    by_event_id = {rule.event_id: rule for rule in rules}
+    for name, profile in section.items():
+        where = f"profiles.{name}"
+        overrides = profile.get("rules", {}) if isinstance(profile, dict) else None
+        members = profile.get("stations", []) if isinstance(profile, dict) else None
+        if not isinstance(overrides, dict) or not isinstance(members, list):
+            errors.append(f"{where}: expected an object with 'rules' (object) and 'stations' (list)")
+            continue
+        for event_id in sorted(set(overrides) - set(by_event_id)):
+            errors.append(f"{where}.rules: unknown rule {event_id!r}")
+
+        # rules without an override are shared with the default table
+        profile_rules = []
+        for rule in rules:
+            override = overrides.get(rule.event_id)
+            if override is None:
+                profile_rules.append(rule)
+                continue
+            if not isinstance(override, dict) or "id" in override or "kind" in override:
+                errors.append(f"{where}.rules.{rule.event_id}: expected an object of fields to override (not 'id'/'kind')")
+                continue
+            try:
+                profile_rules.append(_compile_rule(
+                    rule.id, {**specs[rule.id], **override}, advice_texts,
+                    f"{where}.rules.{rule.event_id}", rule.kind is not None,
+                ))
+            except ValueError as e:
+                errors.append(str(e))
+
+        for station in members:
+            if not isinstance(station, str) or not station:
+                errors.append(f"{where}.stations: expected station names, got {station!r}")
+            elif station in stations:
+                errors.append(f"{where}.stations: {station!r} is already in profile {stations[station]!r}")
+            else:
+                stations[station] = name
+        profiles[name] = profile_rules
+    return profiles, stations
+
+
+def compile_rules(catalog, version=None):
+    """
+    Validate a parsed catalog and compile it into a RuleTable (ids follow
+    definition order, daily rules first), with one table per profile under
+    .profiles. Every problem found is reported in one ValueError.
+    """
+    if not isinstance(catalog, dict):
+        raise ValueError("Invalid rule catalog: expected a JSON object")
+    errors = []
+    advice_texts = catalog.get("recommendations")
+    if not isinstance(advice_texts, dict) or not all(isinstance(v, str) for v in advice_texts.values()):
+        errors.append("recommendations: expected an object of strings")
+        advice_texts = {}
+    for key in ("none", "urgent"):
+        if key not in advice_texts:
+            errors.append(f"recommendations: missing '{key}'")
+    advice_texts = {k: _intern(v) for k, v in advice_texts.items()}
+    usable_advice = {k: v for k, v in advice_texts.items() if k not in ("none", "urgent")}
+
+    rules = []
+    specs = []      # catalog spec by rule id, for the profile overrides
+    for section, pattern in (("rules", False), ("patterns", True)):
+        section_specs = catalog.get(section, [])
+        if not isinstance(section_specs, list):
+            errors.append(f"{section}: expected a list")
+            continue
+        for i, spec in enumerate(section_specs):
+            try:
+                rule = _compile_rule(len(rules), spec, usable_advice, f"{section}[{i}]", pattern)
+            except ValueError as e:
+                errors.append(str(e))
+                continue
+            if any(r.event_id == rule.event_id for r in rules):
+                errors.append(f"{section}[{i}].id: duplicate id {rule.event_id!r}")
+                continue
+            rules.append(rule)
+            specs.append(spec)
+    if not rules and not errors:
+        errors.append("no rules defined")
+    profiles, stations = _compile_profiles(catalog, rules, specs, usable_advice, errors)
+    if errors:
+        raise ValueError("Invalid rule catalog:\n  - " + "\n  - ".join(errors))
+
+    version = version or str(catalog.get("version", "unversioned"))
+    return _table(
+        rules, version, advice_texts,
+        profiles=MappingProxyType({
+            name: _table(profile_rules, version, advice_texts, profile=_intern(name))
+            for name, profile_rules in profiles.items()
+        }),
+        stations=MappingProxyType(stations),
+    )
+
+
+def load_rules(path=RULES_PATH):
+    """Read, validate and compile a catalog file; its version includes a content hash."""
+    raw = Path(path).read_bytes()
+    catalog = json.loads(raw)
+    digest = hashlib.sha256(raw).hexdigest()[:12]
+    declared = catalog.get("version", "unversioned") if isinstance(catalog, dict) else "unversioned"
+    return compile_rules(catalog, version=f"{declared}+{digest}")
+
+
+# --------------------
+# Hot reload
+# --------------------
+_rules = None
+_rules_signature = None
+_rules_checked_at = 0.0
+_rules_lock = threading.Lock()
+
+
+def _catalog_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def current_rules():
+    """
+    The compiled catalog of RULES_PATH, reloaded when the file changed. The
+    file is stat'ed at most every RULES_CHECK_INTERVAL_SECONDS; a new table
+    replaces the old one in a single assignment, so a detection run always
+    sees one consistent table. A catalog that fails validation is logged and
+    the previous table stays in use (at start-up the error is raised).
+    """
+    global _rules, _rules_signature, _rules_checked_at
+    if _rules is not None and time.monotonic() - _rules_checked_at < RULES_CHECK_INTERVAL_SECONDS:
+        return _rules
+
+    with _rules_lock:
+        if _rules is not None and time.monotonic() - _rules_checked_at < RULES_CHECK_INTERVAL_SECONDS:
+            return _rules
+        signature = _catalog_signature(RULES_PATH)
+        if _rules is None or signature != _rules_signature:
+            try:
+                rules = load_rules(RULES_PATH)
+            except (OSError, ValueError) as e:
+                RULE_CATALOG_RELOADS.inc(result="error")
+                if _rules is None:
+                    raise
+                logger.warning("Rule catalog %s not reloaded, keeping %s: %s", RULES_PATH, _rules.version, e)
+            else:
+                RULE_CATALOG_RELOADS.inc(result="ok")
+                if _rules is not None:
+                    logger.info("Rule catalog reloaded: %s -> %s", _rules.version, rules.version)
+                _rules = rules
+            # a broken file is not re-parsed until it changes again
+            _rules_signature = signature
+        _rules_checked_at = time.monotonic()
+        return _rules
+
+
+class Event:
+    """
+    One detected event. Metadata is read from `rule`; single-day events keep
+    the day's CRITERIA_KEYS values as a tuple shared by all events of that day.
+    """
+    __slots__ = ("rule", "date", "values", "description", "criteria")
+
+    def __init__(self, rule, date, values=None, description=None, criteria=None):
+        self.rule = rule
+        self.date = date
+        self.values = values
+        self.description = description or rule.description
+        self.criteria = criteria
+
+    @property
+    def rule_id(self):
+        return self.rule.id
+
+    def criteria_json(self):
+        if self.criteria is None:
+            self.criteria = dict(zip(CRITERIA_KEYS, self.values))
+        return self.criteria
+
+    def to_json(self):
+        """Event as listed under a forecast day."""
+        rule = self.rule
+        return {
+            "date": self.date,
+            "event_id": rule.event_id,
+            "type": rule.name,
+            "description": self.description,
+            "severity": rule.severity,
+            "confidence": rule.confidence,
+            "source": rule.source,
+            "criteria": self.criteria_json()
+        }
+
+    def detail_json(self):
+        """Event as listed under detailed_events in the summary."""
+        rule = self.rule
+        return {
+            "date": self.date,
+            "event_id": rule.event_id,
+            "type": rule.name,
+            "description": self.description,
+            "severity": rule.severity,
+            "confidence": rule.confidence,
+            "category": rule.category,
+            "source": rule.source,
+            "criteria": self.criteria_json()
+        }
+
 
 class MoroccoWeatherKnowledgeSystem:
     """
     Knowledge-based system for extreme weather detection in Morocco
     Based on meteorological research and Moroccan climate thresholds
+
+    Without `rules` the system follows current_rules(), i.e. the hot-reloaded
+    catalog; pass a RuleTable to pin one. `station` selects its threshold
+    profile, and `climatology` (a climatology.ClimatologyIndex of that
+    station) provides the percentile thresholds the profile refers to.
     """
-    
-    def __init__(self):
-        # Knowledge Base: Rules derived from Moroccan meteorological standards
-        self.knowledge_base = self._initialize_knowledge_base()
-    
-    def _initialize_knowledge_base(self):
-        """Initialize the knowledge base with expert rules"""
-        return {
-            # HEAT-RELATED RULES
-            "extreme_heat": {
-                "name": "Extreme Heat",
-                "description": "Dangerously high temperature - red alert level",
-                "condition": lambda d: d["t_max"] >= 45.0,
-                "severity": "EXTREME",
-                "confidence": "HIGH",
-                "source": "Morocco recorded 50.4°C in 2023; DGM red alert threshold"
-            },
-            
-            "high_heat": {
-                "name": "High Heat",
-                "description": "Hot conditions requiring precautions",
-                "condition": lambda d: 38.0 <= d["t_max"] < 40.0,
-                "severity": "MODERATE",
-                "confidence": "HIGH",
-                "source": "Sustained heat affecting health and agriculture"
-            },
-            
-            "tropical_night": {
-                "name": "Tropical Night",
-                "description": "Oppressive nighttime heat - health risk",
-                "condition": lambda d: d["t_min"] >= 26.0,
-                "severity": "MODERATE",
-                "confidence": "HIGH",
-                "source": "Morocco heat risk framework: 26°C+ minimum"
-            },
-            
-            # COLD-RELATED RULES
-            "extreme_cold": {
-                "name": "Extreme Cold",
-                "description": "Dangerously low temperatures",
-                "condition": lambda d: d["t_min"] <= -10.0,
-                "severity": "EXTREME",
-                "confidence": "HIGH",
-                "source": "2017 cold wave: -13°C recorded in Morocco"
-            },
-            
-            "severe_freeze": {
-                "name": "Severe Freeze",
-                "description": "Severe freezing conditions",
-                "condition": lambda d: -10.0 < d["t_min"] <= -5.0,
-                "severity": "HIGH",
-                "confidence": "HIGH",
-                "source": "2018 cold wave: -5°C; severe agricultural impact"
-            },
-            
-            "freeze": {
-                "name": "Freeze",
-                "description": "Freezing temperatures - agricultural risk",
-                "condition": lambda d: 0.0 < d["t_min"] <= -5.0,
-                "severity": "MODERATE",
-                "confidence": "HIGH",
-                "source": "Frost impacts crops in Atlas regions"
-            },
-            
-            "near_freeze": {
-                "name": "Near Freeze",
-                "description": "Near-freezing conditions",
-                "condition": lambda d: 0.0 <= d["t_min"] <= 2.0,
-                "severity": "LOW",
-                "confidence": "MODERATE",
-                "source": "Frost risk for sensitive vegetation"
-            },
-            
-            # PRECIPITATION-RELATED RULES (CORRECTED UNITS: mm not m/s!)
-            "extreme_rainfall": {
-                "name": "Extreme Rainfall",
-                "description": "Extreme precipitation - red alert, major flood risk",
-                "condition": lambda d: d["rain"] >= 80.0,
-                "severity": "EXTREME",
-                "confidence": "HIGH",
-                "source": "DGM red alert: 80-120mm; recent floods from such amounts"
-            },
-            
-            "heavy_rain": {
-                "name": "Heavy Rain",
-                "description": "Heavy precipitation - orange alert",
-                "condition": lambda d: 30.0 <= d["rain"] < 50.0,
-                "severity": "MODERATE",
-                "confidence": "HIGH",
-                "source": "DGM orange alert threshold: 30mm+"
-            },
-            
-            "flash_flood_risk": {
-                "name": "Flash Flood Risk",
-                "description": "Critical flash flood conditions",
-                "condition": lambda d: d["rain"] >= 37.0,
-                "severity": "HIGH",
-                "confidence": "HIGH",
-                "source": "37mm caused deadly Safi floods (Dec 2025)"
-            },
-            
-            # WIND-RELATED RULES (CORRECTED UNITS: km/h not m/s!)
-            "violent_wind": {
-                "name": "Violent Wind",
-                "description": "Extremely dangerous wind conditions",
-                "condition": lambda d: d["wind"] >= 100.0,
-                "severity": "EXTREME",
-                "confidence": "HIGH",
-                "source": "100+ km/h: DGM red alert; Storm Francis 2026"
-            },
-            
-            "strong_wind": {
-                "name": "Strong Wind",
-                "description": "Strong winds requiring precautions",
-                "condition": lambda d: 75.0 <= d["wind"] < 90.0,
-                "severity": "MODERATE",
-                "confidence": "HIGH",
-                "source": "DGM orange alert: 75-90 km/h"
-            },
-            
-            "moderate_wind": {
-                "name": "Moderate Wind",
-                "description": "Elevated wind speeds",
-                "condition": lambda d: 50.0 <= d["wind"] < 75.0,
-                "severity": "LOW",
-                "confidence": "MODERATE",
-                "source": "Moderate winds affecting outdoor activities"
-            },
-            
-            # COMPOUND EVENT RULES
-            "fire_weather": {
-                "name": "Fire Weather",
-                "description": "Extreme fire danger - hot, dry, windy",
-                "condition": lambda d: (
-                    d["t_max"] >= 38.0 and 
-                    d["dew"] <= 10.0 and 
-                    d["wind"] >= 40.0 and
-                    d["rain"] < 1.0
-                ),
-                "severity": "HIGH",
-                "confidence": "HIGH",
-                "source": "Heat + low humidity + wind causes forest fires"
-            },
-            
-            "extreme_storm": {
-                "name": "Extreme Storm",
-                "description": "Extreme storm - heavy rain + violent winds",
-                "condition": lambda d: (
-                    d["rain"] >= 80.0 and 
-                    d["wind"] >= 90.0
-                ),
-                "severity": "EXTREME",
-                "confidence": "HIGH",
-                "source": "Red alert: extreme rain + violent wind combination"
-            },
-            
-            "severe_storm": {
-                "name": "Severe Storm",
-                "description": "Severe storm conditions",
-                "condition": lambda d: (
-                    d["rain"] >= 30.0 and 
-                    d["wind"] >= 75.0
-                ),
-                "severity": "HIGH",
-                "confidence": "HIGH",
-                "source": "Heavy rain + strong winds in Atlantic storms"
-            },
-            
-            "humid_heat": {
-                "name": "Humid Heat",
-                "description": "Oppressive heat with high humidity",
-                "condition": lambda d: (
-                    d["t_max"] >= 35.0 and 
-                    d["dew"] >= 20.0
-                ),
-                "severity": "HIGH",
-                "confidence": "MODERATE",
-                "source": "High temp + humidity increases heat stress"
-            },
-            
-            # VISIBILITY RULES
-            "extremely_poor_visibility": {
-                "name": "Extremely Poor Visibility",
-                "description": "Severe visibility restriction - safety hazard",
-                "condition": lambda d: d["vis"] < 0.2,
-                "severity": "HIGH",
-                "confidence": "HIGH",
-                "source": "Visibility < 200m: severe safety impact"
-            },
-            
-            "fog_conditions": {
-                "name": "Fog Conditions",
-                "description": "Fog likely - reduced visibility",
-                "condition": lambda d: (
-                    d["vis"] <= 1.0 and 
-                    (d["t_mean"] - d["dew"]) <= 2.5
-                ),
-                "severity": "LOW",
-                "confidence": "MODERATE",
-                "source": "Low visibility + small dew point spread = fog"
-            }
-        }
-    
+
+    def __init__(self, rules=None, station=None, climatology=None):
+        self._rules = rules
+        self.station = station
+        self.climatology = climatology
+        self._thresholds = (None, None)     # (rules, their thresholds)
+
+    @property
+    def rules(self):
+        return (self._rules or current_rules()).for_station(self.station)
+
+    def _day_thresholds(self, rules):
+        """"MM-DD" -> {percentile key: value} for rules.percentiles (None if unused)."""
+        cached_rules, thresholds = self._thresholds
+        if cached_rules is rules:
+            return thresholds
+        if not rules.percentiles:
+            thresholds = None
+        elif self.climatology is None:
+            # no history: percentile conditions compare against NaN, i.e. never hold
+            thresholds = defaultdict(lambda: dict.fromkeys((key for key, _, _ in rules.percentiles), math.nan))
+        else:
+            thresholds = self.climatology.rows(rules.percentiles)
+        self._thresholds = (rules, thresholds)
+        return thresholds
+
     def detect_extreme_events(self, forecast):
         """
         Main function to detect extreme weather events from forecast data
-        
+
         Parameters:
         -----------
         forecast : list of dict
@@ -225,13 +570,16 @@ class MoroccoWeatherKnowledgeSystem:
             - mean_windSpeed: dict with 'value' key (km/h)
             - mean_dewPoint: dict with 'value' key (°C)
             - mean_visibility: dict with 'value' key (km)
-        
+
         Returns:
         --------
-        list: Detected extreme weather events
+        list of Event: Detected extreme weather events
         """
+        rules = self.rules
+        thresholds = self._day_thresholds(rules)
         all_events = []
-        
+        days = []
+
         # Process each day
         for day_data in forecast:
             # Extract values
@@ -245,181 +593,104 @@ class MoroccoWeatherKnowledgeSystem:
                 "dew": day_data["mean_dewPoint"]["value"],
                 "vis": day_data["mean_visibility"]["value"]
             }
-            
+            if thresholds is not None:
+                # O(1): the station's percentiles for this calendar day
+                day.update(thresholds[day["date"][5:10]])
+            days.append(day)
+            values = None
+
             # Apply each rule from knowledge base
-            for rule_id, rule in self.knowledge_base.items():
+            for rule in rules.daily:
                 try:
-                    if rule["condition"](day):
-                        event = {
-                            "date": day["date"],
-                            "event_id": rule_id,
-                            "type": rule["name"],
-                            "description": rule["description"],
-                            "severity": rule["severity"],
-                            "confidence": rule["confidence"],
-                            "source": rule["source"],
-                            "criteria": {
-                                "t_max": day["t_max"],
-                                "t_min": day["t_min"],
-                                "t_mean": day["t_mean"],
-                                "precipitation_mm": day["rain"],
-                                "wind_kmh": day["wind"],
-                                "dew_point": day["dew"],
-                                "visibility_km": day["vis"]
-                            }
-                        }
-                        all_events.append(event)
-                except Exception as e:
+                    if rule.condition(day):
+                        if values is None:
+                            values = (day["t_max"], day["t_min"], day["t_mean"], day["rain"],
+                                      day["wind"], day["dew"], day["vis"])
+                        all_events.append(Event(rule, day["date"], values))
+                except Exception:
                     # Skip rule if error occurs
                     continue
-        
+
         # Detect multi-day patterns
-        multi_day_events = self._detect_multi_day_patterns(forecast)
-        all_events.extend(multi_day_events)
-        
+        all_events.extend(self._detect_multi_day_patterns(days, rules))
+
         # Remove duplicate compound events (keep highest severity)
-        all_events = self._deduplicate_events(all_events)
-        
-        return all_events
-    
-    def _detect_multi_day_patterns(self, forecast):
+        return self._deduplicate_events(all_events)
+
+    def _detect_multi_day_patterns(self, days, rules):
         """Detect patterns that span multiple days"""
+        detectors = {
+            "streak": self._detect_streak,
+            "rain_total": self._detect_rain_total,
+            "temperature_drop": self._detect_temperature_drop,
+        }
         patterns = []
-        
-        # Extract simplified day data
-        days = []
-        for day_data in forecast:
-            days.append({
-                "date": day_data["date"],
-                "t_mean": day_data["mean_temperature"]["value"],
-                "t_max": day_data["max_temperature"]["value"],
-                "t_min": day_data["min_temperature"]["value"],
-                "rain": day_data["total_precipitation"]["value"],
-                "wind": day_data["mean_windSpeed"]["value"]
-            })
-        
-        # HEAT WAVE: 3+ consecutive days >= 40°C
-        heat_wave_days = self._find_consecutive_pattern(
-            days, lambda d: d["t_max"] >= 40.0, min_days=3
-        )
-        if heat_wave_days:
-            patterns.append({
-                "date": f"{heat_wave_days[0]['date']} to {heat_wave_days[-1]['date']}",
-                "event_id": "heat_wave",
-                "type": "Heat Wave",
-                "description": f"Heat wave: {len(heat_wave_days)} consecutive days >= 40°C",
-                "severity": "HIGH",
-                "confidence": "HIGH",
-                "source": "DGM warnings for 40°C+ lasting 3+ days",
-                "criteria": {
-                    "duration_days": len(heat_wave_days),
-                    "max_temp_range": f"{min(d['t_max'] for d in heat_wave_days)}-{max(d['t_max'] for d in heat_wave_days)}°C"
-                }
-            })
-        
-        # SEVERE HEAT WAVE: 5+ consecutive days >= 42°C
-        severe_heat_wave_days = self._find_consecutive_pattern(
-            days, lambda d: d["t_max"] >= 42.0, min_days=5
-        )
-        if severe_heat_wave_days:
-            patterns.append({
-                "date": f"{severe_heat_wave_days[0]['date']} to {severe_heat_wave_days[-1]['date']}",
-                "event_id": "severe_heat_wave",
-                "type": "Severe Heat Wave",
-                "description": f"Severe heat wave: {len(severe_heat_wave_days)} consecutive days >= 42°C",
-                "severity": "EXTREME",
-                "confidence": "HIGH",
-                "source": "Heat waves 5+ days with 42°C+ considered severe",
-                "criteria": {
-                    "duration_days": len(severe_heat_wave_days),
-                    "max_temp_range": f"{min(d['t_max'] for d in severe_heat_wave_days)}-{max(d['t_max'] for d in severe_heat_wave_days)}°C"
-                }
-            })
-        
-        # COLD WAVE: 3+ consecutive days with min <= 5°C
-        cold_wave_days = self._find_consecutive_pattern(
-            days, lambda d: d["t_min"] <= 5.0, min_days=3
-        )
-        if cold_wave_days:
-            patterns.append({
-                "date": f"{cold_wave_days[0]['date']} to {cold_wave_days[-1]['date']}",
-                "event_id": "cold_wave",
-                "type": "Cold Wave",
-                "description": f"Cold wave: {len(cold_wave_days)} consecutive days with min temp <= 5°C",
-                "severity": "MODERATE",
-                "confidence": "HIGH",
-                "source": "Cold waves in Morocco: 3+ days around 5°C or lower",
-                "criteria": {
-                    "duration_days": len(cold_wave_days),
-                    "min_temp_range": f"{min(d['t_min'] for d in cold_wave_days)}-{max(d['t_min'] for d in cold_wave_days)}°C"
-                }
-            })
-        
-        # DRY SPELL: 7+ consecutive days without significant rain
-        dry_spell_days = self._find_consecutive_pattern(
-            days, lambda d: d["rain"] < 1.0, min_days=7
-        )
-        if dry_spell_days:
-            patterns.append({
-                "date": f"{dry_spell_days[0]['date']} to {dry_spell_days[-1]['date']}",
-                "event_id": "dry_spell",
-                "type": "Dry Spell",
-                "description": f"Dry spell: {len(dry_spell_days)} consecutive days without rain",
-                "severity": "MODERATE",
-                "confidence": "HIGH",
-                "source": "7+ dry days impacts agriculture",
-                "criteria": {
-                    "duration_days": len(dry_spell_days),
-                    "total_precipitation_mm": sum(d["rain"] for d in dry_spell_days)
+        for rule in rules.patterns:
+            patterns.extend(detectors[rule.kind](rule, days))
+        return patterns
+
+    def _detect_streak(self, rule, days):
+        """Longest run of >= min_days consecutive days matching the rule (e.g. heat wave)"""
+        streak = self._find_consecutive_pattern(days, rule.condition, rule.params["min_days"])
+        if not streak:
+            return []
+
+        criteria = {"duration_days": len(streak)}
+        for name, aggregate, var, unit in rule.criteria:
+            values = [d[var] for d in streak]
+            if aggregate == "range":
+                criteria[name] = f"{min(values)}-{max(values)}{unit}"
+            else:
+                criteria[name] = sum(values)
+        return [Event(
+            rule,
+            f"{streak[0]['date']} to {streak[-1]['date']}",
+            description=rule.description.format(**criteria),
+            criteria=criteria,
+        )]
+
+    def _detect_rain_total(self, rule, days):
+        """First window of `days` days whose total rain reaches min_total"""
+        n = rule.params["days"]
+        for i in range(len(days) - n + 1):
+            total = sum(days[j]["rain"] for j in range(i, i + n))
+            if total >= rule.params["min_total"]:
+                criteria = {
+                    "total_precipitation_mm": total,
+                    "duration_days": n
                 }
-            })
-        
-        # PROLONGED HEAVY RAIN: 100mm+ over 3 days
-        if len(days) >= 3:
-            for i in range(len(days) - 2):
-                three_day_rain = sum(days[j]["rain"] for j in range(i, i + 3))
-                if three_day_rain >= 100.0:
-                    patterns.append({
-                        "date": f"{days[i]['date']} to {days[i+2]['date']}",
-                        "event_id": "prolonged_heavy_rain",
-                        "type": "Prolonged Heavy Rain",
-                        "description": f"Prolonged heavy rainfall: {three_day_rain:.1f}mm over 3 days",
-                        "severity": "HIGH",
-                        "confidence": "HIGH",
-                        "source": "100mm+ over 3 days causes widespread flooding",
-                        "criteria": {
-                            "total_precipitation_mm": three_day_rain,
-                            "duration_days": 3
-                        }
-                    })
-                    break  # Only report first occurrence
-        
-        # SUDDEN TEMPERATURE DROP: 15°C+ drop in 24 hours
+                return [Event(
+                    rule,
+                    f"{days[i]['date']} to {days[i + n - 1]['date']}",
+                    description=rule.description.format(**criteria),
+                    criteria=criteria,
+                )]  # Only report first occurrence
+        return []
+
+    def _detect_temperature_drop(self, rule, days):
+        """Every day-to-day mean temperature drop of at least min_drop"""
+        events = []
         for i in range(len(days) - 1):
             temp_drop = days[i]["t_mean"] - days[i + 1]["t_mean"]
-            if temp_drop >= 15.0:
-                patterns.append({
-                    "date": f"{days[i]['date']} to {days[i+1]['date']}",
-                    "event_id": "cold_snap",
-                    "type": "Cold Snap",
-                    "description": f"Sudden temperature drop: {temp_drop:.1f}°C in 24 hours",
-                    "severity": "MODERATE",
-                    "confidence": "HIGH",
-                    "source": "15°C+ drops indicate cold fronts",
-                    "criteria": {
-                        "temperature_drop": temp_drop,
-                        "from_temp": days[i]["t_mean"],
-                        "to_temp": days[i + 1]["t_mean"]
-                    }
-                })
-        
-        return patterns
-    
+            if temp_drop >= rule.params["min_drop"]:
+                criteria = {
+                    "temperature_drop": temp_drop,
+                    "from_temp": days[i]["t_mean"],
+                    "to_temp": days[i + 1]["t_mean"]
+                }
+                events.append(Event(
+                    rule,
+                    f"{days[i]['date']} to {days[i+1]['date']}",
+                    description=rule.description.format(**criteria),
+                    criteria=criteria,
+                ))
+        return events
+
     def _find_consecutive_pattern(self, days, condition_func, min_days):
         """Find consecutive days matching a condition"""
         consecutive = []
         longest_streak = []
-        
+
         for day in days:
             if condition_func(day):
                 consecutive.append(day)
@@ -427,43 +698,37 @@ class MoroccoWeatherKnowledgeSystem:
                 if len(consecutive) >= min_days and len(consecutive) > len(longest_streak):
                     longest_streak = consecutive.copy()
                 consecutive = []
-        
+
         # Check last streak
         if len(consecutive) >= min_days and len(consecutive) > len(longest_streak):
             longest_streak = consecutive
-        
+
         return longest_streak if len(longest_streak) >= min_days else []
-    
+
     def _deduplicate_events(self, events):
         """Remove duplicate events for same day, keeping highest severity"""
-        severity_order = {"EXTREME": 4, "HIGH": 3, "MODERATE": 2, "LOW": 1}
-        
         # Group by date
         by_date = {}
         for event in events:
-            date = event["date"]
-            if date not in by_date:
-                by_date[date] = []
-            by_date[date].append(event)
-        
+            by_date.setdefault(event.date, []).append(event)
+
         # For compound events on same day, keep only highest severity
         deduplicated = []
-        for date, day_events in by_date.items():
-            # Separate compound from single events
-            compound_events = [e for e in day_events if e["event_id"] in 
-                             ["extreme_storm", "severe_storm", "fire_weather", "humid_heat"]]
-            other_events = [e for e in day_events if e not in compound_events]
-            
-            # Keep highest severity compound event
-            if compound_events:
-                compound_events.sort(key=lambda e: severity_order.get(e["severity"], 0), reverse=True)
-                deduplicated.append(compound_events[0])
-            
+        for day_events in by_date.values():
+            compound = None
+            for event in day_events:
+                if event.rule.compound and (
+                    compound is None or event.rule.severity_rank > compound.rule.severity_rank
+                ):
+                    compound = event
+            if compound is not None:
+                deduplicated.append(compound)
+
             # Keep all other events
-            deduplicated.extend(other_events)
-        
+            deduplicated.extend(e for e in day_events if not e.rule.compound)
+
         return deduplicated
-    
+
     def generate_summary(self, events):
         """Generate comprehensive summary statistics of detected events"""
         if not events:
@@ -477,139 +742,71 @@ class MoroccoWeatherKnowledgeSystem:
                 "event_timeline": [],
                 "detailed_events": []
             }
-        
+
         severity_counts = {}
         event_type_counts = {}
         event_category_counts = {}
         high_risk_days = []
         event_timeline = []
-        detailed_events = []
-        
-        # Define event categories
-        category_map = {
-            "extreme_heat": "Heat",
-            "very_high_heat": "Heat",
-            "high_heat": "Heat",
-            "tropical_night": "Heat",
-            "heat_wave": "Heat",
-            "severe_heat_wave": "Heat",
-            "extreme_cold": "Cold",
-            "severe_freeze": "Cold",
-            "freeze": "Cold",
-            "near_freeze": "Cold",
-            "cold_wave": "Cold",
-            "cold_snap": "Cold",
-            "extreme_rainfall": "Precipitation",
-            "very_heavy_rain": "Precipitation",
-            "heavy_rain": "Precipitation",
-            "flash_flood_risk": "Precipitation",
-            "prolonged_heavy_rain": "Precipitation",
-            "dry_spell": "Drought",
-            "violent_wind": "Wind",
-            "very_strong_wind": "Wind",
-            "strong_wind": "Wind",
-            "moderate_wind": "Wind",
-            "fire_weather": "Compound",
-            "extreme_storm": "Compound",
-            "severe_storm": "Compound",
-            "humid_heat": "Compound",
-            "extremely_poor_visibility": "Visibility",
-            "very_poor_visibility": "Visibility",
-            "fog_conditions": "Visibility"
-        }
-        
+        days_with_counts = {}
+        max_rule = events[0].rule
+
         for event in events:
-            # Count by severity
-            sev = event["severity"]
+            rule = event.rule
+            sev = rule.severity
+            category = rule.category
             severity_counts[sev] = severity_counts.get(sev, 0) + 1
-            
-            # Count by type
-            etype = event["type"]
-            event_type_counts[etype] = event_type_counts.get(etype, 0) + 1
-            
-            # Count by category
-            event_id = event["event_id"]
-            category = category_map.get(event_id, "Other")
+            event_type_counts[rule.name] = event_type_counts.get(rule.name, 0) + 1
             event_category_counts[category] = event_category_counts.get(category, 0) + 1
-            
+            if rule.severity_rank > max_rule.severity_rank:
+                max_rule = rule
+
             # Track extreme/high severity days
-            if sev in ["EXTREME", "HIGH"]:
+            if rule.severity_rank >= SEVERITY_RANKS["HIGH"]:
                 high_risk_days.append({
-                    "date": event["date"],
-                    "type": event["type"],
+                    "date": event.date,
+                    "type": rule.name,
                     "severity": sev,
-                    "description": event["description"],
+                    "description": event.description,
                     "category": category
                 })
-            
-            # Build timeline
+
             event_timeline.append({
-                "date": event["date"],
-                "event_id": event["event_id"],
-                "type": event["type"],
+                "date": event.date,
+                "event_id": rule.event_id,
+                "type": rule.name,
                 "severity": sev,
                 "category": category
             })
-            
-            # Detailed event information
-            detailed_event = {
-                "date": event["date"],
-                "event_id": event["event_id"],
-                "type": event["type"],
-                "description": event["description"],
-                "severity": event["severity"],
-                "confidence": event["confidence"],
-                "category": category,
-                "source": event["source"]
-            }
-            
-            # Add criteria if available
-            if "criteria" in event:
-                detailed_event["criteria"] = event["criteria"]
-            
-            detailed_events.append(detailed_event)
-        
+
+            # Only count single-day events for the most affected days
+            if " to " not in event.date:
+                days_with_counts[event.date] = days_with_counts.get(event.date, 0) + 1
+
         # Sort timeline by date
         event_timeline.sort(key=lambda x: x["date"])
-        
-        # Calculate statistics
-        severity_order = {"EXTREME": 4, "HIGH": 3, "MODERATE": 2, "LOW": 1}
-        max_severity = max(severity_counts.keys(), 
-                          key=lambda s: severity_order.get(s, 0))
-        
-        # Find most affected days (days with multiple events)
-        days_with_counts = {}
-        for event in events:
-            date = event["date"]
-            if " to " not in date:  # Only count single-day events
-                days_with_counts[date] = days_with_counts.get(date, 0) + 1
-        
+
         most_affected_days = sorted(
-            [{"date": date, "event_count": count} 
+            [{"date": date, "event_count": count}
              for date, count in days_with_counts.items()],
             key=lambda x: x["event_count"],
             reverse=True
         )[:5]  # Top 5 most affected days
-        
+
         # Calculate severity score (weighted)
-        severity_score = (
-            severity_counts.get("EXTREME", 0) * 4 +
-            severity_counts.get("HIGH", 0) * 3 +
-            severity_counts.get("MODERATE", 0) * 2 +
-            severity_counts.get("LOW", 0) * 1
-        )
-        
+        severity_score = sum(SEVERITY_RANKS.get(sev, 0) * n for sev, n in severity_counts.items())
+
         return {
             "total_events": len(events),
             "severity_distribution": severity_counts,
             "severity_score": severity_score,
             "event_types": event_type_counts,
             "event_categories": event_category_counts,
-            "max_severity": max_severity,
+            "max_severity": max_rule.severity,
             "high_risk_days": high_risk_days,
             "most_affected_days": most_affected_days,
             "event_timeline": event_timeline,
-            "detailed_events": detailed_events,
+            "detailed_events": [event.detail_json() for event in events],
             "statistics": {
                 "extreme_events": severity_counts.get("EXTREME", 0),
                 "high_severity_events": severity_counts.get("HIGH", 0),
@@ -624,72 +821,86 @@ class MoroccoWeatherKnowledgeSystem:
                 "visibility_related": event_category_counts.get("Visibility", 0)
             }
         }
-    
+
     def generate_recommendations(self, events):
         """Generate safety recommendations based on detected events"""
+        rules = self.rules
         if not events:
-            return ["No extreme weather events detected. Normal precautions apply."]
-        
+            return [rules.no_events_advice]
+
+        # per-rule recommendations are resolved when the catalog is compiled
         recommendations = set()
-        event_types = [e["event_id"] for e in events]
-        severities = [e["severity"] for e in events]
-        
-        # Urgent warnings for extreme events
-        if "EXTREME" in severities:
-            recommendations.add("⚠️ URGENT: Extreme weather conditions detected. Follow all official warnings and stay informed.")
-        
-        # Heat-related recommendations
-        if any("heat" in et or "tropical_night" in et for et in event_types):
-            recommendations.add("🌡️ HEAT: Stay hydrated, avoid outdoor activities 12pm-5pm, check on elderly/vulnerable, never leave children/pets in vehicles.")
-        
-        # Cold-related recommendations
-        if any("cold" in et or "freeze" in et for et in event_types):
-            recommendations.add("❄️ COLD: Protect water pipes, ensure adequate heating, dress in layers, check on elderly neighbors, protect livestock.")
-        
-        # Precipitation recommendations
-        if any("rain" in et or "flood" in et or "storm" in et for et in event_types):
-            recommendations.add("🌧️ FLOODING: Avoid wadis and low-lying areas, never drive through flooded roads, secure property, monitor weather updates.")
-        
-        # Wind recommendations
-        if any("wind" in et or "storm" in et for et in event_types):
-            recommendations.add("💨 WIND: Secure loose objects, avoid trees and power lines, stay indoors during severe winds, delay travel if possible.")
-        
-        # Fire weather
-        if any("fire" in et for et in event_types):
-            recommendations.add("🔥 FIRE DANGER: Extreme fire risk. No outdoor burning, report smoke immediately, prepare evacuation routes.")
-        
-        # Visibility
-        if any("visibility" in et or "fog" in et for et in event_types):
-            recommendations.add("🌫️ VISIBILITY: Reduce driving speed, use fog lights, increase following distance, avoid unnecessary travel.")
-        
-        # Drought
-        if any("dry" in et for et in event_types):
-            recommendations.add("💧 DROUGHT: Conserve water, monitor crop irrigation, follow local water restrictions.")
-        
-        return sorted(list(recommendations))
-
-
-def integrate_events_into_forecast(forecast_data):
-    weather_system = MoroccoWeatherKnowledgeSystem()
-    
+        for rule in {event.rule.id: event.rule for event in events}.values():
+            recommendations |= rule.advice
+            if rule.severity == "EXTREME":
+                recommendations.add(rules.urgent_advice)
+
+        return sorted(recommendations)
+
+
+KNOWLEDGE_SYSTEM = MoroccoWeatherKnowledgeSystem()
+
+
+def integrate_events_into_forecast(forecast_data, system=KNOWLEDGE_SYSTEM):
     # Detect all events
-    detected_events = weather_system.detect_extreme_events(forecast_data)
-    
+    with stage_timer("events_detect"):
+        detected_events = system.detect_extreme_events(forecast_data)
+
     # Group events by date
     events_by_date = {}
     for event in detected_events:
-        date = event["date"]
-        if date not in events_by_date:
-            events_by_date[date] = []
-        events_by_date[date].append(event)
-    
+        events_by_date.setdefault(event.date, []).append(event.to_json())
+
     # Add events to each day in the forecast
     for day in forecast_data:
-        day_date = day["date"]
-        day["events"] = events_by_date.get(day_date, [])
-    
+        day["events"] = events_by_date.get(day["date"], [])
+
     # Also add summary at top level
-    event_summary = weather_system.generate_summary(detected_events)
-    recommendations = weather_system.generate_recommendations(detected_events)
-    
+    with stage_timer("events_summary"):
+        event_summary = system.generate_summary(detected_events)
+    with stage_timer("events_recommendations"):
+        recommendations = system.generate_recommendations(detected_events)
+
     return event_summary, recommendations
+
+
+def knowledge_system_for(city_dir, df=None, rules=None):
+    """
+    MoroccoWeatherKnowledgeSystem for artifacts/<station>: the profile of the
+    station (folder name) in `rules` (default: current_rules()), plus its
+    climatology when the profile uses percentile thresholds. `df` can be
+    passed to reuse the already loaded history.
+    """
+    station = Path(city_dir).name if city_dir is not None else None
+    rules = (rules or current_rules()).for_station(station)
+    climatology = None
+    if rules.percentiles and city_dir is not None:
+        climatology = climatology_for(city_dir, df)
+    return MoroccoWeatherKnowledgeSystem(rules, station, climatology)
+
+
+def refresh_events(result, city_dir=None):
+    """
+    A forecast result (run_forecast output) of the station in `city_dir` with
+    its event layer re-run if the rule catalog changed since
+    metadata.rules_version; the model forecast itself is reused as is.
+    Returns `result` unchanged when it is current.
+    """
+    rules = current_rules()
+    metadata = result.get("metadata") or {}
+    if metadata.get("rules_version") == rules.version:
+        return result
+
+    forecast = [{k: v for k, v in day.items() if k != "events"} for day in result["forecast"]]
+    with stage_timer("refresh_events"):
+        events = integrate_events_into_forecast(forecast, knowledge_system_for(city_dir, rules=rules))
+    return {
+        **result,
+        "metadata": {**metadata, "rules_version": rules.version},
+        "forecast": forecast,
+        "events": events,
+    }
+
+
+# fail at import on a broken catalog rather than on the first request
+current_rules()
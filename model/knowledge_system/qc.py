@@ -0,0 +1,341 @@
+"""
+Quality control and gap filling for daily frames in the weather.csv schema.
+
+One engine for every writer of weather.csv (training, fetch_historical.py,
+the Spark producer), applied in the physically correct order:
+
+    1. missing days are inserted (daily index)
+    2. sentinel codes -> NaN
+    3. out-of-range values -> NaN
+    4. consistency: min <= mean <= max, dew point <= mean temperature
+       (beyond a small tolerance the offending values -> NaN)
+    5. gap filling: interior gaps of at most MAX_GAP_DAYS are interpolated
+       linearly in time, precipitation gaps are 0 (as in the notebook), and
+       an open gap at the end of the record is bridged by carrying the last
+       value forward for at most MAX_CARRY_DAYS. Longer gaps stay NaN.
+    6. filled temperatures and dew points that contradict the observed
+       values of their row are clamped to them (min <= mean <= max,
+       dew point <= mean), so step 4 holds for filled rows too
+
+Every row gets a `qc_flags` bitmask (QC_* below) saying what happened to it;
+carried values also set the bit of their column (QC_CARRIED_COLUMN << j for
+VALUE_COLUMNS[j]).
+
+run_qc cleans a whole frame (training). qc_append cleans only the rows being
+appended plus a short context before them, so the daily updaters never
+rewrite or re-check the full history and the latest LOOKBACK window has no
+NaN for inference as long as the gaps stay within the bounds above. Values
+carried over a trailing gap are re-opened when later rows close the gap, so
+they get interpolated like any interior gap.
+
+Only numpy/pandas are used so the module can be mounted into the ingestion
+containers on its own.
+"""
+import numpy as np
+import pandas as pd
+
+QC_COLUMN = "qc_flags"
+
+QC_MISSING_DAY = 1      # day absent from the source, row inserted
+QC_SENTINEL = 2         # a value was a missing-data code
+QC_OUT_OF_RANGE = 4     # a value was outside VALID_RANGES
+QC_INCONSISTENT = 8     # min/mean/max or dew point/temperature contradicted
+QC_FILLED = 16          # a value was interpolated (or precipitation set to 0)
+QC_CARRIED = 32         # a value was carried forward over an open trailing gap
+QC_UNFILLED = 64        # a value is still NaN (gap too long)
+QC_CARRIED_COLUMN = 128  # QC_CARRIED_COLUMN << j: VALUE_COLUMNS[j] was carried
+
+VALUE_COLUMNS = [
+    "mean_temperature",
+    "max_temperature",
+    "min_temperature",
+    "mean_dewPoint",
+    "total_precipitation",
+    "mean_windSpeed",
+    "mean_visibility",
+]
+
+# GSOD missing codes after the unit conversion to the weather.csv schema
+SENTINELS = {
+    "mean_temperature": [(9999.9 - 32) * 5 / 9],
+    "max_temperature": [(9999.9 - 32) * 5 / 9],
+    "min_temperature": [(9999.9 - 32) * 5 / 9],
+    "mean_dewPoint": [(9999.9 - 32) * 5 / 9],
+    "total_precipitation": [99.99 * 25.4],
+    "mean_windSpeed": [999.9 * 0.514444],
+    "mean_visibility": [999.9 * 1.60934],
+}
+
+# physically plausible daily values (°C, mm, m/s, km)
+VALID_RANGES = {
+    "mean_temperature": (-40.0, 55.0),
+    "max_temperature": (-40.0, 60.0),
+    "min_temperature": (-45.0, 50.0),
+    "mean_dewPoint": (-50.0, 35.0),
+    "total_precipitation": (0.0, 500.0),
+    "mean_windSpeed": (0.0, 60.0),
+    "mean_visibility": (0.0, 100.0),
+}
+
+CONSISTENCY_TOLERANCE = 1.0   # °C
+ZERO_FILL_COLUMNS = ["total_precipitation"]
+
+MAX_GAP_DAYS = 7
+MAX_CARRY_DAYS = 3
+
+
+# --------------------
+# Checks
+# --------------------
+def _mask_invalid(values, columns):
+    """NaN out sentinel, out-of-range and inconsistent values in place; row flags."""
+    flags = np.zeros(len(values), dtype=np.int64)
+    col = {c: i for i, c in enumerate(columns)}
+
+    for c, codes in SENTINELS.items():
+        if c not in col:
+            continue
+        v = values[:, col[c]]
+        hit = np.isin(np.round(v, 3), np.round(codes, 3))
+        v[hit] = np.nan
+        flags[hit] |= QC_SENTINEL
+
+    for c, (lo, hi) in VALID_RANGES.items():
+        if c not in col:
+            continue
+        v = values[:, col[c]]
+        with np.errstate(invalid="ignore"):
+            hit = (v < lo) | (v > hi)
+        v[hit] = np.nan
+        flags[hit] |= QC_OUT_OF_RANGE
+
+    temps = ["mean_temperature", "max_temperature", "min_temperature"]
+    if all(c in col for c in temps):
+        mean, tmax, tmin = (values[:, col[c]] for c in temps)
+        with np.errstate(invalid="ignore"):
+            bad = (
+                (tmin > tmax + CONSISTENCY_TOLERANCE)
+                | (mean > tmax + CONSISTENCY_TOLERANCE)
+                | (mean < tmin - CONSISTENCY_TOLERANCE)
+            )
+        # which of the three is wrong is unknown: drop all of them
+        for c in temps:
+            values[bad, col[c]] = np.nan
+        flags[bad] |= QC_INCONSISTENT
+
+        if "mean_dewPoint" in col:
+            dew = values[:, col["mean_dewPoint"]]
+            with np.errstate(invalid="ignore"):
+                bad = dew > values[:, col["mean_temperature"]] + CONSISTENCY_TOLERANCE
+            dew[bad] = np.nan
+            flags[bad] |= QC_INCONSISTENT
+
+    return flags
+
+
+def _clamp_filled(values, columns, filled):
+    """Clamp filled temperatures / dew points in place to the observed values of their row; row flags."""
+    flags = np.zeros(len(values), dtype=np.int64)
+    col = {c: i for i, c in enumerate(columns)}
+    temps = ["mean_temperature", "max_temperature", "min_temperature"]
+    if not all(c in col for c in temps):
+        return flags
+
+    before = values.copy()
+    mean, tmax, tmin = (values[:, col[c]] for c in temps)
+    f_mean, f_max, f_min = (filled[:, col[c]] for c in temps)
+
+    def observed(v, f):
+        return np.where(f, np.nan, v)
+
+    # fmin / fmax ignore NaN: a bound that is missing does not clamp
+    dew = values[:, col["mean_dewPoint"]] if "mean_dewPoint" in col else None
+    if dew is not None:
+        f_dew = filled[:, col["mean_dewPoint"]]
+        mean[f_mean] = np.fmax(mean, observed(dew, f_dew))[f_mean]
+    mean[f_mean] = np.fmin(np.fmax(mean, observed(tmin, f_min)), observed(tmax, f_max))[f_mean]
+    tmax[f_max] = np.fmax(tmax, np.fmax(mean, tmin))[f_max]
+    tmin[f_min] = np.fmin(tmin, np.fmin(mean, tmax))[f_min]
+    if dew is not None:
+        dew[f_dew] = np.fmin(dew, mean)[f_dew]
+
+    with np.errstate(invalid="ignore"):
+        changed = ((values != before) & ~np.isnan(before)).any(axis=1)
+    flags[changed] |= QC_INCONSISTENT
+    return flags
+
+
+# --------------------
+# Gap filling
+# --------------------
+def _carried_bit(column):
+    return QC_CARRIED_COLUMN << VALUE_COLUMNS.index(column)
+
+
+def _nan_runs(mask):
+    """For every element: length of its NaN run, position in it, whether the run is open at either end."""
+    n = len(mask)
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    run = np.cumsum(edges[:-1] == 1) - 1
+    run = np.clip(run, 0, None)
+    if len(starts) == 0:
+        zeros = np.zeros(n, dtype=np.int64)
+        return zeros, zeros, np.zeros(n, bool), np.zeros(n, bool)
+    length = (ends - starts)[run]
+    position = np.arange(n) - starts[run]
+    leading = starts[run] == 0
+    trailing = ends[run] == n
+    return length, position, leading, trailing
+
+
+def _trailing_count(mask):
+    """Number of consecutive True values at the end of a 1D mask."""
+    false = np.flatnonzero(~mask)
+    return len(mask) - (false[-1] + 1 if len(false) else 0)
+
+
+def _fill_gaps(values, columns, max_gap, max_carry):
+    """Fill NaNs in place (interior interpolation, zero fill, bounded carry); row flags."""
+    n = len(values)
+    flags = np.zeros(n, dtype=np.int64)
+    x = np.arange(n, dtype=np.float64)   # daily index: time interpolation == positional
+
+    for j, c in enumerate(columns):
+        v = values[:, j]
+        missing = np.isnan(v)
+        if not missing.any():
+            continue
+
+        if c in ZERO_FILL_COLUMNS:
+            v[missing] = 0.0
+            flags[missing] |= QC_FILLED
+            continue
+
+        valid = ~missing
+        if not valid.any():
+            flags[missing] |= QC_UNFILLED
+            continue
+
+        length, position, leading, trailing = _nan_runs(missing)
+        interior = missing & ~leading & ~trailing & (length <= max_gap)
+        carried = missing & trailing & ~leading & (position < max_carry)
+
+        if interior.any():
+            v[interior] = np.interp(x[interior], x[valid], v[valid])
+            flags[interior] |= QC_FILLED
+        if carried.any():
+            v[carried] = v[valid][-1]
+            flags[carried] |= QC_CARRIED | _carried_bit(c)
+        flags[missing & ~interior & ~carried] |= QC_UNFILLED
+
+    return flags
+
+
+# --------------------
+# Entry points
+# --------------------
+def _daily(df):
+    """Sorted, de-duplicated (last wins), daily-reindexed copy + inserted-day flags."""
+    df = df.copy()
+    df.index = pd.to_datetime(df.index).normalize()
+    df = df[~df.index.duplicated(keep="last")].sort_index()
+    full_idx = pd.date_range(df.index.min(), df.index.max(), freq="D")
+    inserted = ~full_idx.isin(df.index)
+    df = df.reindex(full_idx)
+    return df, np.where(inserted, QC_MISSING_DAY, 0).astype(np.int64)
+
+
+def _existing_flags(df):
+    if QC_COLUMN not in df.columns:
+        return np.zeros(len(df), dtype=np.int64)
+    return df[QC_COLUMN].fillna(0).to_numpy(dtype=np.int64)
+
+
+def run_qc(df, max_gap=MAX_GAP_DAYS, max_carry=MAX_CARRY_DAYS):
+    """Full QC of a frame in the weather.csv schema; returns a new frame with QC_COLUMN."""
+    df, flags = _daily(df)
+    columns = [c for c in VALUE_COLUMNS if c in df.columns]
+    values = df[columns].to_numpy(dtype=np.float64, copy=True)
+
+    flags |= _existing_flags(df)
+    flags |= _mask_invalid(values, columns)
+    missing = np.isnan(values)
+    flags |= _fill_gaps(values, columns, max_gap, max_carry)
+    flags |= _clamp_filled(values, columns, missing & ~np.isnan(values))
+
+    out = pd.DataFrame(values, index=df.index, columns=columns)
+    out[QC_COLUMN] = flags
+    return out
+
+
+def qc_append(history, new_rows, max_gap=MAX_GAP_DAYS, max_carry=MAX_CARRY_DAYS):
+    """
+    history + new_rows, where only new_rows (and up to max_gap earlier days of
+    context) are checked and filled. Rows of new_rows with dates already in
+    history replace them. `history` is expected to be QC'd already (e.g. the
+    current weather.csv); a missing QC_COLUMN is treated as all zeros.
+    """
+    new_rows = new_rows.copy()
+    new_rows.index = pd.to_datetime(new_rows.index).normalize()
+    new_rows = new_rows[[c for c in VALUE_COLUMNS if c in new_rows.columns]]
+    if new_rows.empty:
+        return history
+    if history is None or history.empty:
+        return run_qc(new_rows, max_gap, max_carry)
+
+    history = history.sort_index()
+    first_new = new_rows.index.min()
+    columns = [c for c in VALUE_COLUMNS if c in history.columns]
+
+    # context: earlier rows that can anchor an interpolation or may still be NaN
+    context_start = min(first_new, history.index[-1] + pd.Timedelta(days=1)) - pd.Timedelta(days=max_gap + 1)
+    keep = history.loc[history.index < context_start]
+    context = history.loc[(history.index >= context_start) & (history.index < first_new)]
+    later = history.loc[history.index >= first_new].drop(index=new_rows.index, errors="ignore")
+
+    segment = pd.concat([context[columns], later[columns], new_rows.reindex(columns=columns)])
+    segment, flags = _daily(segment)
+    values = segment[columns].to_numpy(dtype=np.float64, copy=True)
+
+    old_flags = pd.concat([context, later]).reindex(segment.index)
+    flags |= _existing_flags(old_flags)
+
+    is_new = segment.index.isin(new_rows.index)
+    new_values = values[is_new]
+    flags[is_new] |= _mask_invalid(new_values, columns)
+    values[is_new] = new_values
+
+    # Carried values are re-opened: with the new rows the gap may be interior
+    # now (interpolated) or still open (carried again from the same start).
+    # Whatever stays NaN gets its carried value back below.
+    carried_bits = np.array([_carried_bit(c) for c in columns], dtype=np.int64)
+    reopened = ~is_new[:, None] & ((flags[:, None] & carried_bits) != 0)
+    carried_before = values[reopened]
+    values[reopened] = np.nan
+    flags[reopened.any(axis=1)] &= ~(QC_CARRIED | np.bitwise_or.reduce(carried_bits))
+
+    # a carried run continues across appends: spend what is left of its budget
+    # (still-NaN rows are part of the new run already, carried rows are not)
+    before = flags[:int(np.argmax(is_new))]
+    before = before[:len(before) - _trailing_count((before & QC_UNFILLED) != 0)]
+    already_carried = _trailing_count((before & QC_CARRIED) != 0)
+    missing = np.isnan(values)
+    flags |= _fill_gaps(values, columns, max_gap, max(0, max_carry - already_carried))
+
+    restore = reopened & np.isnan(values)
+    values[restore] = carried_before[np.isnan(values[reopened])]
+    rows, cols = np.nonzero(restore)
+    flags[rows] |= QC_CARRIED | carried_bits[cols]
+    flags |= _clamp_filled(values, columns, missing & ~restore & ~np.isnan(values))
+
+    # values filled now are no longer unfilled
+    filled_now = ~np.isnan(values).any(axis=1)
+    flags[filled_now] &= ~QC_UNFILLED
+
+    out = pd.DataFrame(values, index=segment.index, columns=columns)
+    out[QC_COLUMN] = flags
+    head = keep[columns].copy()
+    head[QC_COLUMN] = _existing_flags(keep)
+    return pd.concat([head, out])
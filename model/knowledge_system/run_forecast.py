@@ -1,67 +1,129 @@
+import numpy as np
 import torch
 from datetime import timedelta, datetime, timezone
-from knowledge_system.helpers import load_model, load_weather_data, inverse_scale_predictions, build_last_sequence, TARGET_COLS, TARGET_UNITS, HORIZON, LOOKBACK
-from knowledge_system.predict_extreme import integrate_events_into_forecast
+from knowledge_system.helpers import load_model, read_model_config, load_weather_data, inverse_scale_predictions, collapse_target_scalers, clip_targets, apply_feature_engineering, build_input_windows, TARGET_COLS, TARGET_UNITS, HORIZON, LOOKBACK
+from knowledge_system.predict_extreme import current_rules, integrate_events_into_forecast, knowledge_system_for
+from knowledge_system.metrics import stage_timer
+from knowledge_system.catalog import resident_artifacts
 import joblib
 
 DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
-def run_forecast(artifact_path):
-    # ---- Load artifacts
-    feature_bundle = joblib.load(f"{artifact_path}/feature_scaler_bundle.pkl")
-    feature_scaler = feature_bundle["scaler"]
-    feature_cols = feature_bundle["feature_cols"]
-    target_scalers = joblib.load(f"{artifact_path}/target_scalers.pkl")
-
-    model = load_model(input_size=len(feature_cols), model_path=f"{artifact_path}/best_lstm_model.pt")
-    
-    df = load_weather_data(f"{artifact_path}/weather.csv")
-
-    # ---- Build input
-    X_last = build_last_sequence(
-        df,
-        feature_cols,
-        feature_scaler,
-        LOOKBACK
-    )
-    X_last = X_last.to(DEVICE)
-
-    # ---- Predict
-    with torch.no_grad():
-        Y_scaled = model(X_last).cpu().numpy()
 
-    Y_real = inverse_scale_predictions(Y_scaled, target_scalers)
-    Y_real = Y_real.reshape(HORIZON, len(TARGET_COLS))
-
-    # ---- Build dates
-    start_date = df.index.max() + timedelta(days=1)
+def build_forecast_days(Y_real, last_date):
+    # Y_real: (HORIZON, len(TARGET_COLS)) in physical units
+    start_date = last_date + timedelta(days=1)
     forecast_dates = [
         start_date + timedelta(days=i)
         for i in range(HORIZON)
     ]
 
-    # ---- Build JSON
+    # clip to TARGET_LIMITS and round in one go; tolist() gives Python floats
+    values = clip_targets(np.round(Y_real, 2)).tolist()
+
     forecast = []
-    for i, date in enumerate(forecast_dates):
+    for date, row in zip(forecast_dates, values):
         day = {
             "date": date.strftime("%Y-%m-%d")
         }
-        for j, var in enumerate(TARGET_COLS):
-            value = round(float(Y_real[i, j]), 2)
+        for var, value in zip(TARGET_COLS, row):
             day[var] = {
-                "value": 0 if value < 0 else value,
+                "value": value,
                 "unit": TARGET_UNITS[var]
             }
         forecast.append(day)
 
-    events = integrate_events_into_forecast(forecast)
+    return forecast
+
+
+def load_artifacts(artifact_path):
+    # ---- Load artifacts
+    with stage_timer("load_scalers"):
+        feature_bundle = joblib.load(f"{artifact_path}/feature_scaler_bundle.pkl")
+        target_scalers = joblib.load(f"{artifact_path}/target_scalers.pkl")
+
+    feature_cols = feature_bundle["feature_cols"]
+    with stage_timer("load_model"):
+        config = read_model_config(artifact_path)
+        model = load_model(input_size=len(feature_cols), model_path=f"{artifact_path}/best_lstm_model.pt", config=config)
+
+    with stage_timer("load_weather_data"):
+        df = load_weather_data(f"{artifact_path}/weather.csv")
 
     return {
-        "metadata": {
-            "model": "WeatherLSTM",
-            "horizon_days": HORIZON,
-            "generated_at": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
-        },
-        "forecast": forecast,
-        "events": events  # filled by predict_extreme.py
+        "feature_scaler": feature_bundle["scaler"],
+        "feature_cols": feature_cols,
+        "target_scalers": target_scalers,
+        "target_scale_offset": collapse_target_scalers(target_scalers),
+        "model": model,
+        "lookback": config["lookback"],
+        "df": df,
+        "path": str(artifact_path),
     }
+
+
+def forecast_batch_from_artifacts(artifacts, as_of_dates, df_fe=None):
+    """
+    Forecasts for several as-of dates of one city with a single batched
+    forward pass. as_of None means "latest row", like run_forecast.
+    df_fe can be passed in to reuse an already feature-engineered frame.
+    """
+    df = artifacts["df"]
+
+    # ---- Build input
+    with stage_timer("build_input_windows"):
+        if df_fe is None:
+            df_fe = apply_feature_engineering(df)
+        X, last_dates = build_input_windows(
+            df_fe,
+            artifacts["feature_cols"],
+            artifacts["feature_scaler"],
+            artifacts.get("lookback", LOOKBACK),
+            as_of_dates,
+        )
+        X = X.to(DEVICE)
+
+    # ---- Predict
+    with stage_timer("model_forward"), torch.no_grad():
+        Y_scaled = artifacts["model"](X).cpu().numpy()
+
+    with stage_timer("inverse_scale_predictions"):
+        scale_offset = artifacts.get("target_scale_offset") or artifacts["target_scalers"]
+        Y_real = inverse_scale_predictions(Y_scaled, scale_offset)
+        Y_real = clip_targets(Y_real.reshape(len(last_dates), HORIZON, len(TARGET_COLS)))
+
+    generated_at = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+    # one catalog for the whole batch, recorded so cached results can be re-evaluated
+    rules = current_rules()
+    knowledge_system = knowledge_system_for(artifacts.get("path"), df, rules)
+    results = []
+    for Y_window, last_date in zip(Y_real, last_dates):
+        # ---- Build JSON
+        with stage_timer("build_forecast_json"):
+            forecast = build_forecast_days(Y_window, last_date)
+
+        with stage_timer("integrate_events"):
+            events = integrate_events_into_forecast(forecast, knowledge_system)
+
+        results.append({
+            "metadata": {
+                "model": "WeatherLSTM",
+                "horizon_days": HORIZON,
+                "generated_at": generated_at,
+                "rules_version": rules.version
+            },
+            "forecast": forecast,
+            "events": events  # filled by predict_extreme.py
+        })
+    return results
+
+
+def forecast_from_artifacts(artifacts):
+    return forecast_batch_from_artifacts(artifacts, [None])[0]
+
+
+def run_forecast(artifact_path):
+    # Loaded on first use and kept resident (within FORECAST_MODEL_MEMORY_MB);
+    # in multi-worker mode the resident entry maps the shared plane.
+    artifacts = resident_artifacts().get(artifact_path)
+    return forecast_from_artifacts(artifacts)
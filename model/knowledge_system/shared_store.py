@@ -0,0 +1,307 @@
+"""
+Shared model/data plane for multi-worker deployments.
+
+With several uvicorn/gunicorn workers, every process would otherwise parse
+its own copy of each city's weather.csv, hold its own model weights and keep
+its own forecast cache. When FORECAST_SHARED_DIR is set (ideally on tmpfs,
+e.g. /dev/shm/weather_forecast), workers instead attach to one shared plane:
+
+- model weights are mmap'd straight from best_lstm_model.pt (read-only,
+  backed by the page cache, so N workers share one physical copy);
+- weather.csv is converted once into .npy files under the shared dir and
+  every worker maps them read-only;
+- the latest forecast per city is stored as a snapshot file that all
+  workers read, so a forecast computed by one worker is visible to all.
+
+Writers serialize on per-key flock files: exactly one worker converts a
+history or refreshes a snapshot while the others wait and then reuse its
+result. Files are replaced atomically (write to temp + os.replace), so
+readers never observe partial data.
+"""
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from knowledge_system.helpers import collapse_target_scalers, load_model, load_weather_data, read_model_config
+from knowledge_system.metrics import stage_timer
+
+SHARED_DIR = os.getenv("FORECAST_SHARED_DIR", "")
+
+WEATHER_FORMAT_VERSION = 1
+
+
+def file_signature(path):
+    """Cheap change detector for an input file: (mtime_ns, size)."""
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def optional_signature(path):
+    """file_signature, or None for a file that may not exist (e.g. manifest.json)."""
+    return file_signature(path) if os.path.exists(path) else None
+
+
+ARTIFACT_FILES = ("feature_scaler_bundle.pkl", "target_scalers.pkl", "best_lstm_model.pt", "weather.csv")
+
+
+def artifact_signature(artifact_path):
+    """Signature of everything a loaded city depends on (the manifest may be absent)."""
+    signature = [file_signature(os.path.join(artifact_path, name)) for name in ARTIFACT_FILES]
+    signature.append(optional_signature(os.path.join(artifact_path, "manifest.json")))
+    return signature
+
+
+# mkstemp creates 0600 files and os.replace keeps that mode, which would lock
+# a backend running as another uid out of the live artifacts. Read once: umask
+# can only be queried by setting it, which is not safe once threads run.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _replacement_mode(path):
+    """The mode a file replacing `path` should get: path's own, else the umask default."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+@contextmanager
+def atomic_replace(path):
+    """
+    Binary file handle onto a temp file next to `path`; on a clean exit the
+    temp file takes over path's mode and replaces it with os.replace, so
+    readers see either the old or the new content, never a partial one.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+        os.chmod(tmp, _replacement_mode(path))
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def atomic_write_bytes(path, payload: bytes):
+    with atomic_replace(path) as f:
+        f.write(payload)
+
+
+def atomic_write_json(path, data, **dumps_kwargs):
+    atomic_write_bytes(path, json.dumps(data, **dumps_kwargs).encode("utf-8"))
+
+
+def atomic_copy(src, path):
+    with atomic_replace(path) as f, open(src, "rb") as source:
+        shutil.copyfileobj(source, f)
+
+
+def atomic_save_npy(path, array):
+    with atomic_replace(path) as f:
+        np.save(f, array)
+
+
+class SharedStore:
+    """One shared directory attached to by every worker process."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.locks_dir = self.root / "locks"
+        self.weather_dir = self.root / "weather"
+        self.snapshots_dir = self.root / "snapshots"
+        for d in (self.locks_dir, self.weather_dir, self.snapshots_dir):
+            d.mkdir(parents=True, exist_ok=True)
+
+        # Per-process handles onto the shared files, keyed by input signature.
+        # They only hold mmap views and a few-KB scalers, not private copies.
+        self._attached = {}
+        self._snapshot_cache = {}
+        self._local_lock = threading.Lock()
+
+    # --------------------
+    # Locking
+    # --------------------
+    @contextmanager
+    def exclusive(self, key):
+        """Cross-process exclusive lock on `key` (blocks until acquired)."""
+        import fcntl  # POSIX only; shared mode targets Linux deployments
+
+        lock_path = self.locks_dir / f"{key}.lock"
+        with open(lock_path, "a+") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    # --------------------
+    # Weather history plane
+    # --------------------
+    def _weather_paths(self, city_key):
+        base = self.weather_dir / city_key
+        return base, base / "meta.json", base / "values.npy", base / "index.npy"
+
+    def _read_weather_meta(self, meta_path):
+        try:
+            return json.loads(meta_path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _publish_weather(self, csv_path, city_key, signature):
+        base, meta_path, values_path, index_path = self._weather_paths(city_key)
+        base.mkdir(parents=True, exist_ok=True)
+
+        df = load_weather_data(csv_path)
+        values = np.ascontiguousarray(df.to_numpy(dtype=np.float64))
+        index = df.index.values.astype("datetime64[ns]").astype(np.int64)
+
+        atomic_save_npy(values_path, values)
+        atomic_save_npy(index_path, index)
+        # meta last: it is what readers check, so the arrays are already in place
+        atomic_write_bytes(meta_path, json.dumps({
+            "format": WEATHER_FORMAT_VERSION,
+            "source": str(csv_path),
+            "signature": signature,
+            "columns": list(df.columns),
+        }).encode())
+
+    def load_weather_data(self, csv_path):
+        """weather.csv as a DataFrame whose values are a shared read-only memmap."""
+        csv_path = Path(csv_path)
+        city_key = csv_path.parent.name
+        signature = file_signature(csv_path)
+        _, meta_path, values_path, index_path = self._weather_paths(city_key)
+
+        meta = self._read_weather_meta(meta_path)
+        if meta is None or meta.get("signature") != signature or meta.get("format") != WEATHER_FORMAT_VERSION:
+            with self.exclusive(f"weather-{city_key}"):
+                meta = self._read_weather_meta(meta_path)
+                if meta is None or meta.get("signature") != signature or meta.get("format") != WEATHER_FORMAT_VERSION:
+                    self._publish_weather(csv_path, city_key, signature)
+                    meta = self._read_weather_meta(meta_path)
+
+        values = np.load(values_path, mmap_mode="r")
+        index = pd.DatetimeIndex(np.load(index_path).astype("datetime64[ns]"))
+        return pd.DataFrame(values, index=index, columns=meta["columns"], copy=False)
+
+    # --------------------
+    # Artifact plane
+    # --------------------
+    def attach_artifacts(self, artifact_path):
+        """Same dict as run_forecast.load_artifacts, backed by shared mappings."""
+        artifact_path = Path(artifact_path)
+        files = {
+            "feature_scaler_bundle": artifact_path / "feature_scaler_bundle.pkl",
+            "target_scalers": artifact_path / "target_scalers.pkl",
+            "model": artifact_path / "best_lstm_model.pt",
+            "weather": artifact_path / "weather.csv",
+        }
+        signature = {k: file_signature(p) for k, p in files.items()}
+        signature["manifest"] = optional_signature(artifact_path / "manifest.json")
+
+        key = str(artifact_path)
+        with self._local_lock:
+            attached = self._attached.get(key)
+        if attached is not None and attached["signature"] == signature:
+            return attached["artifacts"]
+
+        with stage_timer("load_scalers"):
+            feature_bundle = joblib.load(files["feature_scaler_bundle"])
+            target_scalers = joblib.load(files["target_scalers"])
+        feature_cols = feature_bundle["feature_cols"]
+
+        with stage_timer("load_model"):
+            config = read_model_config(artifact_path)
+            model = load_model(input_size=len(feature_cols), model_path=files["model"], mmap=True, config=config)
+
+        with stage_timer("load_weather_data"):
+            df = self.load_weather_data(files["weather"])
+
+        artifacts = {
+            "feature_scaler": feature_bundle["scaler"],
+            "feature_cols": feature_cols,
+            "target_scalers": target_scalers,
+            "target_scale_offset": collapse_target_scalers(target_scalers),
+            "model": model,
+            "lookback": config["lookback"],
+            "df": df,
+            "path": str(artifact_path),
+        }
+        with self._local_lock:
+            self._attached[key] = {"signature": signature, "artifacts": artifacts}
+        return artifacts
+
+    def detach_artifacts(self, artifact_path):
+        """Drop this process's handles onto a city (the shared files stay)."""
+        with self._local_lock:
+            self._attached.pop(str(Path(artifact_path)), None)
+
+    # --------------------
+    # Forecast snapshot plane
+    # --------------------
+    def _snapshot_path(self, city):
+        return self.snapshots_dir / f"{city}.json"
+
+    def read_snapshot(self, city):
+        """Latest shared snapshot {"ts", "data"} for city, or None."""
+        path = self._snapshot_path(city)
+        try:
+            signature = file_signature(path)
+        except FileNotFoundError:
+            return None
+
+        cached = self._snapshot_cache.get(city)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        with open(path, "rb") as f:
+            snapshot = json.loads(f.read())
+        self._snapshot_cache[city] = (signature, snapshot)
+        return snapshot
+
+    def write_snapshot(self, city, data, ts=None):
+        snapshot = {"ts": time.time() if ts is None else ts, "data": data}
+        atomic_write_bytes(self._snapshot_path(city), json.dumps(snapshot).encode())
+        return snapshot
+
+    def refresh_snapshot(self, city, compute, is_fresh):
+        """
+        Single-refresher update: take the city lock, re-check freshness (another
+        worker may just have refreshed it) and only then call compute().
+        """
+        with self.exclusive(f"snapshot-{city}"):
+            snapshot = self.read_snapshot(city)
+            if snapshot is not None and is_fresh(snapshot):
+                return snapshot, False
+            return self.write_snapshot(city, compute()), True
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_shared_store():
+    """The process-wide SharedStore, or None when shared mode is off."""
+    global _store
+    if not SHARED_DIR:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SharedStore(SHARED_DIR)
+    return _store
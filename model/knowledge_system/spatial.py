@@ -0,0 +1,117 @@
+"""
+Forecast by coordinates: nearest-station lookup and inverse-distance blending
+for GET /forecast?lat=&lon=.
+
+StationIndex is a BallTree with the haversine metric over the servable
+stations of the catalog (knowledge_system.catalog) that have coordinates in
+locations.json. It is rebuilt only when the catalog is rescanned, so a
+lookup is one tree query (tens of microseconds with thousands of stations).
+
+blend_forecasts combines the cached forecasts of the k nearest stations into
+one with inverse-distance weights (1 / d**IDW_POWER), as one weighted sum
+over a (stations, days, variables) array. Days are aligned on the nearest
+station's dates; a station without a given day is left out of that day's
+weights.
+"""
+import threading
+
+import numpy as np
+from sklearn.neighbors import BallTree
+
+EARTH_RADIUS_KM = 6371.0088
+IDW_POWER = 2.0
+# a point this close to a station gets that station's forecast as is
+SAME_POINT_KM = 0.05
+
+
+class StationIndex:
+    """Haversine BallTree over the servable stations with coordinates."""
+
+    def __init__(self, cities):
+        located = [
+            city for city in cities.values()
+            if city.has_model and city.latitude is not None and city.longitude is not None
+        ]
+        self.cities = tuple(located)
+        self._tree = None
+        if located:
+            coords = np.radians([[city.latitude, city.longitude] for city in located])
+            self._tree = BallTree(coords, metric="haversine")
+
+    def __len__(self):
+        return len(self.cities)
+
+    def query(self, lat, lon, k=1):
+        """[(City, distance_km)] of the k nearest stations, nearest first."""
+        if self._tree is None:
+            return []
+        k = min(k, len(self.cities))
+        distances, indices = self._tree.query(np.radians([[lat, lon]]), k=k)
+        return [
+            (self.cities[i], d * EARTH_RADIUS_KM)
+            for i, d in zip(indices[0].tolist(), distances[0].tolist())
+        ]
+
+
+_index = None               # (catalog mapping it was built from, StationIndex)
+_index_lock = threading.Lock()
+
+
+def station_index(catalog):
+    """StationIndex of a CityCatalog, rebuilt when the catalog was rescanned."""
+    global _index
+    cities = catalog.cities()
+    cached = _index
+    if cached is not None and cached[0] is cities:
+        return cached[1]
+    with _index_lock:
+        if _index is None or _index[0] is not cities:
+            _index = (cities, StationIndex(cities))
+        return _index[1]
+
+
+def idw_weights(distances_km, power=IDW_POWER):
+    """Normalized inverse-distance weights; a station at the point takes all the weight."""
+    distances = np.asarray(distances_km, dtype=np.float64)
+    close = distances < SAME_POINT_KM
+    if close.any():
+        weights = close.astype(np.float64)
+    else:
+        weights = 1.0 / distances ** power
+    return weights / weights.sum()
+
+
+def blend_forecasts(forecasts, weights):
+    """
+    forecasts: list of forecast day lists (run_forecast format), nearest
+    first; weights: their idw_weights. Returns the blended day list on the
+    first forecast's dates, with the same variables and units.
+    """
+    base = forecasts[0]
+    dates = [day["date"] for day in base]
+    variables = [key for key, value in base[0].items() if isinstance(value, dict) and "value" in value]
+    position = {date: i for i, date in enumerate(dates)}
+
+    # (stations, days, variables); NaN where a station has no such day
+    values = np.full((len(forecasts), len(dates), len(variables)), np.nan)
+    for s, forecast in enumerate(forecasts):
+        for day in forecast:
+            i = position.get(day["date"])
+            if i is not None:
+                values[s, i] = [day[var]["value"] for var in variables]
+
+    w = np.asarray(weights, dtype=np.float64)[:, None, None] * ~np.isnan(values)
+    blended = np.nansum(values * w, axis=0) / w.sum(axis=0)
+    blended = np.round(blended, 2).tolist()
+
+    return [
+        {
+            "date": date,
+            **{
+                var: {"value": row[j], "unit": base[0][var].get("unit")}
+                for j, var in enumerate(variables)
+            },
+        }
+        for date, row in zip(dates, blended)
+    ]
+
@@ -0,0 +1,378 @@
+"""
+Streaming ingestion: hourly observations -> running daily aggregates ->
+weather.csv, as they arrive instead of in one nightly batch.
+
+    publisher   appends hourly observations of every station to a FileQueue
+                (retrieve_data/producer/weather_stream.py publish)
+    consumer    StreamConsumer reads the queue from its committed offset and
+                keeps one DayAggregate per (city, local day): counts, sums,
+                max and min per field, updated in O(1) per message
+    finalize    a day closes once the city's event time is STREAM_LATENESS_HOURS
+                past the end of that (Africa/Casablanca) day; closed days are
+                QC'd (qc.qc_append) and appended to artifacts/<city>/weather.csv
+    nowcast     the aggregates of the open day are written to
+                artifacts/<city>/intraday.json after every batch (read_partial,
+                GET /nowcast on the backend)
+
+The aggregates match the nightly Spark job (means of temp, dwpt, wspd, visib;
+max/min of temp; sum of prcp; missing values ignored). FileQueue is a
+JSON-lines log with byte offsets, a local stand-in for a broker topic. The
+consumer checkpoints its offset together with the open aggregates after each
+batch, and an observation hour already counted is ignored, so a restart or a
+re-published hour never counts twice. Days already in weather.csv (e.g.
+written by the nightly job) are not rewritten.
+
+Only the standard library, numpy/pandas and qc.py are needed, so the module
+can be mounted into the ingestion containers like qc.py.
+"""
+import fcntl
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+from knowledge_system.qc import qc_append
+from knowledge_system.shared_store import atomic_write_bytes
+
+LOCAL_TZ = ZoneInfo("Africa/Casablanca")
+LATENESS = timedelta(hours=float(os.getenv("STREAM_LATENESS_HOURS", "2")))
+WEATHER_FILE = "weather.csv"
+INTRADAY_FILE = "intraday.json"
+
+HOURLY_FIELDS = ("temp", "dwpt", "prcp", "wspd", "visib")
+# weather.csv column -> (hourly field, aggregate), as in the Spark job
+DAILY_AGGREGATES = {
+    "mean_temperature": ("temp", "mean"),
+    "max_temperature": ("temp", "max"),
+    "min_temperature": ("temp", "min"),
+    "mean_dewPoint": ("dwpt", "mean"),
+    "total_precipitation": ("prcp", "sum"),
+    "mean_windSpeed": ("wspd", "mean"),
+    "mean_visibility": ("visib", "mean"),
+}
+
+
+# --------------------
+# Observations
+# --------------------
+def derived_visibility(temp, dwpt):
+    """Visibility proxy (km) from the dew point depression, capped to [0, 10]."""
+    if temp is None or dwpt is None:
+        return None
+    return float(max(min((temp - dwpt) * 1.5, 10), 0))
+
+
+def hourly_observation(city, ts, temp=None, dwpt=None, prcp=None, wspd_kmh=None):
+    """Queue message of one Meteostat hour (wind km/h -> m/s, derived visibility)."""
+    ts = ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+    return {
+        "city": city,
+        "ts": ts.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "temp": temp,
+        "dwpt": dwpt,
+        "prcp": prcp,
+        "wspd": wspd_kmh / 3.6 if wspd_kmh is not None else None,
+        "visib": derived_visibility(temp, dwpt),
+    }
+
+
+def parse_ts(text):
+    return datetime.strptime(text, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+
+
+def local_day(ts):
+    return ts.astimezone(LOCAL_TZ).date()
+
+
+def day_end_utc(day):
+    """End of a local day (next local midnight), in UTC."""
+    midnight = datetime.combine(day + timedelta(days=1), datetime.min.time(), tzinfo=LOCAL_TZ)
+    return midnight.astimezone(timezone.utc)
+
+
+# --------------------
+# Queue
+# --------------------
+class FileQueue:
+    """
+    Append-only JSON-lines log: publish() appends under an exclusive flock,
+    read() returns the complete lines after a byte offset and the next offset.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def publish(self, messages):
+        payload = "".join(json.dumps(m, separators=(",", ":")) + "\n" for m in messages).encode()
+        if not payload:
+            return
+        with open(self.path, "ab") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read(self, offset=0, max_messages=1000):
+        messages = []
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return messages, offset
+        with f:
+            f.seek(offset)
+            while len(messages) < max_messages:
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break               # end of log, or a line still being written
+                offset += len(line)
+                messages.append(json.loads(line))
+        return messages, offset
+
+
+# --------------------
+# Aggregation
+# --------------------
+class DayAggregate:
+    """Running aggregates of one city and local day."""
+
+    __slots__ = ("day", "hours", "count", "total", "high", "low")
+
+    def __init__(self, day):
+        self.day = day
+        self.hours = set()                  # UTC hours already counted
+        self.count = dict.fromkeys(HOURLY_FIELDS, 0)
+        self.total = dict.fromkeys(HOURLY_FIELDS, 0.0)
+        self.high = dict.fromkeys(HOURLY_FIELDS)
+        self.low = dict.fromkeys(HOURLY_FIELDS)
+
+    def add(self, hour, observation):
+        """Count one hourly observation; False when that hour was already counted."""
+        if hour in self.hours:
+            return False
+        self.hours.add(hour)
+        for field in HOURLY_FIELDS:
+            value = observation.get(field)
+            if value is None:
+                continue
+            self.count[field] += 1
+            self.total[field] += value
+            if self.high[field] is None or value > self.high[field]:
+                self.high[field] = value
+            if self.low[field] is None or value < self.low[field]:
+                self.low[field] = value
+        return True
+
+    def values(self):
+        """{weather.csv column: value or None}."""
+        out = {}
+        for column, (field, how) in DAILY_AGGREGATES.items():
+            if not self.count[field]:
+                out[column] = None
+            elif how == "mean":
+                out[column] = self.total[field] / self.count[field]
+            elif how == "sum":
+                out[column] = self.total[field]
+            else:
+                out[column] = self.high[field] if how == "max" else self.low[field]
+        return out
+
+    def to_json(self):
+        return {
+            "day": self.day.isoformat(),
+            "hours": sorted(self.hours),
+            "count": self.count,
+            "total": self.total,
+            "high": self.high,
+            "low": self.low,
+        }
+
+    @classmethod
+    def from_json(cls, raw):
+        aggregate = cls(datetime.strptime(raw["day"], "%Y-%m-%d").date())
+        aggregate.hours = set(raw["hours"])
+        aggregate.count, aggregate.total = raw["count"], raw["total"]
+        aggregate.high, aggregate.low = raw["high"], raw["low"]
+        return aggregate
+
+
+class DailyAggregator:
+    """
+    Open DayAggregates per city, closed by event time: a day is complete
+    once an observation of the city is `lateness` past the day's end.
+    Observations of a day that was already closed are dropped (counted in
+    `late`).
+    """
+
+    def __init__(self, lateness=LATENESS):
+        self.lateness = lateness
+        self.open = {}              # city -> {day: DayAggregate}
+        self.watermark = {}         # city -> latest observation time
+        self.closed_through = {}    # city -> last closed day
+        self.late = 0
+
+    def add(self, observation):
+        city = observation["city"]
+        ts = parse_ts(observation["ts"])
+        day = local_day(ts)
+        closed = self.closed_through.get(city)
+        if closed is not None and day <= closed:
+            self.late += 1
+            return
+        days = self.open.setdefault(city, {})
+        aggregate = days.get(day)
+        if aggregate is None:
+            aggregate = days[day] = DayAggregate(day)
+        aggregate.add(observation["ts"][:13], observation)
+        if city not in self.watermark or ts > self.watermark[city]:
+            self.watermark[city] = ts
+
+    def close_ready(self):
+        """{city: [(day, values)]} of the days past the watermark, removed from the open set."""
+        ready = {}
+        for city, days in self.open.items():
+            watermark = self.watermark[city] - self.lateness
+            for day in sorted(days):
+                if day_end_utc(day) > watermark:
+                    break
+                ready.setdefault(city, []).append((day, days.pop(day).values()))
+                self.closed_through[city] = day
+        return ready
+
+    def partial(self, city):
+        """The latest open day of a city, for nowcasting (None when nothing is open)."""
+        days = self.open.get(city)
+        if not days:
+            return None
+        aggregate = days[max(days)]
+        return {
+            "city": city,
+            "date": aggregate.day.isoformat(),
+            "hours_observed": len(aggregate.hours),
+            "last_observation": self.watermark[city].strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "values": aggregate.values(),
+        }
+
+    def to_json(self):
+        return {
+            "open": {city: [a.to_json() for a in days.values()] for city, days in self.open.items()},
+            "watermark": {city: ts.strftime("%Y-%m-%dT%H:%M:%SZ") for city, ts in self.watermark.items()},
+            "closed_through": {city: day.isoformat() for city, day in self.closed_through.items()},
+            "late": self.late,
+        }
+
+    @classmethod
+    def from_json(cls, raw, lateness=LATENESS):
+        aggregator = cls(lateness)
+        for city, days in raw.get("open", {}).items():
+            aggregates = [DayAggregate.from_json(a) for a in days]
+            aggregator.open[city] = {a.day: a for a in aggregates}
+        aggregator.watermark = {city: parse_ts(ts) for city, ts in raw.get("watermark", {}).items()}
+        aggregator.closed_through = {
+            city: datetime.strptime(day, "%Y-%m-%d").date() for city, day in raw.get("closed_through", {}).items()
+        }
+        aggregator.late = raw.get("late", 0)
+        return aggregator
+
+
+# --------------------
+# Outputs
+# --------------------
+def finalize_days(city_dir, days):
+    """
+    Append closed days [(date, values)] to city_dir/weather.csv through
+    qc_append, skipping days the file already has. Returns the days written.
+    """
+    csv_path = Path(city_dir) / WEATHER_FILE
+    history = pd.read_csv(csv_path, index_col=0, parse_dates=True) if csv_path.exists() else None
+    last = history.index.max() if history is not None and not history.empty else None
+
+    rows = {pd.Timestamp(day): values for day, values in days if last is None or pd.Timestamp(day) > last}
+    if not rows:
+        return []
+    new_rows = pd.DataFrame.from_dict(rows, orient="index", columns=list(DAILY_AGGREGATES), dtype="float64")
+    merged = qc_append(history, new_rows)
+    atomic_write_bytes(csv_path, merged.to_csv().encode())
+    return [day.date() for day in new_rows.index]
+
+
+def write_partial(city_dir, partial):
+    partial = {**partial, "updated_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")}
+    atomic_write_bytes(Path(city_dir) / INTRADAY_FILE, json.dumps(partial).encode())
+
+
+def read_partial(city_dir):
+    """The intraday aggregates written by the stream consumer, or None."""
+    try:
+        with open(Path(city_dir) / INTRADAY_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+# --------------------
+# Consumer
+# --------------------
+class StreamConsumer:
+    """
+    Reads a FileQueue from its committed offset into a DailyAggregator,
+    finalizes closed days into data_dir/<city>/weather.csv and refreshes
+    the intraday partials. The offset and the open aggregates are
+    checkpointed together in <queue>.<group>.state.json after each batch.
+    """
+
+    def __init__(self, queue, data_dir, group="daily", lateness=LATENESS, on_finalized=None):
+        self.queue = queue
+        self.data_dir = Path(data_dir)
+        self.state_path = queue.path.with_name(f"{queue.path.name}.{group}.state.json")
+        self.on_finalized = on_finalized
+        self.offset = 0
+        self.aggregator = DailyAggregator(lateness)
+        if self.state_path.exists():
+            state = json.loads(self.state_path.read_text(encoding="utf-8"))
+            self.offset = state["offset"]
+            self.aggregator = DailyAggregator.from_json(state["aggregates"], lateness)
+
+    def poll_once(self, max_messages=10_000):
+        """Consume one batch; returns (messages, {city: [finalized days]})."""
+        messages, offset = self.queue.read(self.offset, max_messages)
+        if not messages:
+            return 0, {}
+        for message in messages:
+            self.aggregator.add(message)
+
+        finalized = {}
+        for city, days in self.aggregator.close_ready().items():
+            written = finalize_days(self.data_dir / city, days)
+            if written:
+                finalized[city] = written
+        for city in {m["city"] for m in messages}:
+            partial = self.aggregator.partial(city)
+            if partial is not None:
+                write_partial(self.data_dir / city, partial)
+
+        # weather.csv first, then the checkpoint: a replay finds the days already written
+        self.offset = offset
+        state = {"offset": offset, "aggregates": self.aggregator.to_json()}
+        atomic_write_bytes(self.state_path, json.dumps(state).encode())
+
+        if finalized and self.on_finalized is not None:
+            self.on_finalized(sorted(finalized))
+        return len(messages), finalized
+
+    def run(self, interval=5.0, stop=None):
+        """Poll until `stop` (a threading.Event) is set; sleeps only when the queue is drained."""
+        while stop is None or not stop.is_set():
+            count, _ = self.poll_once()
+            if not count:
+                if stop is None:
+                    time.sleep(interval)
+                else:
+                    stop.wait(interval)
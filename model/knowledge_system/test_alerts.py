@@ -0,0 +1,190 @@
+"""
+Alert diff, subscription matching and webhook delivery (alerts.py), the
+delivery against an in-process HTTP stand-in.
+
+Run from the repo root:
+    python -m pytest -q model/knowledge_system/test_alerts.py
+"""
+import asyncio
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+MODEL_DIR = Path(__file__).resolve().parents[1]
+if str(MODEL_DIR) not in sys.path:
+    sys.path.insert(0, str(MODEL_DIR))
+
+import pytest  # noqa: E402
+
+from knowledge_system import alerts  # noqa: E402
+
+
+def event(event_id, day, severity, category="heat"):
+    return {
+        "event_id": event_id,
+        "date": day,
+        "type": event_id.replace("_", " ").title(),
+        "category": category,
+        "severity": severity,
+        "description": f"{event_id} on {day}",
+    }
+
+
+def forecast_result(first_day, events):
+    return {
+        "metadata": {"generated_at": f"{first_day}T06:00:00", "input_version": "v-" + first_day},
+        "forecast": [{"date": first_day}],
+        "events": [{"detailed_events": events}],
+    }
+
+
+@pytest.fixture
+def local_webhooks(monkeypatch):
+    monkeypatch.setattr(alerts, "WEBHOOK_ALLOW_HOSTS", ("127.0.0.1",))
+
+
+# --------------------
+# Diff
+# --------------------
+def test_event_changes():
+    previous = alerts.published_events(forecast_result("2026-01-20", [
+        event("extreme_heat", "2026-01-21", "HIGH"),
+        event("heavy_rain", "2026-01-22", "EXTREME", "rain"),
+        event("strong_wind", "2026-01-23", "MODERATE", "wind"),
+        event("frost", "2026-01-19", "HIGH", "cold"),
+    ]))
+    current = alerts.published_events(forecast_result("2026-01-21", [
+        event("extreme_heat", "2026-01-21", "EXTREME"),             # escalated
+        event("heavy_rain", "2026-01-22", "HIGH", "rain"),          # lower: no alert
+        event("dust_storm", "2026-01-24", "HIGH", "wind"),          # new
+    ]))
+    # strong_wind is gone while its day is still forecast: cleared;
+    # frost's day left the horizon: it expires without an alert
+    changes = alerts.event_changes(previous, current, "2026-01-21")
+    got = sorted((change, e["event_id"], before) for change, e, before in changes)
+    assert got == [
+        ("cleared", "strong_wind", "MODERATE"),
+        ("escalated", "extreme_heat", "HIGH"),
+        ("new", "dust_storm", None),
+    ]
+
+
+def test_publish_emits_each_change_once(tmp_path, local_webhooks):
+    dispatcher = alerts.AlertDispatcher(tmp_path)
+    dispatcher.subscriptions.add("http://127.0.0.1:9/hook")
+    result = forecast_result("2026-01-21", [event("extreme_heat", "2026-01-22", "HIGH")])
+
+    assert [c[0] for c in dispatcher.publish("casablanca", result)] == ["new"]
+    assert dispatcher.publish("casablanca", result) == []
+    # another process sees the published set on disk, not its own memory
+    assert alerts.AlertDispatcher(tmp_path).publish("casablanca", result) == []
+    assert dispatcher.outbox.pending() == 1
+
+
+# --------------------
+# Subscriptions
+# --------------------
+def test_subscription_match(tmp_path, local_webhooks):
+    table = alerts.SubscriptionTable(tmp_path / "subscriptions.json")
+    url = "http://127.0.0.1:9/hook"
+    everything = table.add(url, min_severity="LOW")
+    casablanca = table.add(url, cities=[" Casablanca "], min_severity="HIGH")
+    heat = table.add(url, categories=["heat"], min_severity="EXTREME")
+    sale_rain = table.add(url, cities=["sale"], categories=["rain"], min_severity="MODERATE")
+
+    def matched(city, category, severity):
+        return {s["id"] for s in table.match(city, category, severity)}
+
+    assert matched("casablanca", "heat", "EXTREME") == {everything["id"], casablanca["id"], heat["id"]}
+    assert matched("casablanca", "heat", "MODERATE") == {everything["id"]}
+    assert matched("sale", "rain", "MODERATE") == {everything["id"], sale_rain["id"]}
+    assert matched("sale", "heat", "HIGH") == {everything["id"]}
+
+    assert table.remove(everything["id"])
+    assert not table.remove(everything["id"])
+    assert matched("sale", "heat", "HIGH") == set()
+
+
+def test_subscription_refuses_internal_hosts(tmp_path):
+    table = alerts.SubscriptionTable(tmp_path / "subscriptions.json")
+    for url in ("http://127.0.0.1:9100/", "http://169.254.169.254/latest", "http://10.0.0.1/", "ftp://example.org/"):
+        with pytest.raises(ValueError):
+            table.add(url)
+    assert table.all() == []
+
+
+# --------------------
+# Delivery
+# --------------------
+@pytest.fixture
+def stand_in():
+    """Webhook receiver on 127.0.0.1 answering with the queued statuses, then 200."""
+    received, statuses = [], []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            status = statuses.pop(0) if statuses else 200
+            received.append((status, [a["event_id"] for a in body["alerts"]]))
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/hook", statuses, received
+    server.shutdown()
+    server.server_close()
+
+
+def deliver_once(dispatcher):
+    async def run():
+        async with dispatcher.client() as client:
+            return await dispatcher.deliver_once(client)
+    return asyncio.run(run())
+
+
+def test_deliver_once_retries_in_publish_order(tmp_path, local_webhooks, stand_in, monkeypatch):
+    url, statuses, received = stand_in
+    monkeypatch.setattr(alerts, "BATCH_MAX", 1)                # one entry per POST
+    monkeypatch.setattr(alerts, "BACKOFF_BASE_SECONDS", 0.0)   # retries are due at once
+
+    dispatcher = alerts.AlertDispatcher(tmp_path)
+    dispatcher.subscriptions.add(url)
+    dispatcher.publish("casablanca", forecast_result("2026-01-21", [event("extreme_heat", "2026-01-22", "HIGH")]))
+    dispatcher.publish("casablanca", forecast_result("2026-01-21", [
+        event("extreme_heat", "2026-01-22", "HIGH"),
+        event("heavy_rain", "2026-01-23", "HIGH", "rain"),
+    ]))
+    assert dispatcher.outbox.pending() == 2
+
+    statuses.append(503)
+    assert deliver_once(dispatcher) == 0
+    # the later entry waited behind the failed one instead of overtaking it
+    assert received == [(503, ["extreme_heat"])]
+    assert dispatcher.outbox.pending() == 2
+
+    assert deliver_once(dispatcher) == 2
+    assert received[1:] == [(200, ["extreme_heat"]), (200, ["heavy_rain"])]
+    assert dispatcher.outbox.pending() == 0
+    assert not (tmp_path / "dead").exists()
+
+
+def test_rejected_delivery_goes_to_dead(tmp_path, local_webhooks, stand_in):
+    url, statuses, received = stand_in
+    dispatcher = alerts.AlertDispatcher(tmp_path)
+    dispatcher.subscriptions.add(url)
+    dispatcher.publish("casablanca", forecast_result("2026-01-21", [event("extreme_heat", "2026-01-22", "HIGH")]))
+
+    statuses.append(400)
+    assert deliver_once(dispatcher) == 0
+    assert len(received) == 1
+    assert dispatcher.outbox.pending() == 0
+    [dead] = (tmp_path / "dead").iterdir()
+    assert json.loads(dead.read_text())["last_error"] == "HTTP 400"
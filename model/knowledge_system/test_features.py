@@ -0,0 +1,72 @@
+"""
+Parity of the stacked feature engine (features.py) with the per-city pandas
+path (helpers.apply_feature_engineering), on the artifacts' weather.csv
+files and every scaler bundle's feature_cols.
+
+Run from the repo root:
+    python -m pytest -q model/knowledge_system/test_features.py
+"""
+import sys
+from pathlib import Path
+
+MODEL_DIR = Path(__file__).resolve().parents[1]
+if str(MODEL_DIR) not in sys.path:
+    sys.path.insert(0, str(MODEL_DIR))
+
+import joblib  # noqa: E402
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import pytest  # noqa: E402
+
+from knowledge_system.catalog import ARTIFACTS_DIR  # noqa: E402
+from knowledge_system.features import engineer_features, stack_histories  # noqa: E402
+from knowledge_system.helpers import apply_feature_engineering, load_weather_data  # noqa: E402
+
+CITY_DIRS = sorted(p for p in ARTIFACTS_DIR.iterdir() if (p / "weather.csv").exists())
+BUNDLES = [p for p in CITY_DIRS if (p / "feature_scaler_bundle.pkl").exists()]
+
+
+@pytest.fixture(scope="module")
+def frames():
+    return {p.name: load_weather_data(p / "weather.csv") for p in CITY_DIRS}
+
+
+def assert_parity(frames, feature_cols):
+    names, dates, values = stack_histories(frames)
+    stacked = engineer_features(values, dates, feature_cols)
+    for c, name in enumerate(names):
+        rows = dates.get_indexer(pd.DatetimeIndex(frames[name].index).normalize())
+        got = stacked[c, rows]
+        expected = apply_feature_engineering(frames[name])[feature_cols].to_numpy(dtype=np.float32)
+        np.testing.assert_array_equal(np.isnan(got), np.isnan(expected), err_msg=f"{name}: NaN positions")
+        np.testing.assert_allclose(got, expected, rtol=1e-5, atol=1e-4, err_msg=name)
+
+
+@pytest.mark.parametrize("city_dir", BUNDLES, ids=lambda p: p.name)
+def test_matches_pandas_for_each_bundle(frames, city_dir):
+    feature_cols = joblib.load(city_dir / "feature_scaler_bundle.pkl")["feature_cols"]
+    # a later start and a shorter history give the stack ragged ends
+    ragged = {**frames, "late": next(iter(frames.values())).iloc[400:-30]}
+    assert_parity(ragged, feature_cols)
+
+
+def test_missing_day(frames):
+    # The pandas path shifts by row, the stacked one by calendar day: on a
+    # frame without the row of a day, lag_1 of the next day would be the day
+    # before in one and NaN in the other. Such a frame is rejected ...
+    name, df = next(iter(frames.items()))
+    gapped = df.drop(df.index[100])
+    with pytest.raises(ValueError, match="skip or reorder days"):
+        stack_histories({name: gapped})
+
+    # ... and the missing day kept as a NaN row (what qc does) still matches.
+    feature_cols = joblib.load(BUNDLES[0] / "feature_scaler_bundle.pkl")["feature_cols"]
+    blank = df.copy()
+    blank.iloc[100, blank.columns.get_indexer([c for c in blank.columns if c != "qc_flags"])] = np.nan
+    assert_parity({name: blank}, feature_cols)
+
+
+def test_unknown_feature_column(frames):
+    names, dates, values = stack_histories(frames)
+    with pytest.raises(KeyError):
+        engineer_features(values, dates, ["mean_temperature", "not_a_feature"])
@@ -0,0 +1,94 @@
+"""
+Incremental updates of the history pyramid (history.py) against full
+rebuilds, over random sequences of appended, truncated, edited and
+front-cut histories.
+
+Run from the repo root:
+    python -m pytest -q model/knowledge_system/test_history.py
+"""
+import sys
+from pathlib import Path
+
+MODEL_DIR = Path(__file__).resolve().parents[1]
+if str(MODEL_DIR) not in sys.path:
+    sys.path.insert(0, str(MODEL_DIR))
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+import pytest  # noqa: E402
+
+from knowledge_system.history import LEVELS, TARGETS, HistoryPyramid, day_number  # noqa: E402
+
+SEQUENCES = 300
+OPERATIONS = 6
+
+
+def synthetic_history(rng, n_days, end="2025-08-24"):
+    index = pd.date_range(end=end, periods=n_days, freq="D")
+    values = rng.normal(15.0, 6.0, (n_days, len(TARGETS)))
+    values[rng.random(values.shape) < 0.03] = np.nan
+    return pd.DataFrame(values, index=index, columns=list(TARGETS))
+
+
+def mutate(rng, df):
+    """One random change of the history: append, truncate, edit or cut-front."""
+    operation = rng.choice(["append", "truncate", "edit", "cut_front"])
+    if operation == "append":
+        extra = synthetic_history(rng, int(rng.integers(1, 45)), end=df.index[-1] + pd.Timedelta(days=45))
+        return pd.concat([df, extra.iloc[:int(rng.integers(1, len(extra) + 1))]]), operation
+    if operation == "truncate" and len(df) > 10:
+        return df.iloc[:-int(rng.integers(1, min(60, len(df) - 5)))], operation
+    if operation == "cut_front" and len(df) > 10:
+        return df.iloc[int(rng.integers(1, min(60, len(df) - 5))):], operation
+    df = df.copy()
+    rows = rng.integers(0, len(df), int(rng.integers(1, 4)))
+    column = rng.integers(0, len(TARGETS))
+    df.iloc[rows, column] = np.nan if rng.random() < 0.3 else rng.normal(15.0, 6.0, len(rows))
+    return df, "edit"
+
+
+def assert_same_pyramid(incremental, rebuilt, context):
+    assert incremental.first_day == rebuilt.first_day, context
+    np.testing.assert_array_equal(incremental.values, rebuilt.values, err_msg=context)
+    for level in LEVELS:
+        (first_key, blocks), (expected_key, expected) = incremental.levels[level], rebuilt.levels[level]
+        assert first_key == expected_key, f"{context}, {level}"
+        assert len(blocks) == len(expected), f"{context}, {level}"
+        for name in ("count", "total", "low", "high"):
+            np.testing.assert_allclose(getattr(blocks, name), getattr(expected, name), rtol=1e-12,
+                                       err_msg=f"{context}, {level}.{name}")
+
+
+@pytest.mark.parametrize("seed", range(0, SEQUENCES, 50))
+def test_incremental_matches_rebuild(seed):
+    for sequence in range(seed, seed + 50):
+        rng = np.random.default_rng(sequence)
+        df = synthetic_history(rng, int(rng.integers(20, 900)))
+        pyramid = HistoryPyramid(df)
+        operations = []
+        for _ in range(OPERATIONS):
+            df, operation = mutate(rng, df)
+            operations.append(operation)
+            pyramid.update(df)
+            assert_same_pyramid(pyramid, HistoryPyramid(df), f"sequence {sequence}: {operations}")
+
+
+def test_queries_after_append():
+    rng = np.random.default_rng(7)
+    df = synthetic_history(rng, 800)
+    pyramid = HistoryPyramid(df)
+    df = pd.concat([df, synthetic_history(rng, 10, end=df.index[-1] + pd.Timedelta(days=10))])
+    pyramid.update(df)
+
+    lo, hi = day_number(df.index[37]), day_number(df.index[-3])
+    expected = df.iloc[37:-2]
+    summary = pyramid.summarize(lo, hi)
+    np.testing.assert_array_equal(summary.count, expected.notna().sum().to_numpy())
+    np.testing.assert_allclose(summary.total, expected.sum().to_numpy())
+    np.testing.assert_allclose(summary.low, expected.min().to_numpy())
+    np.testing.assert_allclose(summary.high, expected.max().to_numpy())
+
+    starts, ends, months = pyramid.buckets(lo, hi, "month")
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        rows = expected.loc[str(np.datetime64(int(start), "D")):str(np.datetime64(int(end), "D"))]
+        np.testing.assert_allclose(months.total[i], rows.sum().to_numpy())
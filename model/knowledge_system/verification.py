@@ -0,0 +1,249 @@
+"""
+Verification of the archived forecasts (knowledge_system/archive.py) against
+the observations appended to weather.csv afterwards.
+
+For every city, the job keeps running sums in <archive>/<city>.verification.json:
+    per lead day (1..HORIZON) and variable: pairs, sum of errors, of absolute
+    errors and of squared errors (-> bias, MAE, RMSE)
+    per event id and lead day: hits, false alarms and misses, the observed
+    events being the rule engine run on the observed days (-> hit rate,
+    false alarm ratio). Only daily rules are verified: multi-day patterns
+    are reported for a date range, not under the forecast days.
+and `verified_through`, the last observed day already counted. Each run only
+reads the days observed since then and the records whose horizon reaches
+them (issue_day >= first new day - HORIZON), which ForecastArchive.records
+finds by reading the archive backwards from its end, so the nightly cost
+follows the new days, not the size of the archive. When several records
+share an issue day (model retrained on the same history), the last one
+archived is verified.
+
+Usage (after the nightly ingestion, from model/):
+    python -m knowledge_system.verification
+    python -m knowledge_system.verification --cities casablanca --archive-dir /data/_archive --artifacts-dir /data
+"""
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from knowledge_system.archive import (
+    ARCHIVE_DIR,
+    EVENT_WORDS,
+    HORIZON,
+    VARIABLES,
+    ForecastArchive,
+    day_number,
+    day_string,
+)
+from knowledge_system.catalog import ARTIFACTS_DIR
+from knowledge_system.shared_store import atomic_write_json
+
+STATE_SUFFIX = ".verification.json"
+
+
+def _empty_state():
+    zeros = [[0.0] * len(VARIABLES) for _ in range(HORIZON)]
+    return {
+        "verified_through": None,
+        "pairs": [row[:] for row in zeros],
+        "error": [row[:] for row in zeros],
+        "abs_error": [row[:] for row in zeros],
+        "sq_error": [row[:] for row in zeros],
+        "events": {},       # event_id -> {"hits": [..HORIZON], "false_alarms": [...], "misses": [...]}
+    }
+
+
+def state_path(archive, city):
+    return archive.root / f"{city}{STATE_SUFFIX}"
+
+
+def load_state(archive, city):
+    path = state_path(archive, city)
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def _save_state(archive, city, state):
+    path = state_path(archive, city)
+    atomic_write_json(path, state)
+
+
+def _day_numbers(index):
+    return ((pd.DatetimeIndex(index).normalize() - pd.Timestamp("1970-01-01")).days).to_numpy()
+
+
+def _latest_per_issue_day(records):
+    if not len(records):
+        return records
+    order = np.lexsort((records["archived_at"], records["issue_day"]))
+    records = records[order]
+    last = np.r_[records["issue_day"][1:] != records["issue_day"][:-1], True]
+    return records[last]
+
+
+def observed_event_masks(archive, city_dir, history, first_day, last_day):
+    """(days, EVENT_WORDS) bitmasks of the daily events the rules find in the observed days."""
+    from knowledge_system.predict_extreme import knowledge_system_for
+
+    window = history.loc[day_string(first_day):day_string(last_day), list(VARIABLES)].dropna()
+    days = [
+        {"date": ts.strftime("%Y-%m-%d"), **{var: {"value": float(row[var])} for var in VARIABLES}}
+        for ts, row in window.iterrows()
+    ]
+    fired = {}
+    if days:
+        for event in knowledge_system_for(city_dir, history).detect_extreme_events(days):
+            if event.rule.kind is None:
+                fired.setdefault(event.date, set()).add(event.rule.event_id)
+
+    masks = np.zeros((last_day - first_day + 1, EVENT_WORDS), dtype=np.uint64)
+    for date, event_ids in fired.items():
+        position = (pd.Timestamp(date) - pd.Timestamp(day_string(first_day))).days
+        if 0 <= position < len(masks):
+            masks[position] = archive.event_mask(event_ids)
+    return masks
+
+
+def verify_city(archive, city, city_dir):
+    """Count the newly observed days of a city; returns (state, days verified)."""
+    state = load_state(archive, city) or _empty_state()
+    csv_path = Path(city_dir) / "weather.csv"
+    if not csv_path.exists():
+        return state, 0
+    history = pd.read_csv(csv_path, index_col=0, parse_dates=True)
+    last_observed = int(_day_numbers(history.index[-1:])[0])
+
+    verified_through = state["verified_through"]
+    if verified_through is None:
+        archived = archive.records(city)
+        if not len(archived):
+            return state, 0
+        # nothing before the first archived forecast can be verified
+        verified_through = int(archived["issue_day"].min())
+    else:
+        verified_through = day_number(verified_through)
+    if last_observed <= verified_through:
+        return state, 0
+
+    first_new = verified_through + 1
+    n_new = last_observed - verified_through
+    observed = (
+        history[list(VARIABLES)]
+        .reindex(pd.date_range(day_string(first_new), periods=n_new, freq="D"))
+        .to_numpy(dtype=np.float64)
+    )
+    records = _latest_per_issue_day(archive.records(city, since_issue_day=first_new - HORIZON))
+
+    if len(records):
+        observed_masks = observed_event_masks(archive, city_dir, history, first_new, last_observed)
+        event_ids = archive.event_ids()
+        positions = records["issue_day"][:, None] + 1 + np.arange(HORIZON) - first_new     # (records, leads)
+        valid = (positions >= 0) & (positions < n_new)
+
+        pairs, error = np.array(state["pairs"]), np.array(state["error"])
+        abs_error, sq_error = np.array(state["abs_error"]), np.array(state["sq_error"])
+        for lead in range(HORIZON):
+            rows = np.nonzero(valid[:, lead])[0]
+            if not len(rows):
+                continue
+            at = positions[rows, lead]
+            diff = records["values"][rows, lead].astype(np.float64) - observed[at]
+            ok = ~np.isnan(diff)
+            pairs[lead] += ok.sum(axis=0)
+            error[lead] += np.where(ok, diff, 0).sum(axis=0)
+            abs_error[lead] += np.where(ok, np.abs(diff), 0).sum(axis=0)
+            sq_error[lead] += np.where(ok, diff ** 2, 0).sum(axis=0)
+
+            # only days that were observed count for the events
+            seen = ~np.isnan(observed[at]).all(axis=1)
+            forecast_masks = records["events"][rows, lead][seen]
+            observed_at = observed_masks[at][seen]
+            for bit, event_id in enumerate(event_ids):
+                word, shift = divmod(bit, 64)
+                f = ((forecast_masks[:, word] >> np.uint64(shift)) & np.uint64(1)).astype(bool)
+                o = ((observed_at[:, word] >> np.uint64(shift)) & np.uint64(1)).astype(bool)
+                if not (f.any() or o.any()):
+                    continue
+                counts = state["events"].setdefault(
+                    event_id, {key: [0] * HORIZON for key in ("hits", "false_alarms", "misses")}
+                )
+                counts["hits"][lead] += int((f & o).sum())
+                counts["false_alarms"][lead] += int((f & ~o).sum())
+                counts["misses"][lead] += int((~f & o).sum())
+
+        state.update(pairs=pairs.tolist(), error=error.tolist(),
+                     abs_error=abs_error.tolist(), sq_error=sq_error.tolist())
+
+    state["verified_through"] = day_string(last_observed)
+    archive.root.mkdir(parents=True, exist_ok=True)
+    _save_state(archive, city, state)
+    return state, n_new
+
+
+def _ratio(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else None
+
+
+def report(city, state):
+    """Skill scores of a verification state: per lead day and per event id."""
+    pairs = np.array(state["pairs"])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        bias = np.array(state["error"]) / pairs
+        mae = np.array(state["abs_error"]) / pairs
+        rmse = np.sqrt(np.array(state["sq_error"]) / pairs)
+
+    def clean(value):
+        return None if np.isnan(value) else round(float(value), 3)
+
+    leads = [
+        {
+            "lead_day": lead + 1,
+            "variables": {
+                var: {"n": int(pairs[lead, j]), "mae": clean(mae[lead, j]),
+                      "rmse": clean(rmse[lead, j]), "bias": clean(bias[lead, j])}
+                for j, var in enumerate(VARIABLES)
+            },
+        }
+        for lead in range(HORIZON)
+    ]
+    events = {}
+    for event_id, counts in sorted(state["events"].items()):
+        hits, false_alarms, misses = (sum(counts[k]) for k in ("hits", "false_alarms", "misses"))
+        events[event_id] = {
+            "hits": hits,
+            "false_alarms": false_alarms,
+            "misses": misses,
+            "hit_rate": _ratio(hits, hits + misses),
+            "false_alarm_ratio": _ratio(false_alarms, hits + false_alarms),
+            "by_lead": {key: counts[key] for key in ("hits", "false_alarms", "misses")},
+        }
+    return {"city": city, "verified_through": state["verified_through"], "leads": leads, "events": events}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify archived forecasts against new observations")
+    parser.add_argument("--cities", nargs="*", default=None, help="Default: every archived city")
+    parser.add_argument("--archive-dir", type=Path, default=Path(ARCHIVE_DIR))
+    parser.add_argument("--artifacts-dir", type=Path, default=ARTIFACTS_DIR)
+    args = parser.parse_args()
+
+    archive = ForecastArchive(args.archive_dir)
+    for city in args.cities or archive.cities():
+        state, n_new = verify_city(archive, city, args.artifacts_dir / city)
+        if state["verified_through"] is None:
+            print(f"[SKIP] {city}: no observed day after its archived forecasts yet")
+            continue
+        leads = report(city, state)["leads"]
+        t1 = leads[0]["variables"]["mean_temperature"]
+        print(
+            f"[OK] {city}: {n_new} new day(s), verified through {state['verified_through']}"
+            f" | mean_temperature MAE day 1 {t1['mae']} (n={t1['n']}),"
+            f" day {HORIZON} {leads[-1]['variables']['mean_temperature']['mae']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
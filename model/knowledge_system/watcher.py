@@ -0,0 +1,129 @@
+"""
+Data-arrival driven invalidation of cached forecasts.
+
+A forecast only depends on its city's input artifacts: model, scalers,
+weather.csv and manifest.json. input_version(path) hashes their signatures
+(shared_store.artifact_signature: mtime + size of each file), and cached
+forecasts are keyed by the version of the inputs they were computed from.
+They stay valid until the nightly producer rewrites weather.csv or a new
+model is promoted, instead of expiring every N seconds, and a request never
+gets a forecast of inputs that have since changed.
+
+ArtifactWatcher polls the input versions of the catalog's servable cities
+every ARTIFACT_WATCH_SEC seconds in a daemon thread and calls
+on_change(cities) for the cities whose inputs changed, so the server can
+recompute them before the next request. The ingestion job can also notify
+the server (POST /ingest/notify on the backend), which runs the same check
+right away for the cities it updated (notify_ingest). Polling only needs the
+standard library; one pass over a few hundred cities is a few thousand stat
+calls.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import urllib.request
+
+from knowledge_system import metrics
+
+logger = logging.getLogger(__name__)
+
+WATCH_INTERVAL_SECONDS = float(os.getenv("ARTIFACT_WATCH_SEC", "5"))
+
+INVALIDATIONS = metrics.counter(
+    "forecast_invalidations_total",
+    "Cities whose input artifacts changed, by how it was noticed (watch, notify)",
+    labelnames=("source",),
+)
+
+_UNSEEN = object()
+
+
+def input_version(artifact_path):
+    """Short hash of the signatures of a city's input files; None when one is missing."""
+    from knowledge_system.shared_store import artifact_signature
+
+    try:
+        signature = artifact_signature(artifact_path)
+    except FileNotFoundError:
+        return None
+    return hashlib.sha1(json.dumps(signature).encode()).hexdigest()[:16]
+
+
+class ArtifactWatcher:
+    """Reports the servable cities whose input_version changed (see the module docstring)."""
+
+    def __init__(self, catalog, on_change, interval=WATCH_INTERVAL_SECONDS):
+        self.catalog = catalog
+        self.on_change = on_change
+        self.interval = interval
+        self._versions = {}             # city -> last seen input_version
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def check(self, cities=None, source="watch"):
+        """
+        Re-read the input versions of `cities` (default: every servable city)
+        and hand the changed ones to on_change. A city seen for the first time
+        only records its version. Returns the changed cities.
+        """
+        servable = self.catalog.servable()
+        names = servable if cities is None else [name for name in cities if name in servable]
+        changed = []
+        with self._lock:
+            for name in names:
+                version = input_version(servable[name].path)
+                previous = self._versions.get(name, _UNSEEN)
+                self._versions[name] = version
+                if previous is not _UNSEEN and previous != version:
+                    changed.append(name)
+
+        if changed:
+            INVALIDATIONS.inc(len(changed), source=source)
+            logger.info("Inputs changed (%s): %s", source, ", ".join(changed))
+            self.on_change(changed)
+        return changed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Artifact watch pass failed")
+
+    def start(self):
+        """Record the current versions, then poll in a daemon thread (interval > 0)."""
+        if self._thread is not None:
+            return
+        self.check()
+        if self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="artifact-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def notify_ingest(url, cities, timeout=10):
+    """
+    POST the cities whose files an ingestion job rewrote to the backend's
+    /ingest/notify. Returns the response, or None when there is nothing to
+    send; raises OSError when the backend cannot be reached.
+    """
+    if not url or not cities:
+        return None
+    request = urllib.request.Request(
+        url,
+        data=json.dumps({"cities": list(cities)}).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
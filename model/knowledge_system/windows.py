@@ -0,0 +1,189 @@
+"""
+Zero-copy sliding windows for training, backtesting and batch inference.
+
+The notebook's build_sequences_multi_target appended one slice per window to
+Python lists and stacked them, copying every row ~(lookback + horizon)
+times. Here X and Y are strided views (numpy sliding_window_view) over one
+contiguous float32 array per side, so building them costs O(1) memory;
+rows are only copied when a batch is materialized.
+
+Window i uses the same convention as the notebook:
+    X[i] = features[i : i + lookback]                       (lookback, F)
+    Y[i] = targets[i + lookback : i + lookback + horizon]   (horizon, T)
+for i in range(len - lookback - horizon), i.e. the notebook's
+`for i in range(lookback, len(df) - horizon)` shifted to start at 0.
+
+Scalers can be fitted from the base arrays without materializing windows:
+each row is weighted by the number of windows it appears in, which gives
+exactly the statistics StandardScaler would compute on the stacked windows.
+
+Histories with gaps (NaN rows on a daily index, e.g. gaps longer than
+qc.MAX_GAP_DAYS) are not dropped first, which would splice the days on both
+sides into one window: `complete_windows` gives the starts of the windows
+that only cover complete rows, and the scalers and WindowDataset take them
+as `starts`.
+"""
+import numpy as np
+import torch
+from numpy.lib.stride_tricks import sliding_window_view
+from sklearn.preprocessing import StandardScaler
+from torch.utils.data import Dataset
+
+
+def n_windows(n_rows, lookback, horizon):
+    return max(0, n_rows - lookback - horizon)
+
+
+def as_float32(values):
+    return np.ascontiguousarray(values, dtype=np.float32)
+
+
+def input_windows(features, lookback):
+    """All lookback windows of `features` (rows, F) as a (rows - lookback + 1, lookback, F) view."""
+    return sliding_window_view(features, lookback, axis=0).swapaxes(1, 2)
+
+
+def window_views(features, targets, lookback, horizon):
+    """
+    Strided X (N, lookback, F) and Y (N, horizon, T) views over the base arrays.
+    Y flattened per window (Y[i].reshape(-1)) is the notebook's day-major target row.
+    """
+    n = n_windows(len(features), lookback, horizon)
+    X = input_windows(features, lookback)[:n]
+    Y = sliding_window_view(targets, horizon, axis=0).swapaxes(1, 2)[lookback:lookback + n]
+    return X, Y
+
+
+def complete_windows(complete, lookback, horizon):
+    """Start indices of the windows whose lookback + horizon rows are all `complete` (row mask)."""
+    complete = np.asarray(complete, dtype=bool)
+    n = n_windows(len(complete), lookback, horizon)
+    incomplete = np.concatenate(([0], np.cumsum(~complete)))
+    starts = np.arange(n)
+    return starts[incomplete[starts + lookback + horizon] == incomplete[starts]]
+
+
+def _starts(n_rows, lookback, horizon, starts):
+    return np.arange(n_windows(n_rows, lookback, horizon)) if starts is None else np.asarray(starts, dtype=np.int64)
+
+
+def _weighted_moments(values, weights):
+    # rows outside every window may be NaN: they must not reach the sums
+    values = np.where(weights[:, None] > 0, values, 0.0)
+    total = weights.sum()
+    mean = (weights[:, None] * values).sum(axis=0) / total
+    var = (weights[:, None] * (values - mean) ** 2).sum(axis=0) / total
+    return mean, var, total
+
+
+def _make_scaler(mean, var, n_samples):
+    scaler = StandardScaler()
+    scaler.mean_ = mean
+    scaler.var_ = var
+    scaler.scale_ = np.where(var > 0, np.sqrt(var), 1.0)
+    scaler.n_samples_seen_ = int(n_samples)
+    scaler.n_features_in_ = len(mean)
+    return scaler
+
+
+def fit_feature_scaler(features, lookback, horizon, starts=None):
+    """StandardScaler equal to fitting on X.reshape(-1, F) of all windows (or those at `starts`)."""
+    starts = _starts(len(features), lookback, horizon, starts)
+    # row r is in every window starting in r - lookback + 1 .. r
+    edges = np.zeros(len(features) + 1)
+    np.add.at(edges, starts, 1)
+    np.add.at(edges, starts + lookback, -1)
+    weights = np.cumsum(edges[:-1])
+    mean, var, total = _weighted_moments(np.asarray(features, dtype=np.float64), weights)
+    return _make_scaler(mean, var, total)
+
+
+def fit_target_scalers(targets, target_cols, lookback, horizon, starts=None):
+    """
+    Per-variable StandardScalers with the notebook layout: the scaler of
+    target_cols[i] covers columns i*horizon .. (i+1)*horizon of the flattened
+    day-major Y row. Column k of that row is target k % T of lead day k // T.
+    Fitted on all windows, or on those at `starts`.
+    """
+    targets = np.asarray(targets, dtype=np.float64)
+    n_targets = len(target_cols)
+    starts = _starts(len(targets), lookback, horizon, starts)
+    n = len(starts)
+
+    means, variances = np.empty(horizon * n_targets), np.empty(horizon * n_targets)
+    for k in range(horizon * n_targets):
+        day, t = divmod(k, n_targets)
+        column = targets[lookback + day + starts, t]
+        means[k], variances[k] = column.mean(), column.var()
+
+    scalers = {}
+    for i, var in enumerate(target_cols):
+        cols = slice(i * horizon, (i + 1) * horizon)
+        scalers[var] = _make_scaler(means[cols], variances[cols], n)
+    return scalers
+
+
+def target_affine(target_scalers, target_cols):
+    """(mean, scale) vectors over the flattened Y row for vectorized (un)scaling."""
+    mean = np.concatenate([target_scalers[v].mean_ for v in target_cols])
+    scale = np.concatenate([target_scalers[v].scale_ for v in target_cols])
+    return mean, scale
+
+
+class WindowDataset(Dataset):
+    """
+    Lazily materialized windows. Indexing with an int returns one sample,
+    indexing with a list/array of ints returns a whole batch with a single
+    gather, which is what `batch_loader` feeds it.
+
+    features: contiguous float32 (rows, F), already feature-scaled
+    targets:  float32 (rows, T) in physical units; scaled per batch with
+              (target_mean, target_scale) when given
+    starts:   only the windows starting at these rows (see complete_windows);
+              sample i is then window starts[i]
+    """
+
+    def __init__(self, features, targets, lookback, horizon, target_mean=None, target_scale=None, starts=None):
+        self.features = as_float32(features)
+        self.targets = as_float32(targets)
+        self.X, self.Y = window_views(self.features, self.targets, lookback, horizon)
+        self.starts = None if starts is None else np.asarray(starts, dtype=np.int64)
+        self.target_mean = None if target_mean is None else np.asarray(target_mean, dtype=np.float32)
+        self.target_scale = None if target_scale is None else np.asarray(target_scale, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.X) if self.starts is None else len(self.starts)
+
+    def _targets(self, Y):
+        Y = Y.reshape(len(Y), -1)
+        if self.target_mean is not None:
+            Y = (Y - self.target_mean) / self.target_scale
+        return Y
+
+    def __getitem__(self, idx):
+        if self.starts is not None:
+            idx = self.starts[idx]
+        if np.isscalar(idx):
+            X = np.array(self.X[idx])
+            Y = self._targets(self.Y[idx][None])[0]
+        else:
+            idx = np.asarray(idx)
+            X = self.X[idx]                      # fancy index = one batch copy
+            Y = self._targets(self.Y[idx])
+        return torch.from_numpy(np.ascontiguousarray(X)), torch.from_numpy(np.ascontiguousarray(Y, dtype=np.float32))
+
+    def materialize(self):
+        """All windows at once (only for small sets, e.g. a holdout)."""
+        return self[np.arange(len(self))]
+
+
+def batch_loader(dataset, batch_size, shuffle, generator=None):
+    """DataLoader that asks the dataset for whole batches of indices."""
+    from torch.utils.data import BatchSampler, DataLoader, RandomSampler, SequentialSampler
+
+    sampler = RandomSampler(dataset, generator=generator) if shuffle else SequentialSampler(dataset)
+    return DataLoader(
+        dataset,
+        batch_size=None,
+        sampler=BatchSampler(sampler, batch_size=batch_size, drop_last=False),
+    )
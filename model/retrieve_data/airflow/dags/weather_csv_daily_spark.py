@@ -17,3 +17,13 @@ with DAG(
         spark-submit /producer/weather_csv_updater_spark.py
         """
     )
+
+    # archived forecasts vs the days just observed (knowledge_system/verification.py)
+    verify_forecasts = BashOperator(
+        task_id="verify_forecasts",
+        bash_command="""
+        cd /opt/model && python -m knowledge_system.verification --archive-dir /data/_archive --artifacts-dir /data
+        """
+    )
+
+    run_spark_job >> verify_forecasts
@@ -1,10 +1,18 @@
 import argparse
 import json
+import os
+import sys
 import pandas as pd
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 from meteostat import Point, daily
 
+MODEL_DIR = Path(__file__).resolve().parent.parent
+if str(MODEL_DIR) not in sys.path:
+    sys.path.insert(0, str(MODEL_DIR))
+
+from knowledge_system.qc import qc_append, QC_COLUMN, QC_UNFILLED  # noqa: E402
+
 # PATHS
 LOCATIONS_PATH = "./locations.json"
 
@@ -45,23 +53,29 @@ def map_to_observation(row, date):
 
 # APPEND TO CSV (SAFE)
 def append_observation(row, data_path: Path):
-    df_new = pd.DataFrame([row])
-    df_new["date"] = pd.to_datetime(df_new["date"])
+    df_new = pd.DataFrame([row]).set_index("date")
+    df_new.index = pd.to_datetime(df_new.index)
+    df_new = df_new.astype(float)
 
+    df = None
     if data_path.exists():
-        df = pd.read_csv(data_path, parse_dates=["date"])
+        df = pd.read_csv(data_path, index_col=0, parse_dates=True)
 
-        if row["date"] in df["date"].values:
+        if df_new.index[0] in df.index:
             print(f"[INFO] Data for {row['date']} already exists. Skipping.")
             return
 
-        df = pd.concat([df, df_new], ignore_index=True)
-    else:
-        df = df_new
+    # QC + gap filling on the new day and the few days before it only
+    df = qc_append(df, df_new)
+
+    tmp = data_path.with_name(f".{data_path.name}.tmp")
+    df.to_csv(tmp)
+    os.replace(tmp, data_path)
 
-    df = df.sort_values("date")
-    df.to_csv(data_path, index=False)
-    print(f"[OK] Weather data for {row['date']} appended.")
+    flags = int(df[QC_COLUMN].iloc[-1])
+    if flags & QC_UNFILLED:
+        print(f"[WARN] {row['date']} still has missing values after QC (flags {flags}).")
+    print(f"[OK] Weather data for {row['date']} appended (qc_flags {flags}).")
 
 
 # MAIN (CLI)
@@ -85,7 +99,7 @@ def main():
 
     lat = locations[args.location]["LATITUDE"]
     lon = locations[args.location]["LONGITUDE"]
-    data_path = f"../knoweldge_system/artifacts/{args.location}"
+    data_path = MODEL_DIR / "knowledge_system" / "artifacts" / args.location / "weather.csv"
 
     meteo_row, date = fetch_yesterday_weather(lat, lon)
     obs = map_to_observation(meteo_row, date)
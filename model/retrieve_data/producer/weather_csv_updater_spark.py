@@ -1,4 +1,5 @@
-import json
+import os
+import sys
 from datetime import datetime, timedelta, timezone, date, time
 from pathlib import Path
 import pandas as pd
@@ -13,7 +14,18 @@ from pyspark.sql.functions import col, to_date, avg, max as spark_max, min as sp
 # --------------------
 LOCATIONS_PATH = "/locations.json"
 DATA_DIR = "/data"
-CITIES_TO_UPDATE = ["benimellal", "casablanca", "sale"]
+# backend POST /ingest/notify; empty: the backend's artifact watcher picks the files up
+NOTIFY_URL = os.environ.get("FORECAST_NOTIFY_URL", "")
+
+# folder containing knowledge_system/ (mounted read-only in docker-compose)
+MODEL_DIR = os.environ.get("WEATHER_MODEL_DIR", str(Path(__file__).resolve().parent.parent.parent))
+if MODEL_DIR not in sys.path:
+    sys.path.insert(0, MODEL_DIR)
+
+from knowledge_system.qc import qc_append, QC_COLUMN, QC_UNFILLED  # noqa: E402
+from knowledge_system.catalog import discover_cities  # noqa: E402
+from knowledge_system.streaming import derived_visibility  # noqa: E402
+from knowledge_system.watcher import notify_ingest  # noqa: E402
 
 # --------------------
 # SPARK SESSION
@@ -37,10 +49,6 @@ def to_datetime(d):
         return datetime.combine(d, time.min)
     raise ValueError(f"Unsupported date type: {type(d)}")
 
-def load_locations():
-    with open(LOCATIONS_PATH) as f:
-        return json.load(f)
-
 def get_last_date(csv_path: str) -> datetime:
     if not Path(csv_path).exists():
         return datetime(2024, 1, 1)
@@ -74,8 +82,7 @@ def fetch_hourly_to_spark(lat: float, lon: float, start: datetime, end: datetime
             safe_value(row.get("dwpt")),
             safe_value(row.get("prcp")),
             safe_value(row.get("wspd")) / 3.6 if safe_value(row.get("wspd")) is not None else None,  # km/h → m/s
-            float(max(min((safe_value(row.get("temp")) - safe_value(row.get("dwpt"))) * 1.5, 10), 0))
-            if safe_value(row.get("temp")) is not None and safe_value(row.get("dwpt")) is not None else None,
+            derived_visibility(safe_value(row.get("temp")), safe_value(row.get("dwpt"))),
         )
         for ts, row in pdf.iterrows()
     ]
@@ -95,19 +102,20 @@ def fetch_hourly_to_spark(lat: float, lon: float, start: datetime, end: datetime
 # UPDATE CITY
 # --------------------
 def update_city(city: str, coords: dict):
+    Path(f"{DATA_DIR}/{city}").mkdir(parents=True, exist_ok=True)
     csv_path = f"{DATA_DIR}/{city}/weather.csv"
     start = to_datetime(get_last_date(csv_path))
     end = to_datetime(datetime.now(timezone.utc).date() - timedelta(days=1))
 
     if start > end:
         print(f"[SKIP] {city} already up to date")
-        return
+        return False
 
     hourly_df = fetch_hourly_to_spark(coords["LATITUDE"], coords["LONGITUDE"], start, end)
 
     if hourly_df is None:
         print(f"[WARN] No hourly data for {city}")
-        return
+        return False
 
     # Convert UTC → Morocco time
     hourly_df = hourly_df.withColumn("ts_local", from_utc_timestamp(col("ts"), "Africa/Casablanca"))
@@ -132,30 +140,47 @@ def update_city(city: str, coords: dict):
     pdf_new["date"] = pd.to_datetime(pdf_new["date"])
     pdf_new.set_index("date", inplace=True)
 
-    # Merge with existing CSV
+    # Merge with existing CSV: QC + gap filling only on the new days (+ short context)
+    pdf_existing = None
     if Path(csv_path).exists():
         pdf_existing = pd.read_csv(csv_path, index_col=0, parse_dates=True)
-        pdf_final = pd.concat([pdf_existing, pdf_new])
-    else:
-        pdf_final = pdf_new
+    pdf_final = qc_append(pdf_existing, pdf_new)
 
-    pdf_final = pdf_final.sort_index()
-    pdf_final = pdf_final[~pdf_final.index.duplicated(keep="last")]
+    tmp_path = f"{DATA_DIR}/{city}/.weather.csv.tmp"
+    pdf_final.to_csv(tmp_path)
+    os.replace(tmp_path, csv_path)
 
-    pdf_final.to_csv(csv_path)
+    unfilled = int((pdf_final[QC_COLUMN].loc[pdf_new.index.min():] & QC_UNFILLED).astype(bool).sum())
+    if unfilled:
+        print(f"[WARN] {city}: {unfilled} new day(s) still have missing values after QC")
     print(f"[OK] {city} updated successfully")
+    return True
+
+
+def notify_forecast_api(cities):
+    """Tell the forecast API which cities have new data, so it recomputes them now."""
+    try:
+        response = notify_ingest(NOTIFY_URL, cities)
+        if response is not None:
+            print(f"[OK] Notified the forecast API: {response}")
+    except OSError as exc:
+        # not fatal: the API's watcher notices the new files on its next pass
+        print(f"[WARN] Could not notify the forecast API: {exc}")
 
 # --------------------
 # MAIN
 # --------------------
 def run():
-    locations = load_locations()
-    for city in CITIES_TO_UPDATE:
-        coords = locations.get(city)
-        if coords:
-            update_city(city, coords)
-        else:
-            print(f"[WARN] City {city} not found in locations.json")
+    # the serving catalog: artifact folders + locations.json stations (new
+    # stations start accumulating history before they have a model)
+    updated = []
+    for city in discover_cities(DATA_DIR, LOCATIONS_PATH).values():
+        if city.latitude is None:
+            print(f"[WARN] City {city.name} not found in locations.json")
+            continue
+        if update_city(city.name, {"LATITUDE": city.latitude, "LONGITUDE": city.longitude}):
+            updated.append(city.name)
+    notify_forecast_api(updated)
 
 if __name__ == "__main__":
     run()
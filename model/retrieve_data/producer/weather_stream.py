@@ -0,0 +1,143 @@
+"""
+Streaming mode of the weather.csv updater (knowledge_system/streaming.py).
+
+    publish   every --interval seconds, fetch the Meteostat hours each
+              station does not have yet and append them to the hourly queue
+    consume   aggregate the queue into running daily values, append every
+              closed day to <city>/weather.csv and keep <city>/intraday.json
+              up to date for nowcasting
+
+Both can run next to the nightly Spark job: days already written by one are
+skipped by the other. Usage (spark/airflow container):
+    python /producer/weather_stream.py publish --interval 600
+    python /producer/weather_stream.py consume
+"""
+import argparse
+import json
+import os
+import sys
+import time as time_module
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pandas as pd
+from meteostat import Hourly, Point
+
+# --------------------
+# PATHS & CONFIG
+# --------------------
+LOCATIONS_PATH = "/locations.json"
+DATA_DIR = "/data"
+QUEUE_PATH = os.environ.get("WEATHER_STREAM_PATH", f"{DATA_DIR}/_stream/hourly.jsonl")
+NOTIFY_URL = os.environ.get("FORECAST_NOTIFY_URL", "")
+
+MODEL_DIR = os.environ.get("WEATHER_MODEL_DIR", str(Path(__file__).resolve().parent.parent.parent))
+if MODEL_DIR not in sys.path:
+    sys.path.insert(0, MODEL_DIR)
+
+from knowledge_system.catalog import discover_cities  # noqa: E402
+from knowledge_system.streaming import FileQueue, StreamConsumer, hourly_observation  # noqa: E402
+from knowledge_system.watcher import notify_ingest  # noqa: E402
+
+
+def safe_value(x):
+    return None if pd.isna(x) else float(x)
+
+
+# --------------------
+# PUBLISH
+# --------------------
+def last_csv_day(csv_path):
+    """Last date of weather.csv (its last line), or None."""
+    try:
+        with open(csv_path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(f.tell() - 4096, 0))
+            last = f.read().splitlines()[-1].decode()
+        return datetime.strptime(last.split(",", 1)[0], "%Y-%m-%d")
+    except (FileNotFoundError, IndexError, ValueError):
+        return None
+
+
+def publish_new_hours(queue, cursors):
+    """Publish the hours after each station's cursor; returns the number published."""
+    now = datetime.now(timezone.utc).replace(tzinfo=None, minute=0, second=0, microsecond=0)
+    published = 0
+    for city in discover_cities(DATA_DIR, LOCATIONS_PATH).values():
+        if city.latitude is None:
+            continue
+        if city.name in cursors:
+            start = datetime.strptime(cursors[city.name], "%Y-%m-%dT%H:%M:%SZ") + timedelta(hours=1)
+        else:
+            # first run: from the day after the history (a day back if there is none)
+            last = last_csv_day(f"{DATA_DIR}/{city.name}/weather.csv")
+            start = last + timedelta(days=1) if last else now - timedelta(days=1)
+        if start > now:
+            continue
+
+        pdf = Hourly(Point(city.latitude, city.longitude), start, now).fetch()
+        if pdf.empty:
+            continue
+        messages = [
+            hourly_observation(
+                city.name,
+                ts.to_pydatetime(),
+                temp=safe_value(row.get("temp")),
+                dwpt=safe_value(row.get("dwpt")),
+                prcp=safe_value(row.get("prcp")),
+                wspd_kmh=safe_value(row.get("wspd")),
+            )
+            for ts, row in pdf.iterrows()
+        ]
+        queue.publish(messages)
+        cursors[city.name] = messages[-1]["ts"]
+        published += len(messages)
+        print(f"[OK] {city.name}: published {len(messages)} hour(s) up to {messages[-1]['ts']}")
+    return published
+
+
+def run_publisher(interval):
+    queue = FileQueue(QUEUE_PATH)
+    cursor_path = queue.path.with_name(f"{queue.path.name}.publisher.json")
+    cursors = json.loads(cursor_path.read_text()) if cursor_path.exists() else {}
+    while True:
+        if publish_new_hours(queue, cursors):
+            tmp = cursor_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(cursors))
+            os.replace(tmp, cursor_path)
+        time_module.sleep(interval)
+
+
+# --------------------
+# CONSUME
+# --------------------
+def on_finalized(cities):
+    print(f"[OK] Finalized new day(s) for {', '.join(cities)}")
+    try:
+        notify_ingest(NOTIFY_URL, cities)
+    except OSError as exc:
+        # not fatal: the API's watcher notices the new files on its next pass
+        print(f"[WARN] Could not notify the forecast API: {exc}")
+
+
+def run_consumer(interval):
+    consumer = StreamConsumer(FileQueue(QUEUE_PATH), DATA_DIR, on_finalized=on_finalized)
+    print(f"[OK] Consuming {QUEUE_PATH} from offset {consumer.offset}")
+    consumer.run(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming hourly ingestion")
+    parser.add_argument("mode", choices=("publish", "consume"))
+    parser.add_argument("--interval", type=float, default=None,
+                        help="Seconds between polls (publish: 600, consume: 5)")
+    args = parser.parse_args()
+
+    if args.mode == "publish":
+        run_publisher(args.interval or 600)
+    else:
+        run_consumer(args.interval or 5)
+
+
+if __name__ == "__main__":
+    main()